@@ -0,0 +1,195 @@
+import logging
+import sys
+
+import pandas as pd
+import numpy as np
+
+import storage
+from calculate_iq_metrics import DataContext, save_iq_metrics
+from instrumentation import instrumentation, run_report
+from metric_registry import METRICS
+from seasons import DEFAULT_SEASON
+
+logger = logging.getLogger(__name__)
+
+BASE_COLUMNS = ['PLAYER_ID', 'PLAYER_NAME', 'TEAM_ID', 'POSITION', 'GP', 'MIN']
+
+METRIC_COLUMNS = list(METRICS)
+
+TRACKING_FILES = {
+    'general_splits': 'general_splits',
+    'closest_defender': 'ClosestDefenderShooting',
+    'dribble_shooting': 'DribbleShooting'
+}
+
+# columns the metrics read from each tracking endpoint (projected when reading the store)
+TRACKING_COLUMNS = {
+    'general_splits': ['PLAYER_ID', 'GP'],
+    'closest_defender': ['PLAYER_ID', 'FGA'],
+    'dribble_shooting': ['PLAYER_ID', 'GP', 'SHOT_CLOCK_RANGE', 'FG_PCT', 'FGA', 'FGA_FREQUENCY']
+}
+
+def load_tracking_frames(context, player_ids, keys=TRACKING_FILES):
+    """ the given tracking endpoints as long frames keyed by PLAYER_ID, from the store or per-player CSVs """
+    tracking = {}
+    for key in keys:
+        endpoint = TRACKING_FILES[key]
+        if context.uses_store(endpoint):
+            # one projected, filtered scan instead of a file per player
+            tracking[key] = storage.load_endpoint(endpoint, context.season, player_ids=player_ids,
+                                                  columns=TRACKING_COLUMNS[key], store_dir=context.store_dir)
+            continue
+
+        frames = {}
+        for player_id in player_ids:
+            try:
+                frames[player_id] = pd.read_csv(f'{context.raw_dir}/{player_id}_{endpoint}.csv')
+            except Exception:
+                continue
+
+        if frames:
+            df = pd.concat(frames, names=['PLAYER_ID', 'ROW'])
+            df = df.drop(columns='PLAYER_ID', errors='ignore').reset_index()
+        else:
+            df = pd.DataFrame(columns=['PLAYER_ID', 'ROW'])
+        tracking[key] = df
+    return tracking
+
+def lookup(table, keys, column):
+    """ keyed join of one column; missing keys or a missing table give NaN """
+    if table is None or column not in table.columns:
+        return pd.Series(np.nan, index=keys.index)
+    return pd.Series(table[column].reindex(keys.values).values, index=keys.index)
+
+def add_bbref_basic(context, wide, tracking):
+    bbref_basic = context.bbref['basic_stats_36']
+    wide['BBREF_PF'] = lookup(bbref_basic, wide['BBREF_ID'], 'PF')
+    wide['BBREF_AGE'] = lookup(bbref_basic, wide['BBREF_ID'], 'Age')
+    wide['BBREF_MP'] = lookup(bbref_basic, wide['BBREF_ID'], 'MP')
+
+def add_bbref_advanced(context, wide, tracking):
+    wide['BBREF_AST_PCT'] = lookup(context.bbref['advanced_stats'], wide['BBREF_ID'], 'AST%')
+
+def add_bbref_shooting_fouls(context, wide, tracking):
+    wide['BBREF_SHOOTING_FOULS'] = lookup(context.bbref['shooting_fouls'], wide['BBREF_ID'], 'Shoot')
+
+def add_hustle(context, wide, tracking):
+    hustle = context.league['hustle_stats']
+    wide['DEFLECTIONS'] = lookup(hustle, wide['PLAYER_ID'], 'DEFLECTIONS')
+    wide['SCREEN_ASSISTS'] = lookup(hustle, wide['PLAYER_ID'], 'SCREEN_ASSISTS')
+    wide['HUSTLE_G'] = lookup(hustle, wide['PLAYER_ID'], 'G')
+
+def add_clutch(context, wide, tracking):
+    ids = wide['PLAYER_ID']
+    clutch = context.league['clutch_stats']
+    wide['HAS_CLUTCH'] = ids.isin(clutch.index) if clutch is not None else False
+    wide['CLUTCH_AST'] = lookup(clutch, ids, 'AST')
+    wide['CLUTCH_TOV'] = lookup(clutch, ids, 'TOV')
+    wide['CLUTCH_GP'] = lookup(clutch, ids, 'GP')
+
+def add_general_splits(context, wide, tracking):
+    ids = wide['PLAYER_ID']
+    splits = tracking['general_splits']
+    splits_gp = splits.drop_duplicates('PLAYER_ID').set_index('PLAYER_ID').get('GP')
+    wide['SPLITS_GP'] = splits_gp.reindex(ids.values).values if splits_gp is not None else np.nan
+    wide['HAS_SPLITS'] = ids.isin(splits['PLAYER_ID'])
+
+def add_closest_defender(context, wide, tracking):
+    ids = wide['PLAYER_ID']
+    defender = tracking['closest_defender']
+    if 'FGA' in defender.columns:
+        defended = defender.groupby('PLAYER_ID')['FGA'].sum()
+        wide['SHOTS_DEFENDED'] = defended.reindex(ids.values).values
+    else:
+        wide['SHOTS_DEFENDED'] = np.nan
+    wide['HAS_DEFENDER'] = ids.isin(defender['PLAYER_ID'])
+
+def add_dribble_shooting(context, wide, tracking):
+    ids = wide['PLAYER_ID']
+    shot_clock = tracking['dribble_shooting']
+    for label, prefix in [('7-4 Late', 'LATE'), ('4-0 Very Late', 'VERY_LATE')]:
+        if 'SHOT_CLOCK_RANGE' in shot_clock.columns:
+            rows = shot_clock[shot_clock['SHOT_CLOCK_RANGE'] == label].drop_duplicates('PLAYER_ID').set_index('PLAYER_ID')
+        else:
+            rows = None
+        wide[f'{prefix}_FG_PCT'] = lookup(rows, ids, 'FG_PCT')
+        wide[f'{prefix}_FREQ'] = lookup(rows, ids, 'FGA_FREQUENCY')
+        wide[f'{prefix}_FGA'] = lookup(rows, ids, 'FGA')
+        wide[f'{prefix}_GP'] = lookup(rows, ids, 'GP')
+        wide[f'HAS_{prefix}'] = ids.isin(rows.index) if rows is not None else False
+
+# metric input -> function adding that input's columns to the wide frame.
+# basic_stats needs nothing: every top300 column is already there
+FRAME_BUILDERS = {
+    'basic_stats': None,
+    'bbref.basic_stats_36': add_bbref_basic,
+    'bbref.advanced_stats': add_bbref_advanced,
+    'bbref.shooting_fouls': add_bbref_shooting_fouls,
+    'hustle_stats': add_hustle,
+    'clutch_stats': add_clutch,
+    'general_splits': add_general_splits,
+    'closest_defender': add_closest_defender,
+    'dribble_shooting': add_dribble_shooting
+}
+
+def metric_inputs(metrics):
+    """ the inputs the given metrics declare, in first-use order """
+    return list(dict.fromkeys(input for metric in metrics for input in METRICS[metric].inputs))
+
+def build_player_frame(context, metrics=None):
+    """
+    one wide row per player with every raw input the given metrics (default
+    all registered) need; inputs no metric reads are never loaded
+    """
+    inputs = metric_inputs(METRICS if metrics is None else metrics)
+    wide = context.top300.copy()
+
+    # bbref tables are joined on the player index's bbref id; position comes from bbref
+    wide['BBREF_ID'] = wide['PLAYER_ID'].map(context.bbref_ids)
+    bbref_basic = context.bbref['basic_stats_36']
+    ids = wide['BBREF_ID']
+    known = ids.isin(bbref_basic.index) if bbref_basic is not None else pd.Series(False, index=ids.index)
+    wide['POSITION'] = lookup(bbref_basic, ids, 'Pos').where(known, 'Unknown')
+
+    # per-player tracking files, one long frame per endpoint
+    tracking = load_tracking_frames(context, wide['PLAYER_ID'].unique(), [key for key in inputs if key in TRACKING_FILES])
+
+    for key in inputs:
+        if FRAME_BUILDERS[key] is not None:
+            FRAME_BUILDERS[key](context, wide, tracking)
+
+    return wide
+
+def compute_metrics(wide, metrics=None):
+    """ the given metrics (default all registered) as column expressions over the wide player frame """
+    metrics = list(METRICS) if metrics is None else metrics
+    df = wide[BASE_COLUMNS].copy()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for metric in metrics:
+            df[metric] = METRICS[metric].compute(wide)
+
+    return df[BASE_COLUMNS + metrics]
+
+def process_all_players_batch(context=None):
+    """process every registered iq metric for all players in one vectorized pass"""
+    if context is None:
+        context = DataContext()
+
+    logger.info(f"\nprocessing {len(context.top300)} players (batch)")
+
+    with instrumentation.timer('batch.build_player_frame'):
+        wide = build_player_frame(context)
+    with instrumentation.timer('batch.compute_metrics'):
+        df = compute_metrics(wide)
+    for metric in METRIC_COLUMNS:
+        instrumentation.count(f'metric.{metric}.nan', int(df[metric].isna().sum()))
+
+    save_iq_metrics(df, context.paths.metrics_csv)
+
+    return df
+
+if __name__ == "__main__":
+    season = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SEASON
+    with run_report('batch_metrics'):
+        results = process_all_players_batch(DataContext(season=season))
@@ -0,0 +1,192 @@
+"""
+per-stage pipeline benchmark: wall time, peak RSS and file opens for each
+stage on the checked-in data and synthetic scaled-up copies, compared with a
+stored baseline.
+
+a small runner of its own rather than pytest-benchmark or asv: every stage is
+measured in a fresh process (neither tool isolates RSS or counts file opens
+per stage), and it needs nothing beyond the pipeline's own dependencies
+"""
+import contextlib
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from batch_metrics import build_player_frame, compute_metrics
+from benchmark_population import build_synthetic_population
+from calculate_iq_composite import calculate_weighted_iq_rankings
+from calculate_iq_metrics import DataContext, calculate_all_metrics_for_player, load_player_data, save_iq_metrics
+from seasons import DEFAULT_SEASON, SeasonPaths
+
+BASELINE_PATH = 'data/benchmark_baseline.json'
+
+# a stage regresses when it is this much slower / bigger than the baseline,
+# and by more than the noise floor
+TIME_TOLERANCE = 0.30
+TIME_FLOOR = 0.05
+MEMORY_TOLERANCE = 0.20
+MEMORY_FLOOR = 10
+
+SYNTHETIC_SIZES = [3000]
+
+# stage -> setup(data_dir) returning the state run(state) works on. only run is timed
+def setup_context(data_dir):
+    return data_dir
+
+def run_context(data_dir):
+    DataContext(data_dir)
+
+def setup_players(data_dir):
+    context = DataContext(data_dir)
+    return context, context.top300['PLAYER_ID'].tolist()
+
+def run_load_player_data(state):
+    context, player_ids = state
+    for player_id in player_ids:
+        load_player_data(player_id, context)
+
+def run_per_player_metrics(state):
+    context, player_ids = state
+    for player_id in player_ids:
+        calculate_all_metrics_for_player(player_id, context)
+
+def run_batch_metrics(context):
+    save_iq_metrics(compute_metrics(build_player_frame(context)), context.paths.metrics_csv)
+
+def run_composite(data_dir):
+    calculate_weighted_iq_rankings(DEFAULT_SEASON, data_dir)
+
+STAGES = {
+    'context': (setup_context, run_context),
+    'load_player_data': (setup_players, run_load_player_data),
+    'per_player_metrics': (setup_players, run_per_player_metrics),
+    'batch_metrics': (DataContext, run_batch_metrics),
+    'composite': (setup_context, run_composite)
+}
+
+# counts every file opened through python (open, os.open, pandas readers),
+# but not files pyarrow opens natively
+file_opens = {'counting': False, 'count': 0}
+
+def count_opens(event, args):
+    if event == 'open' and file_opens['counting']:
+        file_opens['count'] += 1
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure_stage(stage, data_dir, repeats=5):
+    """ best-of-repeats wall time, file opens and memory for one stage; runs in a fresh process """
+    sys.addaudithook(count_opens)
+    # progress logging would only add noise (and time) to the measurement
+    logging.disable(logging.CRITICAL)
+    setup, run = STAGES[stage]
+    timings = []
+    rss_start = peak_rss_mb()
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for repeat in range(repeats):
+            state = setup(data_dir)
+            file_opens['counting'] = repeat == 0
+            start = time.perf_counter()
+            run(state)
+            timings.append(time.perf_counter() - start)
+            file_opens['counting'] = False
+
+    return {
+        'wall_s': min(timings),
+        'wall_mean_s': sum(timings) / len(timings),
+        'file_opens': file_opens['count'],
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_growth_mb': peak_rss_mb() - rss_start
+    }
+
+def fixture_data_dir():
+    """
+    a scratch data dir over the checked-in data: raw files are linked, processed
+    files copied, so stages that write outputs never touch data/
+    """
+    paths = SeasonPaths(DEFAULT_SEASON)
+    data_dir = tempfile.mkdtemp(prefix='nba_iq_bench_fixtures_')
+    os.symlink(os.path.abspath(paths.raw_dir), f'{data_dir}/raw')
+    shutil.copytree(paths.processed_dir, f'{data_dir}/processed')
+    shutil.copy(paths.players_csv, f'{data_dir}/top300_per.csv')
+    if os.path.isdir(paths.store_dir):
+        os.symlink(os.path.abspath(paths.store_dir), f'{data_dir}/store')
+    return data_dir
+
+def run_suite(synthetic_sizes=SYNTHETIC_SIZES, repeats=5, stages=None):
+    """ {dataset/stage: measurements} over the checked-in data and synthetic scaled-up copies """
+    stages = stages or list(STAGES)
+    datasets = {'fixtures': fixture_data_dir()}
+    for n_players in synthetic_sizes:
+        data_dir = tempfile.mkdtemp(prefix=f'nba_iq_bench_{n_players}_')
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            build_synthetic_population(n_players, data_dir)
+        datasets[f'synthetic_{n_players}'] = data_dir
+
+    results = {}
+    try:
+        for dataset, data_dir in datasets.items():
+            for stage in stages:
+                # one process per stage so memory and open counts start clean
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    results[f'{dataset}/{stage}'] = pool.submit(measure_stage, stage, data_dir, repeats).result()
+                print(f"{dataset}/{stage}: {results[f'{dataset}/{stage}']['wall_s']:.3f}s")
+    finally:
+        for data_dir in datasets.values():
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+def find_regressions(results, baseline):
+    """ (key, description) for every stage slower, bigger or opening more files than its baseline """
+    regressions = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if current['wall_s'] > base['wall_s'] * (1 + TIME_TOLERANCE) and current['wall_s'] - base['wall_s'] > TIME_FLOOR:
+            regressions.append((key, f"wall time {base['wall_s']:.3f}s -> {current['wall_s']:.3f}s"))
+        if (current['rss_growth_mb'] > base['rss_growth_mb'] * (1 + MEMORY_TOLERANCE)
+                and current['rss_growth_mb'] - base['rss_growth_mb'] > MEMORY_FLOOR):
+            regressions.append((key, f"memory growth {base['rss_growth_mb']:.0f}MB -> {current['rss_growth_mb']:.0f}MB"))
+        if current['file_opens'] > base['file_opens']:
+            regressions.append((key, f"file opens {base['file_opens']} -> {current['file_opens']}"))
+    return regressions
+
+def print_report(results, baseline=None):
+    print(f"\n{'stage':<40}{'wall s':>10}{'mean s':>10}{'opens':>8}{'rss +MB':>10}{'vs base':>10}")
+    for key, row in results.items():
+        base = (baseline or {}).get(key)
+        change = f"{row['wall_s'] / base['wall_s']:.2f}x" if base and base['wall_s'] > 0 else '-'
+        print(f"{key:<40}{row['wall_s']:>10.3f}{row['wall_mean_s']:>10.3f}{row['file_opens']:>8}"
+              f"{row['rss_growth_mb']:>10.1f}{change:>10}")
+
+if __name__ == "__main__":
+    # python benchmark_pipeline.py [--save-baseline]
+    results = run_suite()
+
+    baseline = None
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if '--save-baseline' in sys.argv:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nsaved baseline to {BASELINE_PATH}")
+    elif baseline is not None:
+        regressions = find_regressions(results, baseline)
+        for key, description in regressions:
+            print(f"REGRESSION {key}: {description}")
+        if regressions:
+            sys.exit(1)
+        print("\nno regressions against the baseline.")
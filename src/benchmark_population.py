@@ -0,0 +1,141 @@
+import glob
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import storage
+from batch_metrics import build_player_frame, compute_metrics
+from calculate_iq_composite import calculate_weighted_iq_rankings
+from calculate_iq_metrics import (BBREF_FILES, LEAGUE_FILES, PLAYER_FILES, DataContext, calculate_all_metrics_for_player,
+                                  metric_inputs, save_iq_metrics)
+from player_index import BBREF_ID_COLUMNS
+from seasons import DEFAULT_SEASON, SeasonPaths
+
+# every raw endpoint some metric declares as an input
+PLAYER_ENDPOINTS = [PLAYER_FILES[key] for key in metric_inputs() if key in PLAYER_FILES]
+
+# synthetic copies of a player get ids offset by multiples of this
+ID_OFFSET = 10_000_000
+
+SIZES = [300, 600, 6000]
+
+def load_player_rows(context, endpoint):
+    """ one endpoint for every player in the context, as one frame with PLAYER_ID """
+    if context.uses_store(endpoint):
+        return storage.load_endpoint(endpoint, context.season, store_dir=context.store_dir)
+    frames = {}
+    for path in glob.glob(f'{context.raw_dir}/*_{endpoint}.csv'):
+        player_id = int(os.path.basename(path).split('_', 1)[0])
+        try:
+            frames[player_id] = pd.read_csv(path)
+        except pd.errors.EmptyDataError:
+            continue
+    df = pd.concat(frames, names=['PLAYER_ID', 'ROW'])
+    return df.drop(columns='PLAYER_ID', errors='ignore').reset_index().drop(columns='ROW')
+
+def replicate(df, copies, id_column=None, name_columns=()):
+    """ stack copies of df; copy k gets ids + k * ID_OFFSET and names (and string ids) suffixed ' (k)' """
+    frames = []
+    for k in range(copies):
+        copy = df.copy()
+        if id_column is not None:
+            copy[id_column] = copy[id_column] + k * ID_OFFSET
+        for name_column in name_columns:
+            if name_column in copy.columns and k > 0:
+                copy[name_column] = copy[name_column] + f' ({k})'
+        frames.append(copy)
+    return pd.concat(frames, ignore_index=True)
+
+def build_synthetic_population(n_players, data_dir, source=None):
+    """
+    a data_dir holding n_players synthetic players, made by replicating the
+    real season under new ids and names so every join still matches
+    """
+    source = source or DataContext()
+    paths = SeasonPaths(DEFAULT_SEASON, data_dir).ensure_dirs()
+    copies = -(-n_players // len(source.top300))
+
+    players = replicate(source.top300, copies, 'PLAYER_ID', ['PLAYER_NAME']).head(n_players)
+    players.to_csv(paths.players_csv, index=False)
+
+    for filename in BBREF_FILES.values():
+        df = pd.read_csv(source.paths.bbref_file(filename))
+        replicate(df, copies, name_columns=['Player'] + BBREF_ID_COLUMNS).to_csv(paths.bbref_file(filename), index=False)
+
+    tables = {filename[:-len('.csv')]: source.read_raw_table(filename[:-len('.csv')]) for filename in LEAGUE_FILES.values()}
+    tables.update({endpoint: load_player_rows(source, endpoint) for endpoint in PLAYER_ENDPOINTS})
+    for name, df in tables.items():
+        df = replicate(df, copies, 'PLAYER_ID')
+        if storage.pa is not None:
+            storage.write_frame(name, DEFAULT_SEASON, df, paths.store_dir)
+        elif name.startswith('league_'):
+            df.to_csv(paths.raw_file(name), index=False)
+        else:
+            for player_id, rows in df.groupby('PLAYER_ID'):
+                rows.drop(columns='PLAYER_ID').to_csv(paths.raw_file(name, player_id), index=False)
+    return paths
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_benchmark(n_players, data_dir, per_player=False):
+    """ time each stage on a prepared population; meant to run in a fresh process """
+    rss_before = peak_rss_mb()
+    timings = {}
+
+    start = time.perf_counter()
+    context = DataContext(data_dir)
+    timings['load'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    metrics = compute_metrics(build_player_frame(context))
+    timings['batch_metrics'] = time.perf_counter() - start
+    save_iq_metrics(metrics, context.paths.metrics_csv)
+
+    start = time.perf_counter()
+    calculate_weighted_iq_rankings(DEFAULT_SEASON, data_dir)
+    timings['composite'] = time.perf_counter() - start
+
+    if per_player:
+        start = time.perf_counter()
+        for player_id in context.top300['PLAYER_ID']:
+            calculate_all_metrics_for_player(player_id, context)
+        timings['per_player_metrics'] = time.perf_counter() - start
+
+    peak = peak_rss_mb()
+    return {'players': n_players, **timings, 'rss_before_mb': rss_before, 'peak_rss_mb': peak,
+            'rss_growth_mb': peak - rss_before}
+
+def run_benchmarks(sizes=SIZES, per_player=False):
+    """
+    per size, the synthetic population is built in one worker process and
+    measured in another, so peak RSS covers the pipeline only: not the
+    replication step, and nothing carried over between sizes
+    """
+    results = []
+    for n_players in sizes:
+        data_dir = tempfile.mkdtemp(prefix=f'nba_iq_bench_{n_players}_')
+        try:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                pool.submit(build_synthetic_population, n_players, data_dir).result()
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                results.append(pool.submit(run_benchmark, n_players, data_dir, per_player).result())
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = pd.DataFrame(results).set_index('players')
+    print("\n=== population benchmark (seconds, MB) ===")
+    print(report.round(2).to_string())
+    return report
+
+if __name__ == "__main__":
+    # python benchmark_population.py [--per-player] [sizes...]
+    args = [arg for arg in sys.argv[1:] if arg != '--per-player']
+    run_benchmarks([int(arg) for arg in args] or SIZES, per_player='--per-player' in sys.argv)
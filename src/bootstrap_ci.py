@@ -0,0 +1,183 @@
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from batch_metrics import build_player_frame
+from calculate_iq_composite import WEIGHTS, rank_percentiles
+from calculate_iq_metrics import DataContext
+from instrumentation import instrumentation, run_report
+from metric_registry import METRICS
+from seasons import DEFAULT_SEASON, SeasonPaths
+from weight_sweep import rank_columns, rescale
+
+REPLICATES = 2000
+
+# replicates per worker task: big enough to vectorize well, small enough that
+# the stacked (players x replicates) frame stays around 50MB
+CHUNK_SIZE = 200
+
+# lower and upper quantiles of the reported bands (a 95% interval)
+INTERVAL = (0.025, 0.975)
+
+logger = logging.getLogger(__name__)
+
+def poisson_rate(rng, per_game, games):
+    """
+    a per-game (or per-minute) average redrawn as if its season total were
+    poisson: round(per_game * games) ~ Poisson, divided back by games.
+    missing values and zero exposure keep the observed value
+    """
+    per_game = np.asarray(per_game, dtype=float)
+    games = np.asarray(games, dtype=float)
+    known = np.isfinite(per_game) & np.isfinite(games) & (games > 0)
+    totals = np.where(known, np.round(per_game * games), 0)
+    draws = rng.poisson(np.maximum(totals, 0)) / np.where(known, games, 1)
+    return np.where(known, draws, per_game)
+
+def binomial_rate(rng, pct, attempts):
+    """ a make rate redrawn as Binomial(round(attempts), pct) / attempts """
+    pct = np.asarray(pct, dtype=float)
+    attempts = np.round(np.asarray(attempts, dtype=float))
+    known = np.isfinite(pct) & np.isfinite(attempts) & (attempts > 0)
+    n = np.where(known, attempts, 0).astype(np.int64)
+    made = rng.binomial(n, np.clip(np.where(known, pct, 0), 0, 1))
+    return np.where(known, made / np.maximum(n, 1), pct)
+
+def resample_shooting(rng, wide):
+    # twos and threes are drawn separately so efg keeps its 3pt bonus
+    gp = wide['GP']
+    fg3_pct = wide['FG3M'] / wide['FG3A']
+    fg2_pct = (wide['FGM'] - wide['FG3M']) / (wide['FGA'] - wide['FG3A'])
+    fg3m = binomial_rate(rng, fg3_pct, wide['FG3A'] * gp) * wide['FG3A']
+    fg2m = binomial_rate(rng, fg2_pct, (wide['FGA'] - wide['FG3A']) * gp) * (wide['FGA'] - wide['FG3A'])
+    fg3m = np.where(np.isfinite(fg3m), fg3m, wide['FG3M'])
+    fg2m = np.where(np.isfinite(fg2m), fg2m, wide['FGM'] - wide['FG3M'])
+    wide['FG3M'] = fg3m
+    wide['FGM'] = fg2m + fg3m
+
+def resample_late_clock(rng, wide):
+    for prefix in ['LATE', 'VERY_LATE']:
+        attempts = wide[f'{prefix}_FGA'] * wide[f'{prefix}_GP']
+        wide[f'{prefix}_FG_PCT'] = binomial_rate(rng, wide[f'{prefix}_FG_PCT'], attempts)
+
+def resample_counts(rng, wide):
+    for column, games in [('AST', 'GP'), ('TOV', 'GP'),
+                          ('CLUTCH_AST', 'CLUTCH_GP'), ('CLUTCH_TOV', 'CLUTCH_GP'),
+                          ('DEFLECTIONS', 'HUSTLE_G'), ('SCREEN_ASSISTS', 'HUSTLE_G')]:
+        wide[column] = poisson_rate(rng, wide[column], wide[games])
+    # shooting fouls are a season total; personal fouls are per 36 minutes
+    wide['BBREF_SHOOTING_FOULS'] = poisson_rate(rng, wide['BBREF_SHOOTING_FOULS'], 1)
+    wide['BBREF_PF'] = poisson_rate(rng, wide['BBREF_PF'], wide['BBREF_MP'] / 36)
+
+# how each replicate redraws the wide frame. only per-game counts and shot
+# makes are resampled: player logs aren't fetched, so season aggregates and
+# their game/attempt counts stand in for them. age, assist % and contest
+# counts are held fixed, as are any columns only plugin metrics read
+RESAMPLERS = [resample_counts, resample_shooting, resample_late_clock]
+
+def replicate_scores(wide, replicates, seed):
+    """
+    (players x replicates) composite scores: the wide frame is stacked
+    replicates times, redrawn, and every metric, percentile and composite is
+    computed once over the stack, with each replicate as its own ranking group
+    """
+    rng = np.random.default_rng(seed)
+    n = len(wide)
+    stacked = wide.iloc[np.tile(np.arange(n), replicates)].reset_index(drop=True)
+    for resample in RESAMPLERS:
+        resample(rng, stacked)
+
+    replicate = np.repeat(np.arange(replicates), n)
+    positions = pd.factorize(wide['POSITION'])[0]
+    n_positions = positions.max() + 1
+    position_groups = np.where(positions >= 0, positions, np.nan)
+    by_position = np.repeat(np.arange(replicates), n) * n_positions + np.tile(position_groups, replicates)
+
+    unscaled = np.zeros(n * replicates)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for column, weight in WEIGHTS.items():
+            metric = METRICS[column[:-len('_percentile')]]
+            # ranked at the 3 decimals the metrics csv stores, like the published composite
+            values = np.round(np.asarray(metric.compute(stacked), dtype=float), 3)
+            if metric.by_position:
+                percentiles = rank_percentiles(values, groups=by_position,
+                                               invert=not metric.higher_is_better, min_group_size=2)
+            else:
+                percentiles = rank_percentiles(values, groups=replicate, invert=not metric.higher_is_better)
+            # same rounding and fill as the published composite
+            unscaled += np.nan_to_num(np.round(percentiles, 1), nan=50.0) * weight
+
+    return rescale(unscaled.reshape(replicates, n).T)
+
+def bootstrap_scores(wide, replicates=REPLICATES, seed=0, max_workers=None, chunk_size=CHUNK_SIZE):
+    """
+    (players x replicates) bootstrap composites, chunk_size replicates per
+    task across a process pool. each chunk gets its own child seed, so results
+    depend on seed and chunk_size but not on the number of workers
+    """
+    chunks = [min(chunk_size, replicates - start) for start in range(0, replicates, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    # trimmed to what the metrics can read, it's cheap to send to every worker
+    wide = wide.drop(columns=[column for column in wide.columns if column.endswith('_RANK')])
+
+    if max_workers == 1:
+        return np.hstack([replicate_scores(wide, size, child) for size, child in zip(chunks, seeds)])
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        return np.hstack(list(pool.map(replicate_scores, [wide] * len(chunks), chunks, seeds)))
+
+def confidence_bands(players, scores, interval=INTERVAL):
+    """
+    per player: median and interval of their composite and rank across
+    replicates. per rank: the same band for the score of whoever holds it
+    """
+    ranks, _ = rank_columns(scores)
+    low, high = interval
+
+    per_player = players.assign(
+        iq_median=np.median(scores, axis=1),
+        iq_low=np.quantile(scores, low, axis=1),
+        iq_high=np.quantile(scores, high, axis=1),
+        rank_median=np.median(ranks, axis=1),
+        rank_low=np.quantile(ranks, low, axis=1, method='lower'),
+        rank_high=np.quantile(ranks, high, axis=1, method='higher')
+    ).round(1)
+
+    by_rank = -np.sort(-scores, axis=0)
+    per_rank = pd.DataFrame({
+        'rank': np.arange(1, len(scores) + 1),
+        'iq_median': np.median(by_rank, axis=1),
+        'iq_low': np.quantile(by_rank, low, axis=1),
+        'iq_high': np.quantile(by_rank, high, axis=1)
+    }).round(1)
+    return per_player, per_rank
+
+def bootstrap_rankings(season=DEFAULT_SEASON, data_dir='data', replicates=REPLICATES, seed=0, max_workers=None):
+    """ bootstrap bands for one season's composite, saved next to its rankings """
+    paths = SeasonPaths(season, data_dir)
+    with instrumentation.timer('bootstrap.build_player_frame'):
+        wide = build_player_frame(DataContext(data_dir, season))
+    with instrumentation.timer('bootstrap.replicates'):
+        scores = bootstrap_scores(wide, replicates, seed, max_workers)
+
+    rankings = pd.read_csv(paths.rankings_csv)[['PLAYER_ID', 'PLAYER_NAME', 'POSITION', 'composite_weighted_iq', 'rank_weighted_iq']]
+    players = wide[['PLAYER_ID']].merge(rankings, on='PLAYER_ID', how='left')
+    per_player, per_rank = confidence_bands(players, scores)
+    per_player = per_player.sort_values('rank_weighted_iq')
+
+    per_player.to_csv(f'{paths.processed_dir}/bootstrap_player_ci.csv', index=False)
+    per_rank.to_csv(f'{paths.processed_dir}/bootstrap_rank_bands.csv', index=False)
+    logger.info(f"{replicates} bootstrap replicates saved to {paths.processed_dir}/bootstrap_player_ci.csv "
+                f"and bootstrap_rank_bands.csv")
+    return per_player, per_rank
+
+if __name__ == "__main__":
+    # python bootstrap_ci.py [season] [replicates]
+    season = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SEASON
+    replicates = int(sys.argv[2]) if len(sys.argv) > 2 else REPLICATES
+    with run_report('bootstrap'):
+        per_player, per_rank = bootstrap_rankings(season, replicates=replicates)
+    print(per_player.head(25).to_string(index=False))
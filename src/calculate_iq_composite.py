@@ -1,97 +1,116 @@
+import sys
+
 import pandas as pd
 import numpy as np
 
-def calculate_weighted_iq_rankings():
-    iq_metrics = pd.read_csv('data/processed/all_player_iq_metrics.csv')
-    
-    metric_columns = [
-        'ast_tov_ratio', 'late_clock_efficiency', 'clutch_ast_tov', 'efg_pct',
-        'deflections_per_36', 'screen_assists_per_36',
-        'shooting_foul_pct', 'personal_foul_rate', 'age', 'ast_pct'
-    ]
+from instrumentation import instrumentation, run_report
+from metric_registry import METRICS
+from seasons import DEFAULT_SEASON, SeasonPaths
+
+# the order the composite sums its terms in. floating point addition isn't
+# associative, so this stays pinned to keep exact ties between players (and
+# the published rankings) stable; metrics registered later are summed after
+SUM_ORDER = [
+    # creation, decision making on offense
+    'ast_tov_ratio', 'clutch_ast_tov', 'ast_pct',
+    # defensive discipline and anticipation
+    'shooting_foul_pct', 'personal_foul_rate', 'deflections_per_36',
+    # floor awareness, composure late in clock, shot selection, experience
+    'screen_assists_per_36', 'late_clock_efficiency', 'efg_pct', 'age'
+]
+
+# composite weight per percentile column, from the metric registry
+WEIGHTS = {
+    f'{name}_percentile': METRICS[name].weight
+    for name in SUM_ORDER + [name for name in METRICS if name not in SUM_ORDER]
+}
+
+def rank_percentiles(values, groups=None, invert=False, min_group_size=1):
+    """
+    percent of finite values in the same group strictly below each value
+    (strictly above if invert). non-finite values, missing groups and groups
+    with fewer than min_group_size finite values get NaN.
+
+    sorts once and uses searchsorted, so it's O(n log n) for any number of groups
+    """
+    values = np.asarray(values, dtype=float)
+    if groups is None:
+        codes = np.zeros(len(values), dtype=np.int64)
+    else:
+        codes = pd.factorize(pd.Series(groups), use_na_sentinel=True)[0].astype(np.int64)
+
+    percentiles = np.full(len(values), np.nan)
+    valid = np.isfinite(values) & (codes >= 0)
+    if not valid.any():
+        return percentiles
+
+    # dense value ranks combined with the group code give one sortable integer
+    # key per row, so every group occupies a contiguous run of the sorted keys
+    _, value_ranks = np.unique(values[valid], return_inverse=True)
+    stride = value_ranks.max() + 2
+    group_start = codes[valid] * stride
+    keys = group_start + value_ranks
+    sorted_keys = np.sort(keys)
+
+    first = np.searchsorted(sorted_keys, group_start, side='left')
+    last = np.searchsorted(sorted_keys, group_start + stride, side='left')
+    group_size = last - first
+
+    if invert:
+        count = last - np.searchsorted(sorted_keys, keys, side='right')
+    else:
+        count = np.searchsorted(sorted_keys, keys, side='left') - first
+
+    result = count / group_size * 100
+    result[group_size < min_group_size] = np.nan
+    percentiles[valid] = result
+    return percentiles
+
+def metric_percentiles(iq_metrics):
+    """
+    base columns plus a {metric}_percentile column for every registered
+    metric, rounded to 0.1. missing percentiles are filled with 50
+    """
+    missing = [metric for metric in METRICS if metric not in iq_metrics.columns]
+    if missing:
+        raise ValueError(f"metrics table has no column for registered metrics {missing}; rerun batch_metrics.py")
     
     base_columns = ['PLAYER_ID', 'PLAYER_NAME', 'TEAM_ID', 'POSITION', 'GP', 'MIN']
     df = iq_metrics[base_columns].copy()
     
-    for metric in metric_columns:
-        if metric in ['screen_assists_per_36', 'shooting_foul_pct', 'efg_pct', 'late_clock_efficiency']:
-            # screen assists, shooting fouls, and efg% can differ due to position
-            percentiles = []
-            for idx, row in iq_metrics.iterrows():
-                value = row[metric]
-                position = row.get('POSITION', 'Unknown')
-                
-                same_position_values = iq_metrics[iq_metrics['POSITION'] == position][metric]
-                finite_position_values = same_position_values[np.isfinite(same_position_values)]
-                
-                if np.isfinite(value) and len(finite_position_values) > 1:
-                    if metric in ['shooting_foul_pct']:
-                        percentile = (finite_position_values > value).mean() * 100
-                    else:
-                        percentile = (finite_position_values < value).mean() * 100
-                else:
-                    percentile = np.nan
-
-                percentiles.append(percentile)
-        else:
-            metric_values = iq_metrics[metric]
-            finite_values = metric_values[np.isfinite(metric_values)]
-            
-            percentiles = []
-            for value in metric_values:
-                if np.isfinite(value):
-                    # invert for personal foul rate
-                    if metric in ['personal_foul_rate']:
-                        percentile = (finite_values > value).mean() * 100
-                    else:
-                        percentile = (finite_values < value).mean() * 100
-                else:
-                    percentile = np.nan
-                percentiles.append(percentile)
+    for name, metric in METRICS.items():
+        invert = not metric.higher_is_better
+        with instrumentation.timer(f'composite.percentiles.{name}'):
+            # positional metrics are ranked against players at the same position
+            if metric.by_position:
+                percentiles = rank_percentiles(iq_metrics[name], groups=iq_metrics['POSITION'],
+                                               invert=invert, min_group_size=2)
+            else:
+                percentiles = rank_percentiles(iq_metrics[name], invert=invert)
         
-        df[f'{metric}_percentile'] = np.round(percentiles, 1)
-        df[f'{metric}_percentile'] = df[f'{metric}_percentile'].fillna(50.0)
-    
-    weights = {
-        # creation, decision making on offense
-        'ast_tov_ratio_percentile': 0.15,
-        'clutch_ast_tov_percentile': 0.05,
-        'ast_pct_percentile': 0.15,
-
-        # defensive discipline and anticipation
-        'shooting_foul_pct_percentile': 0.15,
-        'personal_foul_rate_percentile': 0.05,
-        'deflections_per_36_percentile': 0.10,
+        df[f'{name}_percentile'] = np.round(percentiles, 1)
+        instrumentation.count(f'composite.{name}.filled', int(df[f'{name}_percentile'].isna().sum()))
+        df[f'{name}_percentile'] = df[f'{name}_percentile'].fillna(50.0)
 
-        # floor awareness and ability to run plays properly
-        'screen_assists_per_36_percentile': 0.10,
+    return df
 
-        # efficiency under time pressure, composure late in clock
-        'late_clock_efficiency_percentile': 0.09,
+def calculate_weighted_iq_rankings(season=DEFAULT_SEASON, data_dir='data'):
+    paths = SeasonPaths(season, data_dir)
+    iq_metrics = pd.read_csv(paths.metrics_csv)
 
-        # smart and efficient shot-taking
-        'efg_pct_percentile': 0.15,
-
-        # league experience
-        'age_percentile': 0.01
-    }
+    df = metric_percentiles(iq_metrics)
+    
+    weights = WEIGHTS
     
     print("\nWeighted Basketball IQ Formula:")
-    print(f"  AST/TOV Ratio: {weights['ast_tov_ratio_percentile']:.0%}")
-    print(f"  Clutch AST/TOV Ratio: {weights['clutch_ast_tov_percentile']:.0%}")
-    print(f"  Assist Percentage: {weights['ast_pct_percentile']:.0%}")
-    print(f"  Deflection Rate: {weights['deflections_per_36_percentile']:.0%}")
-    print(f"  Screen Assist Rate: {weights['screen_assists_per_36_percentile']:.0%}")
-    print(f"  Late Clock Efficiency: {weights['late_clock_efficiency_percentile']:.0%}")
-    print(f"  EFG%: {weights['efg_pct_percentile']:.0%}")
-    print(f"  Shooting Foul Rate: {weights['shooting_foul_pct_percentile']:.0%}")
-    print(f"  Personal Foul Rate: {weights['personal_foul_rate_percentile']:.0%}")
-    print(f"  Age: {weights['age_percentile']:.0%}")
+    for name, metric in METRICS.items():
+        print(f"  {metric.label}: {metric.weight:.0%}")
     print(f"  Total: {sum(weights.values()):.0%}")
     
-    unscaled_iq = 0
-    for metric, weight in weights.items():
-        unscaled_iq += df[metric] * weight
+    with instrumentation.timer('composite.weighting'):
+        unscaled_iq = 0
+        for metric, weight in weights.items():
+            unscaled_iq += df[metric] * weight
     
     league_average = unscaled_iq.mean()
     league_std = unscaled_iq.std()
@@ -100,12 +119,23 @@ def calculate_weighted_iq_rankings():
     df['composite_weighted_iq'] = np.round(df['composite_weighted_iq'], 0)
     
     df = df.sort_values('rank_weighted_iq')
-    df.to_csv('data/processed/weighted_iq_rankings.csv', index=False)
+    with instrumentation.timer('composite.save'):
+        df.to_csv(paths.rankings_csv, index=False)
     
     top_50 = df.head(50)[['rank_weighted_iq', 'PLAYER_NAME', 'composite_weighted_iq']]
     top_50.index = top_50['rank_weighted_iq']
     print("\n")
     print(top_50[['PLAYER_NAME', 'composite_weighted_iq']].to_string(header=False))
 
+    return df
+
 if __name__ == "__main__":
-    calculate_weighted_iq_rankings()
+    season = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SEASON
+    with run_report('composite'):
+        calculate_weighted_iq_rankings(season)
+
+        # precomputed similarity lookups for the frontend, from the rankings just saved
+        from similarity import build_similarity_artifact
+        paths = SeasonPaths(season)
+        with instrumentation.timer('composite.similarity_artifact'):
+            build_similarity_artifact(paths.rankings_csv, paths.similarity_dir, season=season)
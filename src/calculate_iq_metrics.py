@@ -1,108 +1,317 @@
+import functools
+import hashlib
+import logging
+import os
+import sys
+from collections.abc import Mapping
+
 import pandas as pd
 import numpy as np
 from pathlib import Path
 from nba_api.stats.endpoints import commonplayerinfo
 
-def get_player_position(player_name):
-    """ retrieve player position from bbref data """
-    try:
+import storage
+from fetch_manifest import file_hash, frame_hash
+from metric_cache import cache_key, function_version, MetricCache
+from metric_registry import METRICS
+from instrumentation import instrumentation, run_report
+from player_index import load_player_index, resolve_players, save_player_index, season_rows
+from seasons import DEFAULT_SEASON, SeasonPaths
 
-        basic_stats_df = pd.read_csv('data/processed/basic_stats_36_bbref.csv')
-        player_row = basic_stats_df[basic_stats_df['Player'] == player_name]
-        
-        if player_row.empty:
-            print("unknown pos")
-            return 'Unknown'
-        
-        position = player_row.iloc[0]['Pos']
-        return position
-        
-    except Exception as e:
-        print(f"Could not get position for player {player_name}: {e}")
+LEAGUE_FILES = {
+    'hustle_stats': 'league_hustle_stats.csv',
+    'clutch_stats': 'league_clutch_stats.csv'
+}
+
+# per-player raw endpoints load_player_data reads: data key -> endpoint
+PLAYER_FILES = {
+    'general_splits': 'general_splits',
+    'closest_defender': 'ClosestDefenderShooting',
+    'dribble_shooting': 'DribbleShooting',
+    'touch_time': 'TouchTimeShooting',
+    'overall_shooting': 'Overall'
+}
+
+BBREF_FILES = {
+    'basic_stats_36': 'basic_stats_36_bbref.csv',
+    'shooting_fouls': 'shooting_fouls_bbref_{year}.csv',
+    'advanced_stats': 'advanced_stats_bbref_{year}.csv'
+}
+
+# metric inputs naming a player's row in a bbref table, e.g. 'bbref.advanced_stats'
+BBREF_INPUT = 'bbref.'
+
+logger = logging.getLogger(__name__)
+
+def read_csv(path):
+    """ pd.read_csv, counting files and bytes read for the run report """
+    df = pd.read_csv(path)
+    instrumentation.count('io.csv_files')
+    instrumentation.count('io.csv_bytes', os.path.getsize(path))
+    return df
+
+class LazyTables(dict):
+    """ a dict that fills missing keys from loader(key) on first access """
+
+    def __init__(self, loader):
+        super().__init__()
+        self.loader = loader
+
+    def __missing__(self, key):
+        self[key] = self.loader(key)
+        return self[key]
+
+class DataContext:
+    """ league and bbref tables, read once per run and indexed for per-player lookups """
+
+    def __init__(self, data_dir='data', season=DEFAULT_SEASON):
+        self.paths = SeasonPaths(season, data_dir)
+        self.data_dir = data_dir
+        self.raw_dir = self.paths.raw_dir
+        self.store_dir = self.paths.store_dir
+        self.season = season
+        self.store_groups = {}
+        self.store_endpoints = {}
+
+        self.top300 = read_csv(self.paths.players_csv)
+        self.players = self.top300.drop_duplicates('PLAYER_ID').set_index('PLAYER_ID', drop=False)
+
+        # league and bbref tables are read the first time a metric asks for them
+        self.league = LazyTables(self.load_league_table)
+        self.bbref = LazyTables(self.load_bbref_table)
+
+    def load_league_table(self, key):
+        """ a league table keyed by PLAYER_ID, or None if it can't be read """
+        filename = LEAGUE_FILES[key]
+        try:
+            df = self.read_raw_table(filename[:-len('.csv')])
+            return df.drop_duplicates('PLAYER_ID').set_index('PLAYER_ID', drop=False)
+        except Exception as e:
+            logger.warning(f"Error reading {filename}: {e}")
+            return None
+
+    def load_bbref_table(self, key):
+        """ a bbref table with one row per player (traded players' total row), keyed by bbref id, or None """
+        filename = BBREF_FILES[key]
+        try:
+            return season_rows(read_csv(self.paths.bbref_file(filename)))
+        except Exception as e:
+            logger.warning(f"Could not load {filename.format(year=self.paths.bbref_year)}: {e}")
+            return None
+
+    @functools.cached_property
+    def bbref_ids(self):
+        """ PLAYER_ID -> bbref id of every matched player, from the persisted player index """
+        sources = [self.paths.players_csv] + [self.paths.bbref_file(filename) for filename in BBREF_FILES.values()]
+        index = load_player_index(self.paths.player_index_csv, self.top300, sources)
+        if index is None:
+            index = self.build_player_index()
+        matched = index.dropna(subset=['BBREF_ID'])
+        return dict(zip(matched['PLAYER_ID'].astype(int), matched['BBREF_ID']))
+
+    def build_player_index(self):
+        """ match every player to their bbref rows by normalized name and save the index """
+        with instrumentation.timer('context.build_player_index'):
+            index = resolve_players(self.top300, [self.bbref[key] for key in BBREF_FILES])
+            save_player_index(index, self.paths.player_index_csv)
+        return index
+
+    def uses_store(self, name):
+        """ whether a raw endpoint/table is read from the parquet store instead of CSVs """
+        if name not in self.store_endpoints:
+            self.store_endpoints[name] = storage.has_endpoint(name, self.season, self.store_dir)
+        return self.store_endpoints[name]
+
+    def read_raw_table(self, name):
+        """ a league-wide raw table, from the parquet store if present """
+        if self.uses_store(name):
+            return storage.load_endpoint(name, self.season, store_dir=self.store_dir)
+        return read_csv(f'{self.raw_dir}/{name}.csv')
+
+    def player_file(self, player_id, name):
+        """
+        one player's rows for a raw endpoint. from the store the whole endpoint
+        is read once and split by player; otherwise {player_id}_{name}.csv
+        """
+        if not self.uses_store(name):
+            return read_csv(f'{self.raw_dir}/{player_id}_{name}.csv')
+
+        if name not in self.store_groups:
+            df = storage.load_endpoint(name, self.season, store_dir=self.store_dir)
+            self.store_groups[name] = {
+                player: rows.reset_index(drop=True) for player, rows in df.groupby('PLAYER_ID', sort=False)
+            }
+        rows = self.store_groups[name].get(int(player_id))
+        if rows is None:
+            raise FileNotFoundError(f"no {name} rows for {player_id} in {self.store_dir}")
+        return rows
+
+    def player_file_hash(self, player_id, name):
+        """ content hash of one player's rows for a raw endpoint, without parsing the CSV """
+        if self.uses_store(name):
+            try:
+                return frame_hash(self.player_file(player_id, name))
+            except FileNotFoundError:
+                return 'missing'
+        path = f'{self.raw_dir}/{player_id}_{name}.csv'
+        return file_hash(path) if os.path.exists(path) else 'missing'
+
+    def player_stats(self, player_id):
+        """ row from top300_per.csv, or None """
+        try:
+            return self.players.loc[int(player_id)]
+        except KeyError:
+            return None
+
+    def league_row(self, key, player_id):
+        """ row from a league table, or an empty Series """
+        table = self.league[key]
+        if table is None:
+            return pd.Series()
+        try:
+            return table.loc[int(player_id)]
+        except KeyError:
+            return pd.Series()
+
+    def bbref_row(self, key, player_id):
+        """ a player's row from a bbref table, or None """
+        table = self.bbref[key]
+        bbref_id = self.bbref_ids.get(int(player_id))
+        if table is None or bbref_id is None:
+            return None
+        try:
+            return table.loc[bbref_id]
+        except KeyError:
+            return None
+
+def get_player_position(player_id, context):
+    """ retrieve player position from bbref data """
+    player_row = context.bbref_row('basic_stats_36', player_id)
+    
+    if player_row is None:
+        logger.warning("unknown pos")
         return 'Unknown'
+    
+    return player_row['Pos']
 
-def load_player_data(player_id):
-    """ load basic stats and all relevant CSV files for one player """
+class PlayerData(Mapping):
+    """
+    one player's metric inputs, each loaded from the context the first time
+    it's read: basic_stats, position, PLAYER_FILES and LEAGUE_FILES keys and
+    bbref.{table} rows (matched through the player index). loading any
+    other input loads basic_stats first, for the player's name in warnings
+    """
+
+    def __init__(self, player_id, context):
+        self.player_id = player_id
+        self.context = context
+        self.loaded = {}
+        self.hashes = {}
+        self.missing_files = []
+
+    def __getitem__(self, key):
+        if key not in self.loaded:
+            self.loaded[key] = self.load(key)
+        return self.loaded[key]
+
+    def __iter__(self):
+        return iter(self.loaded)
+
+    def __len__(self):
+        return len(self.loaded)
+
+    def load(self, key):
+        player_id, context = self.player_id, self.context
+        if key == 'basic_stats':
+            return context.player_stats(player_id)
+
+        player_name = self['basic_stats']['PLAYER_NAME']
+        if key == 'position':
+            return get_player_position(player_id, context)
+
+        if key in PLAYER_FILES:
+            filename = f'{player_id}_{PLAYER_FILES[key]}.csv'
+            try:
+                return context.player_file(player_id, PLAYER_FILES[key])
+            except Exception as e:
+                logger.warning(f"Error reading {filename} for {player_name} (ID: {player_id}): {e}")
+                self.missing_files.append(filename)
+                return pd.DataFrame()
+
+        if key in LEAGUE_FILES:
+            row = context.league_row(key, player_id)
+            if row.empty:
+                logger.warning(f"Player {player_name} (ID: {player_id}) not found in {LEAGUE_FILES[key]}")
+            return row
+
+        if key.startswith(BBREF_INPUT):
+            return context.bbref_row(key[len(BBREF_INPUT):], player_id)
+
+        raise KeyError(key)
+
+    def input_hash(self, key):
+        """ content hash of one input; raw endpoint files are hashed as stored, without loading them """
+        if key not in self.hashes:
+            if key in PLAYER_FILES:
+                self.hashes[key] = self.context.player_file_hash(self.player_id, PLAYER_FILES[key])
+            else:
+                value = self[key]
+                value = 'missing' if value is None else value if isinstance(value, str) else value.to_json()
+                self.hashes[key] = hashlib.sha256(value.encode()).hexdigest()
+        return self.hashes[key]
+
+    def fingerprint(self, inputs):
+        """ combined content hash of the given inputs """
+        digest = hashlib.sha256()
+        for key in sorted(inputs):
+            digest.update(f'{key}={self.input_hash(key)};'.encode())
+        return digest.hexdigest()
+
+    def prefetch(self, inputs):
+        """ load the given inputs now, logging any missing player files once """
+        missing = len(self.missing_files)
+        for key in inputs:
+            self[key]
+        if len(self.missing_files) > missing:
+            logger.warning(f"Missing files for {self['basic_stats']['PLAYER_NAME']} (ID: {self.player_id}): {self.missing_files}")
+        return self
+
+def load_player_data(player_id, context, inputs=None):
+    """
+    load basic stats and the given inputs for one player (by default, every
+    input some metric declares). other inputs still load lazily on access
+    """
     
     try:
-        top300 = pd.read_csv('data/top300_per.csv')
-        basic_stats = top300[top300['PLAYER_ID'] == int(player_id)]
-        if basic_stats.empty:
-            print(f"Player {player_id} not found in top300_per.csv")
+        loaded_data = PlayerData(player_id, context)
+        if loaded_data['basic_stats'] is None:
+            logger.warning(f"Player {player_id} not found in top300_per.csv")
             return None
             
-        basic_stats = basic_stats.iloc[0]
-        player_name = basic_stats['PLAYER_NAME']
-        
-        position = get_player_position(player_name)
-        
-        files_to_load = {
-            'general_splits': f'{player_id}_general_splits.csv',
-            'closest_defender': f'{player_id}_ClosestDefenderShooting.csv',
-            'dribble_shooting': f'{player_id}_DribbleShooting.csv',
-            'touch_time': f'{player_id}_TouchTimeShooting.csv',
-            'overall_shooting': f'{player_id}_Overall.csv'
-        }
-        
-        loaded_data = {'basic_stats': basic_stats, 'position': position}
-        missing_files = []
-        
-        for key, filename in files_to_load.items():
-            file_path = 'data/raw/' + filename
-            if file_path:
-                try:
-                    loaded_data[key] = pd.read_csv(file_path)
-                except Exception as e:
-                    print(f"Error reading {filename} for {player_name} (ID: {player_id}): {e}")
-                    loaded_data[key] = pd.DataFrame()
-                    missing_files.append(filename)
-            else:
-                loaded_data[key] = pd.DataFrame()
-                missing_files.append(filename)
-        
-        league_files = {
-            'hustle_stats': 'league_hustle_stats.csv',
-            'clutch_stats': 'league_clutch_stats.csv'
-        }
-        
-        for key, filename in league_files.items():
-            file_path = 'data/raw/' + filename
-            if file_path:
-                try:
-                    df = pd.read_csv(file_path)
-                    player_data = df[df['PLAYER_ID'] == int(player_id)]
-                    if player_data.empty:
-                        print(f"Player {player_name} (ID: {player_id}) not found in {filename}")
-                        loaded_data[key] = pd.Series()
-                    else:
-                        loaded_data[key] = player_data.iloc[0]
-                except Exception as e:
-                    print(f"Error reading {filename} for {player_name} (ID: {player_id}): {e}")
-                    loaded_data[key] = pd.Series()
-            else:
-                loaded_data[key] = pd.Series()
-                print(f"League file {filename} not found")
-        
-        if missing_files:
-            print(f"Missing files for {player_name} (ID: {player_id}): {missing_files}")
-        
-        return loaded_data
+        return loaded_data.prefetch(metric_inputs() if inputs is None else inputs)
         
     except Exception as e:
-        print(f"Critical error loading data for player {player_id}: {e}")
+        logger.warning(f"Critical error loading data for player {player_id}: {e}")
         return None
 
-def calculate_ast_tov_ratio(data):
+def metric_failed(metric, data, error):
+    """ a calculator raised: count and log it, the metric becomes NaN """
+    instrumentation.count(f'metric.{metric}.errors')
+    player_name = data.get('basic_stats', {}).get('PLAYER_NAME', '?')
+    logger.debug(f"{metric} failed for {player_name}: {error!r}")
+    return np.nan
+
+def calculate_ast_tov_ratio(data, context):
     """Assist-to-Turnover Ratio"""
     try:
         basic = data['basic_stats']
         ast = basic['AST']
         tov = basic['TOV']
         return ast / tov if tov > 0 else np.inf
-    except:
-        return np.nan
+    except Exception as e:
+        return metric_failed('ast_tov_ratio', data, e)
 
-def calculate_late_clock_efficiency(data):
+def calculate_late_clock_efficiency(data, context):
     """Late Clock Efficiency"""
     try:
         dribble_shooting = data['dribble_shooting']
@@ -125,10 +334,10 @@ def calculate_late_clock_efficiency(data):
             
         combined_efficiency = (late_fg_pct * late_freq + very_late_fg_pct * very_late_freq) / (late_freq + very_late_freq)
         return combined_efficiency
-    except:
-        return np.nan
+    except Exception as e:
+        return metric_failed('late_clock_efficiency', data, e)
 
-def calculate_clutch_ast_tov(data):
+def calculate_clutch_ast_tov(data, context):
     """Clutch AST/TOV Ratio"""
     try:
         clutch = data['clutch_stats']
@@ -146,10 +355,10 @@ def calculate_clutch_ast_tov(data):
             basic = data['basic_stats']
             regular_ast_tov = basic['AST'] / basic['TOV'] if basic['TOV'] > 0 else 3.0
             return regular_ast_tov * 0.9
-    except:
-        return np.nan
+    except Exception as e:
+        return metric_failed('clutch_ast_tov', data, e)
 
-def calculate_efg_pct(data):
+def calculate_efg_pct(data, context):
     """Effective Field Goal %"""
     try:
         basic = data['basic_stats']
@@ -157,30 +366,30 @@ def calculate_efg_pct(data):
         fg3m = basic['FG3M']
         fga = basic['FGA']
         return (fgm + 0.5 * fg3m) / fga if fga > 0 else 0
-    except:
-        return np.nan
+    except Exception as e:
+        return metric_failed('efg_pct', data, e)
 
-def calculate_deflections_per_36(data):
+def calculate_deflections_per_36(data, context):
     """Deflections per 36"""
     try:
         hustle = data['hustle_stats']
         if hustle.empty:
             return np.nan
         return hustle['DEFLECTIONS']
-    except:
-        return np.nan
+    except Exception as e:
+        return metric_failed('deflections_per_36', data, e)
 
-def calculate_screen_assists_per_36(data):
+def calculate_screen_assists_per_36(data, context):
     """Screen Assists per 36"""
     try:
         hustle = data['hustle_stats']
         if hustle.empty:
             return np.nan
         return hustle['SCREEN_ASSISTS']
-    except:
-        return np.nan
+    except Exception as e:
+        return metric_failed('screen_assists_per_36', data, e)
 
-def calculate_shooting_foul_percentage(data):
+def calculate_shooting_foul_percentage(data, context):
     """Shooting Foul Rate"""
     try:
         general_splits = data['general_splits']
@@ -192,7 +401,6 @@ def calculate_shooting_foul_percentage(data):
             
         overall_stats = general_splits.iloc[0]
         games_played = overall_stats['GP']
-        player_name = basic_stats['PLAYER_NAME']
         
         shots_defended_per_game = closest_defender['FGA'].sum()
         total_shots_defended = shots_defended_per_game * games_played
@@ -200,131 +408,193 @@ def calculate_shooting_foul_percentage(data):
         if total_shots_defended == 0:
             return np.nan
             
-        shooting_fouls = get_shooting_fouls(player_name)
+        shooting_fouls = get_shooting_fouls(basic_stats['PLAYER_ID'], context)
         
         # divide shooting fouls by number of "contests" 
         # (opponent FGA with player as closest defender)
         shooting_foul_percentage = (shooting_fouls / total_shots_defended) * 100
         return shooting_foul_percentage
-    except:
-        return np.nan
+    except Exception as e:
+        return metric_failed('shooting_foul_pct', data, e)
 
-def get_shooting_fouls(player_name):
+def get_shooting_fouls(player_id, context):
     """get data from bbref csv"""
-    try:
-        shooting_fouls_df = pd.read_csv('data/processed/shooting_fouls_bbref_2024.csv')
-        player_entries = shooting_fouls_df[shooting_fouls_df['Player'] == player_name]
-        
-        if not player_entries.empty:
-            if len(player_entries) > 1:
-                player_entries = player_entries.sort_values('G', ascending=False)
-            return player_entries.iloc[0]['Shoot']
-        
-        return np.nan
-        
-    except Exception as e:
-        print(f"Could not load shooting fouls for {player_name}: {e}")
+    player_row = context.bbref_row('shooting_fouls', player_id)
+    
+    if player_row is None:
         return np.nan
+    
+    return player_row['Shoot']
 
 
-def calculate_personal_foul_rate(data):
+def calculate_personal_foul_rate(data, context):
     """Personal Foul Rate per 36"""
     try:
-        basic = data['basic_stats']
-        player_name = basic['PLAYER_NAME']
-        
         # using bbref data
-        basic_stats_df = pd.read_csv('data/processed/basic_stats_36_bbref.csv')
-        player_row = basic_stats_df[basic_stats_df['Player'] == player_name]
+        player_row = data['bbref.basic_stats_36']
         
-        if player_row.empty:
+        if player_row is None:
             return np.nan
             
-        pf_per_36 = player_row.iloc[0]['PF']
+        pf_per_36 = player_row['PF']
         return pf_per_36
         
-    except:
-        return np.nan
+    except Exception as e:
+        return metric_failed('personal_foul_rate', data, e)
 
-def calculate_age(data):
+def calculate_age(data, context):
     """Age"""
     try:
-        basic = data['basic_stats']
-        player_name = basic['PLAYER_NAME']
-        
         # data contained in bbref csv
-        basic_stats_df = pd.read_csv('data/processed/basic_stats_36_bbref.csv')
-        player_row = basic_stats_df[basic_stats_df['Player'] == player_name]
+        player_row = data['bbref.basic_stats_36']
 
-        if player_row.empty:
+        if player_row is None:
             return np.nan
         
-        age = player_row.iloc[0]['Age']
+        age = player_row['Age']
         return age
 
-    except:
-        return np.nan
+    except Exception as e:
+        return metric_failed('age', data, e)
 
-def calculate_assist_percentage(data):
+def calculate_assist_percentage(data, context):
     """Assist Percentage"""
     try:
-        basic = data['basic_stats']
-        player_name = basic['PLAYER_NAME']
-        
         # data contained in bbref csv
-        advanced_stats_df = pd.read_csv('data/processed/advanced_stats_bbref_2024.csv')
-        player_row = advanced_stats_df[advanced_stats_df['Player'] == player_name]
+        player_row = data['bbref.advanced_stats']
         
-        if player_row.empty:
+        if player_row is None:
             return np.nan
 
-        ast_pct = player_row.iloc[0]['AST%']
+        ast_pct = player_row['AST%']
         return ast_pct
         
-    except:
-        return np.nan
+    except Exception as e:
+        return metric_failed('ast_pct', data, e)
+
+# metric -> per-player calculator, in output column order. the inputs,
+# direction and weight of each live in metric_registry; registered metrics
+# without a calculator here only exist on the batch path (batch_metrics.py)
+METRIC_CALCULATORS = {
+    'ast_tov_ratio': calculate_ast_tov_ratio,
+    'late_clock_efficiency': calculate_late_clock_efficiency,
+    'clutch_ast_tov': calculate_clutch_ast_tov,
+    'efg_pct': calculate_efg_pct,
+    'deflections_per_36': calculate_deflections_per_36,
+    'screen_assists_per_36': calculate_screen_assists_per_36,
+    'shooting_foul_pct': calculate_shooting_foul_percentage,
+    'personal_foul_rate': calculate_personal_foul_rate,
+    'age': calculate_age,
+    'ast_pct': calculate_assist_percentage
+}
+
+# helpers a calculator calls, hashed into its cache version
+METRIC_HELPERS = {
+    'shooting_foul_pct': [get_shooting_fouls]
+}
 
-def calculate_all_metrics_for_player(player_id):
-    """calculate all 10 IQ metrics for a single player"""
-    data = load_player_data(player_id)
+# every metric's output row starts with these, so they're always loaded
+BASE_INPUTS = ('basic_stats', 'position')
+
+@functools.lru_cache(maxsize=None)
+def metric_versions():
+    """ metric -> hash of the code producing it (input loading, calculator, helpers) """
+    return {
+        metric: function_version(PlayerData, calculator, *METRIC_HELPERS.get(metric, []))
+        for metric, calculator in METRIC_CALCULATORS.items()
+    }
+
+def metric_inputs(metrics=None):
+    """ the registry inputs the given metrics (default all with a calculator) read, plus BASE_INPUTS """
+    metrics = METRIC_CALCULATORS if metrics is None else metrics
+    inputs = dict.fromkeys(BASE_INPUTS)
+    for metric in metrics:
+        inputs.update(dict.fromkeys(METRICS[metric].inputs))
+    return list(inputs)
+
+def calculate_all_metrics_for_player(player_id, context=None, cache=None, metrics=None):
+    """
+    calculate the IQ metrics (default all 10) for a single player, loading only
+    the inputs those metrics declare. with a MetricCache, metrics whose code
+    and inputs are unchanged are read back instead of recomputed, and their
+    inputs aren't loaded at all
+    """
+    if context is None:
+        context = DataContext()
+    metrics = list(METRIC_CALCULATORS) if metrics is None else metrics
+
+    data = load_player_data(player_id, context, BASE_INPUTS)
     if data is None:
         return None
+
+    keys, cached = {}, {}
+    if cache is not None:
+        # each metric is keyed on its own inputs, so a changed file only
+        # invalidates the metrics that read it
+        versions = metric_versions()
+        keys = {
+            metric: cache_key(metric, versions[metric], data.fingerprint(METRICS[metric].inputs))
+            for metric in metrics
+        }
+        found = cache.get_many(list(keys.values()))
+        cached = {metric: found[key] for metric, key in keys.items() if key in found}
+
+    with instrumentation.timer('metrics.load_player_data'):
+        data.prefetch(metric_inputs([metric for metric in metrics if metric not in cached]))
     
     basic = data['basic_stats']
     player_name = basic['PLAYER_NAME']
-    position = get_player_position(player_name)
     
-    metrics = {
+    row = {
         'PLAYER_ID': int(player_id),
         'PLAYER_NAME': player_name,
         'TEAM_ID': basic['TEAM_ID'],
-        'POSITION': position,
+        'POSITION': data['position'],
         'GP': basic['GP'],
-        'MIN': basic['MIN'],
-
-        'ast_tov_ratio': calculate_ast_tov_ratio(data),
-        'late_clock_efficiency': calculate_late_clock_efficiency(data),
-        'clutch_ast_tov': calculate_clutch_ast_tov(data),
-        'efg_pct': calculate_efg_pct(data),
-        'deflections_per_36': calculate_deflections_per_36(data),
-        'screen_assists_per_36': calculate_screen_assists_per_36(data),
-        'shooting_foul_pct': calculate_shooting_foul_percentage(data),
-        'personal_foul_rate': calculate_personal_foul_rate(data),
-        'age': calculate_age(data),
-        'ast_pct': calculate_assist_percentage(data)
+        'MIN': basic['MIN']
     }
+
+    computed = {}
+    for metric in metrics:
+        if metric in cached:
+            value = cached[metric]
+        else:
+            with instrumentation.timer(f'metric.{metric}'):
+                value = METRIC_CALCULATORS[metric](data, context)
+            computed[metric] = value
+        if pd.isna(value):
+            instrumentation.count(f'metric.{metric}.nan')
+        row[metric] = value
+
+    if keys and computed:
+        cache.put_many({keys[metric]: value for metric, value in computed.items()})
     
-    return metrics
+    return row
+
+def calculate_metrics(metrics, context=None):
+    """
+    a frame of just the given metrics for every player, without writing
+    anything; for trying out metrics without loading unrelated inputs
+    """
+    context = context or DataContext()
+    rows = [calculate_all_metrics_for_player(player_id, context, metrics=metrics)
+            for player_id in context.top300['PLAYER_ID']]
+    return pd.DataFrame([row for row in rows if row])
 
-def process_all_players():
-    """process iq metrics for all 300 players"""
+def process_all_players(season=DEFAULT_SEASON, data_dir='data', cache=None):
+    """process iq metrics for all 300 players, reusing cached metrics when a MetricCache is given"""
 
-    # list of all players
-    top300 = pd.read_csv('data/top300_per.csv')
+    # league and bbref tables are loaded once and shared by every player
+    with instrumentation.timer('metrics.context'):
+        context = DataContext(data_dir, season)
+    top300 = context.top300
 
+    batch_only = [metric for metric in METRICS if metric not in METRIC_CALCULATORS]
+    if batch_only:
+        logger.warning(f"no per-player calculator for {batch_only}; run batch_metrics.py to include them")
     
-    print(f"\nprocessing {len(top300)} players")
-    print("note: missing data will return NaN and be replaced with 50th percentile in composite IQ calculation\n")
+    logger.info(f"\nprocessing {len(top300)} players")
+    logger.info("note: missing data will return NaN and be replaced with 50th percentile in composite IQ calculation\n")
     
     all_metrics = []
     failed_players = []
@@ -333,46 +603,54 @@ def process_all_players():
         player_id = str(player['PLAYER_ID'])
         player_name = player['PLAYER_NAME']
         
-        print(f"processing {player_name} (ID: {player_id})...")
+        logger.info(f"processing {player_name} (ID: {player_id})...")
         
         try:
-            metrics = calculate_all_metrics_for_player(player_id)
+            metrics = calculate_all_metrics_for_player(player_id, context, cache)
             if metrics:
                 all_metrics.append(metrics)
-                print(f"  successfully processed {player_name}")
+                logger.info(f"  successfully processed {player_name}")
             else:
                 failed_players.append((player_name, player_id, "data loading failed"))
-                print(f"  failed to process {player_name} - data loading failed")
+                instrumentation.count('metrics.players_failed')
+                logger.warning(f"  failed to process {player_name} - data loading failed")
         except Exception as e:
             failed_players.append((player_name, player_id, f"exception: {str(e)}"))
-            print(f"  failed to process {player_name} - exception: {str(e)}")
+            instrumentation.count('metrics.players_failed')
+            logger.warning(f"  failed to process {player_name} - exception: {str(e)}")
     
     # convert to dataframe
     df = pd.DataFrame(all_metrics)
     
     # output failed players if any
     if failed_players:
-        print(f"\n=== failed players: ({len(failed_players)}/{len(top300)}) ===")
+        logger.warning(f"\n=== failed players: ({len(failed_players)}/{len(top300)}) ===")
         for name, player_id, reason in failed_players:
-            print(f"  {name} (ID: {player_id}) - {reason}")
+            logger.warning(f"  {name} (ID: {player_id}) - {reason}")
     else:
-        print(f"\nall {len(top300)} players processed successfully!")
+        logger.info(f"\nall {len(top300)} players processed successfully!")
     
-    output_file = 'data/processed/all_player_iq_metrics.csv'
+    save_iq_metrics(df, context.paths.metrics_csv)
     
+    return df
+
+def save_iq_metrics(df, output_file='data/processed/all_player_iq_metrics.csv'):
+    """write the metrics table and print per-column coverage"""
     df.to_csv(output_file, index=False, float_format='%.3f')
     
-    print(f"\nprocessed {len(df)} players")
-    print(f"results saved to {output_file}")
+    logger.info(f"\nprocessed {len(df)} players")
+    logger.info(f"results saved to {output_file}")
     
     # data availability for debugging
-    print("\n=== data availability ===")
+    logger.info("\n=== data availability ===")
     for col in df.columns:
         if col not in ['PLAYER_ID', 'PLAYER_NAME', 'TEAM_ID', 'GP', 'MIN']:
             non_null_count = df[col].notna().sum()
-            print(f"{col}: {non_null_count}/{len(df)} players ({non_null_count/len(df)*100:.1f}%)")
-    
-    return df
+            logger.info(f"{col}: {non_null_count}/{len(df)} players ({non_null_count/len(df)*100:.1f}%)")
 
 if __name__ == "__main__":
-    results = process_all_players()
\ No newline at end of file
+    with run_report('metrics'):
+        # unchanged players come straight from the memo cache on reruns
+        cache = MetricCache()
+        results = process_all_players(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SEASON, cache=cache)
+        cache.close()
\ No newline at end of file
@@ -0,0 +1,160 @@
+import gzip
+import json
+import logging
+import math
+import os
+import sys
+
+import pandas as pd
+
+from instrumentation import setup_logging
+from seasons import DEFAULT_SEASON, LEGACY_SEASON, SeasonPaths
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FRONTEND_DATA_DIR = 'frontend/src/data'
+
+logger = logging.getLogger(__name__)
+
+def frontend_data_dir(season=DEFAULT_SEASON):
+    """ frontend/src/data for the season the frontend imports, frontend/src/data/seasons/{season} for the rest """
+    return FRONTEND_DATA_DIR if season == LEGACY_SEASON else f'{FRONTEND_DATA_DIR}/seasons/{season}'
+
+# raw value formatting for the frontend: (multiplier, decimals, display unit)
+METRIC_FORMATS = {
+    'ast_tov_ratio': (1, 2, ''),
+    'late_clock_efficiency': (100, 1, '%'),
+    'clutch_ast_tov': (1, 2, ''),
+    'efg_pct': (100, 1, '%'),
+    'deflections_per_36': (1, 2, ''),
+    'screen_assists_per_36': (1, 2, ''),
+    'shooting_foul_pct': (1, 1, '%'),
+    'personal_foul_rate': (1, 1, ''),
+    'age': (1, 1, ''),
+    'ast_pct': (1, 1, '%')
+}
+
+def json_number(value, decimals=None):
+    """ plain python float for json, None for missing or infinite values """
+    value = float(value)
+    if not math.isfinite(value):
+        return None
+    return round(value, decimals) if decimals is not None else value
+
+def player_records(rankings, metrics):
+    """ one frontend player dict per ranking row, in rank order """
+    raw = metrics.set_index('PLAYER_ID')
+    for row in rankings.itertuples(index=False):
+        player_raw = raw.loc[row.PLAYER_ID]
+        record = {
+            'rank': int(row.rank_weighted_iq),
+            'name': row.PLAYER_NAME,
+            'team': int(row.TEAM_ID),
+            'position': row.POSITION,
+            'iq_score': json_number(row.composite_weighted_iq),
+            'games': int(row.GP),
+            'minutes': json_number(row.MIN),
+            'metrics': {}
+        }
+        for metric, (multiplier, decimals, unit) in METRIC_FORMATS.items():
+            record['metrics'][metric] = {
+                'percentile': json_number(getattr(row, f'{metric}_percentile')),
+                'raw_value': json_number(player_raw[metric] * multiplier, decimals),
+                'display_unit': unit
+            }
+        yield record
+
+def open_output(path, compression=None):
+    """ text writer for path, compressed on the fly """
+    if compression is None:
+        return open(path, 'w', encoding='utf-8')
+    if compression == 'gzip':
+        return gzip.open(path, 'wt', encoding='utf-8', compresslevel=9)
+    if compression == 'brotli':
+        if brotli is None:
+            raise ImportError("brotli output needs the brotli package (pip install brotli)")
+        return BrotliWriter(path)
+    raise ValueError(f"unknown compression {compression!r}, expected 'gzip' or 'brotli'")
+
+class BrotliWriter:
+    """ minimal streaming text writer over a brotli compressor """
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.compressor = brotli.Compressor(quality=11)
+
+    def write(self, text):
+        self.file.write(self.compressor.process(text.encode('utf-8')))
+
+    def close(self):
+        self.file.write(self.compressor.finish())
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def write_json_array(records, path, indent=None, compression=None):
+    """
+    stream records into a json array one element at a time, so the whole
+    document is never built in memory. indent=2 matches the layout of the
+    original hand-converted file, indent=None writes it minified
+    """
+    separator = ',\n' if indent else ','
+    count = 0
+    tmp_path = path + '.tmp'
+    with open_output(tmp_path, compression) as f:
+        f.write('[\n' if indent else '[')
+        for record in records:
+            text = json.dumps(record, indent=indent, separators=None if indent else (',', ':'))
+            if indent:
+                text = '\n'.join(' ' * indent + line for line in text.split('\n'))
+            f.write((separator if count else '') + text)
+            count += 1
+        f.write('\n]' if indent else ']')
+    os.replace(tmp_path, path)
+    return count
+
+def export_frontend_data(season=DEFAULT_SEASON, output_dir=None, indent=None, variants=(), shard_by_team=False,
+                         rankings_path=None, metrics_path=None, data_dir='data'):
+    """
+    write players_with_raw_data.json for the frontend from a season's
+    composite and raw metric CSVs (paths from SeasonPaths unless given).
+    variants adds compressed copies ('gzip' / 'brotli') next to it,
+    shard_by_team also writes teams/{team_id}.json per team
+    """
+    paths = SeasonPaths(season, data_dir)
+    rankings_path = rankings_path or paths.rankings_csv
+    metrics_path = metrics_path or paths.metrics_csv
+    output_dir = output_dir or frontend_data_dir(season)
+    rankings = pd.read_csv(rankings_path)
+    metrics = pd.read_csv(metrics_path)
+    os.makedirs(output_dir, exist_ok=True)
+
+    path = f'{output_dir}/players_with_raw_data.json'
+    count = write_json_array(player_records(rankings, metrics), path, indent)
+    logger.info(f"exported {count} players to {path} ({os.path.getsize(path) / 1e3:.0f} KB).")
+
+    extensions = {'gzip': '.gz', 'brotli': '.br'}
+    for compression in variants:
+        variant_path = path + extensions[compression]
+        write_json_array(player_records(rankings, metrics), variant_path, compression=compression)
+        logger.info(f"  {compression}: {variant_path} ({os.path.getsize(variant_path) / 1e3:.0f} KB)")
+
+    if shard_by_team:
+        os.makedirs(f'{output_dir}/teams', exist_ok=True)
+        for team_id, team_rankings in rankings.groupby('TEAM_ID'):
+            write_json_array(player_records(team_rankings, metrics), f'{output_dir}/teams/{team_id}.json', indent)
+        logger.info(f"  sharded into {rankings['TEAM_ID'].nunique()} team files.")
+
+    return path
+
+if __name__ == "__main__":
+    # python export_frontend.py [season]
+    setup_logging()
+    export_frontend_data(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SEASON)
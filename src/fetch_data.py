@@ -3,269 +3,616 @@ from nba_api.stats.endpoints import (
     leaguehustlestatsplayer, leaguedashplayerclutch, playerdashptpass
 )
 
+import logging
+
 import pandas as pd
 import time
 import os
+import glob
+import sys
+
+from nba_api.stats.library.http import NBAStatsHTTP
+
+from fetch_scheduler import TokenBucket, FetchJob, run_fetch_jobs
+from retry_policy import HTTPStatusError, RetryClient, RetryError
+import storage
+from ingest import parse_result_sets
+from fetch_manifest import FetchManifest, LEAGUE, csv_intact, file_hash, frame_hash, stored_row_counts
+from instrumentation import instrumentation, run_report
+from seasons import DEFAULT_SEASON, SeasonPaths
+
+logger = logging.getLogger(__name__)
+
+# one retry policy (exponential backoff + jitter) and one circuit breaker per
+# endpoint, shared by every retry_fetch_* call and the concurrent scheduler
+retry_client = RetryClient()
+
+# file suffixes for the result sets of the multi-frame endpoints, in response order
+SHOT_TRACKING_NAMES = [
+    'ClosestDefender10ftPlusShooting',
+    'ClosestDefenderShooting',
+    'DribbleShooting',
+    'GeneralShooting',
+    'Overall',
+    'ShotClockShooting',
+    'TouchTimeShooting'
+]
+
+PASSING_NAMES = [
+    'PassesMade',
+    'PassesReceived'
+]
+
+def request_endpoint(endpoint_cls, **params):
+    """ send an nba_api endpoint request, raising HTTPStatusError for non-200 responses """
+    endpoint = endpoint_cls(get_request=False, **params)
+    try:
+        endpoint.get_request()
+    except Exception:
+        # nba_api only fails on the body; surface the status code if there is one
+        raise_for_status(endpoint)
+        raise
+    raise_for_status(endpoint)
+    return endpoint
+
+def request_result_sets(endpoint_cls, names=None, **params):
+    """
+    send an nba_api endpoint request and parse only the named result sets
+    (all by default) into ingest.ResultSets. skips nba_api's own parse,
+    which builds every result set and reparses the body per get_dict call
+    """
+    endpoint = endpoint_cls(get_request=False, **params)
+    endpoint.nba_response = NBAStatsHTTP().send_api_request(
+        endpoint=endpoint.endpoint,
+        parameters=endpoint.parameters,
+        proxy=endpoint.proxy,
+        headers=endpoint.headers,
+        timeout=endpoint.timeout
+    )
+    raise_for_status(endpoint)
+    with instrumentation.timer('ingest.parse'):
+        return parse_result_sets(endpoint.nba_response.get_response(), names)
+
+def raise_for_status(endpoint):
+    response = endpoint.nba_response
+    status = getattr(response, '_status_code', None)
+    if status is not None and status != 200:
+        raise HTTPStatusError(status, response.get_url())
 
-def fetch_top_300_ppg(season='2024-25'):
+# which players the pipeline covers: the top n scorers (the original top 300
+# PPG), everyone over a total minutes threshold, or the whole league
+POPULATION_MODES = ['top_ppg', 'minutes', 'league']
 
-    player_stats = leaguedashplayerstats.LeagueDashPlayerStats(
+def select_population(df, mode='top_ppg', n=300, min_minutes=500):
+    """ rows of the per-game league table that make up the population, best scorers first """
+    if mode == 'top_ppg':
+        return df.nlargest(n, 'PTS')
+
+    ranked = df.sort_values('PTS', ascending=False, kind='stable')
+    if mode == 'minutes':
+        # MIN is per game in the PerGame table
+        return ranked[ranked['MIN'] * ranked['GP'] >= min_minutes]
+    if mode == 'league':
+        return ranked
+    raise ValueError(f"unknown population mode {mode!r}, expected one of {POPULATION_MODES}")
+
+def fetch_league_table(season):
+    """ the per-game league table every population is selected from """
+    player_stats = request_endpoint(
+        leaguedashplayerstats.LeagueDashPlayerStats,
         league_id_nullable='00',
         season=season,
         season_type_all_star='Regular Season',
         per_mode_detailed='PerGame'
     )
+    return player_stats.get_data_frames()[0]
+
+def fetch_player_population(season=DEFAULT_SEASON, mode='top_ppg', n=300, min_minutes=500, manifest=None):
+    """ fetch the league table and save the chosen population as the season's player list """
+    # every later fetch depends on this one, so a RetryError here ends the run
+    df = retry_client.call('population', lambda: fetch_league_table(season), key=season)
+    population = select_population(df, mode, n, min_minutes)
 
-    df = player_stats.get_data_frames()[0]
-    top300 = df.nlargest(300, 'PTS')
+    paths = SeasonPaths(season).ensure_dirs()
+    path = paths.players_csv
+    if manifest is not None:
+        entry = manifest.get(season, 'top300')
+        if entry is not None and os.path.exists(path) and entry['content_hash'] == frame_hash(population):
+            logger.info(f'{len(population)} players ({mode}) unchanged, keeping existing CSV.')
+            return population
 
-    top300.to_csv('data/top300_per.csv', index=False)
-    print('saved top 300 players by PPG to CSV.')
+    population.to_csv(path, index=False)
+    logger.info(f'saved {len(population)} players ({mode}) to CSV.')
+    if manifest is not None:
+        manifest.record(season, 'top300', LEAGUE, population, 'csv')
 
-    return top300
+    return population
 
-def fetch_save_advanced_data(df, season='2024-25', delay=5):
+def fetch_top_300_ppg(season=DEFAULT_SEASON, manifest=None):
+    return fetch_player_population(season, 'top_ppg', 300, manifest=manifest)
+
+def fetch_save_advanced_data(df, season=DEFAULT_SEASON, delay=5):
+    paths = SeasonPaths(season).ensure_dirs()
     for idx, row in df.iterrows():
         # get player
         player_id = row['PLAYER_ID']
         player_name = row['PLAYER_NAME']
 
-        general_splits_path = f'data/raw/{player_id}_general_splits.csv'
-        shot_data_path = f'data/raw/{player_id}_shot_data.csv'
+        general_splits_path = paths.raw_file('general_splits', player_id)
+        shot_data_path = paths.raw_file('shot_data', player_id)
         
         # check if general splits data already exists
         fetched_data = False
         if not os.path.exists(general_splits_path):
             general_data=retry_fetch_dashboard(player_id, season)
             if general_data is not None:
-                general_data.to_csv(general_splits_path, index=False)
-                print(f"saved general splits for {player_name}.")
+                general_data.write_csv(general_splits_path)
+                logger.info(f"saved general splits for {player_name}.")
                 fetched_data = True
         else:
-            print(f"general splits for {player_name} already exists, skipping.")
+            logger.info(f"general splits for {player_name} already exists, skipping.")
 
         # check if shot data already exists
         if not os.path.exists(shot_data_path):
             shot_data=retry_fetch_shotchart(player_id, season)
             if shot_data is not None:
-                shot_data.to_csv(shot_data_path, index=False)
-                print(f"saved shot data for {player_name}.") 
+                shot_data.write_csv(shot_data_path)
+                logger.info(f"saved shot data for {player_name}.") 
                 fetched_data = True
         else:
-            print(f"shot data for {player_name} already exists, skipping.")
+            logger.info(f"shot data for {player_name} already exists, skipping.")
 
         # only sleep if we actually fetched data
         if fetched_data:
             time.sleep(delay)
 
-def retry_fetch_dashboard(player_id, season, max_retries=5, pause=5):
-    for attempt in range(max_retries):
-        try:
-            dash = playerdashboardbygeneralsplits.PlayerDashboardByGeneralSplits(
-                player_id=player_id,
-                season=season
-            )
-            df = dash.get_data_frames()[1]
-            return df
-        except Exception as e:
-            wait = pause * (attempt + 1)
-            print(f"timeout/error for {player_id} on attempt {attempt+1}. retrying in {wait} seconds...")
-            time.sleep(wait)
-
-    print(f"failed to fetch data for {player_id} after {max_retries} attempts.")
-    return None
-
-def retry_fetch_shotchart(player_id, season, max_retries=5, pause=5):
-    for attempt in range(max_retries):
-        try:
-            shots = shotchartdetail.ShotChartDetail(
-                team_id=0,
-                player_id=player_id,
-                season_type_all_star='Regular Season',
-                season_nullable=season
-            )
-            df = shots.get_data_frames()[0]
-            return df
-        except Exception as e:
-            wait = pause * (attempt + 1)
-            print(f"timeout/error for {player_id} on attempt {attempt+1}. retrying in {wait} seconds...")
-            time.sleep(wait)
-    print(f"failed to fetch data for {player_id} after {max_retries} attempts.")
-    return None
-
-def retry_fetch_shot_tracking(player_name, player_id, team_id, season, max_retries=3, pause=5):
-    for attempt in range(max_retries):
-        try:
-            shot_tracking = playerdashptshots.PlayerDashPtShots(
-                player_id=player_id,
-                team_id=team_id,
-                season=season,
-                season_type_all_star='Regular Season',
-                per_mode_simple='PerGame', # per36 not available
-            )
-            print(f"saved shot tracking data for {player_name}")
-            dataframes = shot_tracking.get_data_frames()
-            return dataframes
-        except Exception as e:
-            if attempt == max_retries - 1:
-                print(f"failed to fetch shot tracking for {player_name}")
-                return None
-            time.sleep(pause)
-    return None
-
-def fetch_save_shot_tracking_data(df, season='2024-25', delay=2):
-    
+def fetch_dashboard(player_id, season):
+    # the home/road split, the second result set
+    dash = request_result_sets(
+        playerdashboardbygeneralsplits.PlayerDashboardByGeneralSplits,
+        ['LocationPlayerDashboard'],
+        player_id=player_id,
+        season=season
+    )
+    return dash['LocationPlayerDashboard']
+
+def retry_fetch_dashboard(player_id, season):
+    try:
+        return retry_client.call('general_splits', lambda: fetch_dashboard(player_id, season), key=player_id)
+    except RetryError as e:
+        logger.warning(f"failed to fetch data for {player_id}: {e}")
+        return None
+
+def fetch_shotchart(player_id, season):
+    shots = request_result_sets(
+        shotchartdetail.ShotChartDetail,
+        ['Shot_Chart_Detail'],
+        team_id=0,
+        player_id=player_id,
+        season_type_all_star='Regular Season',
+        season_nullable=season,
+        # the default context (PTS) only returns made shots
+        context_measure_simple='FGA'
+    )
+    return shots['Shot_Chart_Detail']
+
+def retry_fetch_shotchart(player_id, season):
+    try:
+        return retry_client.call('shot_data', lambda: fetch_shotchart(player_id, season), key=player_id)
+    except RetryError as e:
+        logger.warning(f"failed to fetch data for {player_id}: {e}")
+        return None
+
+def fetch_shot_tracking(player_id, team_id, season, names=SHOT_TRACKING_NAMES):
+    """ the named shot tracking result sets, in the order of names (None where the response lacks one) """
+    shot_tracking = request_result_sets(
+        playerdashptshots.PlayerDashPtShots,
+        names,
+        player_id=player_id,
+        team_id=team_id,
+        season=season,
+        season_type_all_star='Regular Season',
+        per_mode_simple='PerGame', # per36 not available
+    )
+    return [shot_tracking.get(name) for name in names]
+
+def retry_fetch_shot_tracking(player_name, player_id, team_id, season, names=SHOT_TRACKING_NAMES):
+    try:
+        result_sets = retry_client.call('shot_tracking', lambda: fetch_shot_tracking(player_id, team_id, season, names),
+                                        key=player_id)
+        logger.info(f"saved shot tracking data for {player_name}")
+        return result_sets
+    except RetryError as e:
+        logger.warning(f"failed to fetch shot tracking for {player_name}: {e}")
+        return None
+
+def fetch_save_shot_tracking_data(df, season=DEFAULT_SEASON, delay=2):
+    paths = SeasonPaths(season).ensure_dirs()
     for idx, row in df.iterrows():
         player_id = row['PLAYER_ID']
         team_id = row['TEAM_ID']
         player_name = row['PLAYER_NAME']
         
-        dataframe_names = [
-            'ClosestDefender10ftPlusShooting',
-            'ClosestDefenderShooting', 
-            'DribbleShooting',
-            'GeneralShooting',
-            'Overall',
-            'ShotClockShooting',
-            'TouchTimeShooting'
-        ]
+        dataframe_names = SHOT_TRACKING_NAMES
         
         # check if any shot tracking files are missing
         missing_files = []
         for name in dataframe_names:
-            filepath = f'data/raw/{player_id}_{name}.csv'
+            filepath = paths.raw_file(name, player_id)
             if not os.path.exists(filepath):
                 missing_files.append(name)
         
         if missing_files:
-            tracking_data = retry_fetch_shot_tracking(player_name, player_id, team_id, season)
+            tracking_data = retry_fetch_shot_tracking(player_name, player_id, team_id, season, missing_files)
             
             if tracking_data:
-                for i, df_track in enumerate(tracking_data):
-                    if not df_track.empty and i < len(dataframe_names):
-                        filename = f'data/raw/{player_id}_{dataframe_names[i]}.csv'
-                        df_track.to_csv(filename, index=False)
+                for name, result_set in zip(missing_files, tracking_data):
+                    if result_set is not None and not result_set.empty:
+                        result_set.write_csv(paths.raw_file(name, player_id))
             # only sleep if we actually fetched data
             time.sleep(delay)
         else:
-            print(f"shot tracking data for {player_name} already exists, skipping.")
-
-def retry_fetch_hustle_stats(season, max_retries=3, pause=5):
-    for attempt in range(max_retries):
-        try:
-            hustle = leaguehustlestatsplayer.LeagueHustleStatsPlayer(
-                per_mode_time='PerGame',
-                season=season,
-                season_type_all_star='Regular Season'
-            )
-            df = hustle.get_data_frames()[0]
-            return df
-        except Exception as e:
-            wait = pause * (attempt + 1)
-            print(f"timeout/error for hustle stats on attempt {attempt+1}. retrying in {wait} seconds...")
-            time.sleep(wait)
-    print(f"failed to fetch hustle stats after {max_retries} attempts.")
-    return None
-
-def retry_fetch_clutch_stats(season, max_retries=3, pause=5):
-    for attempt in range(max_retries):
-        try:
-            clutch = leaguedashplayerclutch.LeagueDashPlayerClutch(
-                league_id_nullable='00',
-                ahead_behind='Ahead or Behind',
-                clutch_time='Last 5 Minutes',
-                measure_type_detailed_defense='Base',
-                per_mode_detailed='PerGame',
-                season=season,
-                season_type_all_star='Regular Season'
-            )
-            df = clutch.get_data_frames()[0]
-            return df
-        except Exception as e:
-            wait = pause * (attempt + 1)
-            print(f"timeout/error for clutch stats on attempt {attempt+1}. retrying in {wait} seconds...")
-            time.sleep(wait)
-    print(f"failed to fetch clutch stats after {max_retries} attempts.")
-    return None
-
-def retry_fetch_passing_data(player_id, team_id, season, max_retries=3, pause=5):
-    for attempt in range(max_retries):
-        try:
-            passing = playerdashptpass.PlayerDashPtPass(
-                player_id=player_id,
-                team_id=team_id,
-                season=season,
-                season_type_all_star='Regular Season',
-                per_mode_simple='PerGame'
-            )
-            dataframes = passing.get_data_frames()
-            return dataframes
-        except Exception as e:
-            wait = pause * (attempt + 1)
-            print(f"timeout/error for {player_id} passing data on attempt {attempt+1}. retrying in {wait} seconds...")
-            time.sleep(wait)
-    print(f"failed to fetch passing data for {player_id} after {max_retries} attempts.")
-    return None
-
-def fetch_save_basketball_iq_data(season='2024-25'):
+            logger.info(f"shot tracking data for {player_name} already exists, skipping.")
+
+def fetch_hustle_stats(season):
+    hustle = request_result_sets(
+        leaguehustlestatsplayer.LeagueHustleStatsPlayer,
+        ['HustleStatsPlayer'],
+        per_mode_time='PerGame',
+        season=season,
+        season_type_all_star='Regular Season'
+    )
+    return hustle['HustleStatsPlayer']
+
+def retry_fetch_hustle_stats(season):
+    try:
+        return retry_client.call('hustle_stats', lambda: fetch_hustle_stats(season), key='league')
+    except RetryError as e:
+        logger.warning(f"failed to fetch hustle stats: {e}")
+        return None
+
+def fetch_clutch_stats(season):
+    clutch = request_result_sets(
+        leaguedashplayerclutch.LeagueDashPlayerClutch,
+        ['LeagueDashPlayerClutch'],
+        league_id_nullable='00',
+        ahead_behind='Ahead or Behind',
+        clutch_time='Last 5 Minutes',
+        measure_type_detailed_defense='Base',
+        per_mode_detailed='PerGame',
+        season=season,
+        season_type_all_star='Regular Season'
+    )
+    return clutch['LeagueDashPlayerClutch']
+
+def retry_fetch_clutch_stats(season):
+    try:
+        return retry_client.call('clutch_stats', lambda: fetch_clutch_stats(season), key='league')
+    except RetryError as e:
+        logger.warning(f"failed to fetch clutch stats: {e}")
+        return None
+
+def fetch_passing_data(player_id, team_id, season, names=PASSING_NAMES):
+    """ the named passing result sets, in the order of names (None where the response lacks one) """
+    passing = request_result_sets(
+        playerdashptpass.PlayerDashPtPass,
+        names,
+        player_id=player_id,
+        team_id=team_id,
+        season=season,
+        season_type_all_star='Regular Season',
+        per_mode_simple='PerGame'
+    )
+    return [passing.get(name) for name in names]
+
+def retry_fetch_passing_data(player_id, team_id, season, names=PASSING_NAMES):
+    try:
+        return retry_client.call('passing', lambda: fetch_passing_data(player_id, team_id, season, names), key=player_id)
+    except RetryError as e:
+        logger.warning(f"failed to fetch passing data for {player_id}: {e}")
+        return None
+
+def fetch_save_basketball_iq_data(season=DEFAULT_SEASON):
+    paths = SeasonPaths(season).ensure_dirs()
     # fetch league hustle stats
-    hustle_path = 'data/raw/league_hustle_stats.csv'
+    hustle_path = paths.raw_file('league_hustle_stats')
     if not os.path.exists(hustle_path):
         hustle_data = retry_fetch_hustle_stats(season)
         if hustle_data is not None:
-            hustle_data.to_csv(hustle_path, index=False)
-            print("saved league hustle stats.")
+            hustle_data.write_csv(hustle_path)
+            logger.info("saved league hustle stats.")
     else:
-        print("league hustle stats already exists, skipping.")
+        logger.info("league hustle stats already exists, skipping.")
     
     # fetch league clutch stats  
-    clutch_path = 'data/raw/league_clutch_stats.csv'
+    clutch_path = paths.raw_file('league_clutch_stats')
     if not os.path.exists(clutch_path):
         clutch_data = retry_fetch_clutch_stats(season)
         if clutch_data is not None:
-            clutch_data.to_csv(clutch_path, index=False)
-            print("saved league clutch stats.")
+            clutch_data.write_csv(clutch_path)
+            logger.info("saved league clutch stats.")
     else:
-        print("league clutch stats already exists, skipping.")
+        logger.info("league clutch stats already exists, skipping.")
 
-def fetch_save_passing_data(df, season='2024-25', delay=8):
+def fetch_save_passing_data(df, season=DEFAULT_SEASON, delay=8):
+    paths = SeasonPaths(season).ensure_dirs()
     for idx, row in df.iterrows():
         player_id = row['PLAYER_ID']
         team_id = row['TEAM_ID']
         player_name = row['PLAYER_NAME']
         
-        dataframe_names = [
-            'PassesMade',
-            'PassesReceived'
-        ]
+        dataframe_names = PASSING_NAMES
         
         # check if any passing files are missing
         missing_files = []
         for name in dataframe_names:
-            filepath = f'data/raw/{player_id}_{name}.csv'
+            filepath = paths.raw_file(name, player_id)
             if not os.path.exists(filepath):
                 missing_files.append(name)
         
         if missing_files:
-            passing_data = retry_fetch_passing_data(player_id, team_id, season)
+            passing_data = retry_fetch_passing_data(player_id, team_id, season, missing_files)
             
             if passing_data:
-                for i, df_pass in enumerate(passing_data):
-                    if not df_pass.empty and i < len(dataframe_names):
-                        filename = f'data/raw/{player_id}_{dataframe_names[i]}.csv'
-                        df_pass.to_csv(filename, index=False)
-                        print(f"saved {dataframe_names[i]} for {player_name}.")
+                for name, result_set in zip(missing_files, passing_data):
+                    if result_set is not None and not result_set.empty:
+                        result_set.write_csv(paths.raw_file(name, player_id))
+                        logger.info(f"saved {name} for {player_name}.")
             # only sleep if we actually fetched data
             time.sleep(delay)
         else:
-            print(f"passing data for {player_name} already exists, skipping.")
+            logger.info(f"passing data for {player_name} already exists, skipping.")
+
+# raw data goes to the parquet store when pyarrow is available, else per-player CSVs
+DEFAULT_STORAGE = 'parquet' if storage.pa is not None else 'csv'
+
+def write_table(table, name, season, storage_format, player_id=None):
+    """
+    write a result set (or a DataFrame, e.g. from a stub fetcher) to the store
+    or its raw CSV. returns the CSV's hash, None for the store
+    """
+    if storage_format == 'parquet':
+        if hasattr(table, 'write_parquet'):
+            table.write_parquet(name, season, player_id)
+        elif player_id is None:
+            storage.write_frame(name, season, table)
+        else:
+            storage.write_player_frame(name, season, player_id, table)
+        return None
+
+    path = SeasonPaths(season).raw_file(name, player_id)
+    if hasattr(table, 'write_csv'):
+        table.write_csv(path)
+    else:
+        table.to_csv(path, index=False)
+    return file_hash(path)
+
+def save_frames(frames, names, player_id, player_name, season=DEFAULT_SEASON, storage_format=DEFAULT_STORAGE,
+                manifest=None, games_played=None):
+    """
+    write each non-empty result set to the store or the season's
+    raw/{player_id}_{name}.csv. frames are ingest.ResultSets (written straight
+    from the response rows) or DataFrames; None is skipped
+    """
+    for name, df_out in zip(names, frames):
+        if df_out is None:
+            continue
+        content_hash = None
+        if not df_out.empty:
+            content_hash = write_table(df_out, name, season, storage_format, player_id)
+            logger.info(f"saved {name} for {player_name}.")
+        instrumentation.count(f'rows.{name}', len(df_out))
+        if df_out.empty:
+            instrumentation.count(f'rows.{name}.empty_results')
+
+        # empty result sets are recorded too, so they aren't refetched every run
+        if manifest is not None:
+            manifest.record(season, name, player_id, df_out, storage_format,
+                            games_played=games_played, content_hash=content_hash)
+
+# endpoint -> (fetcher(row, season) returning a list of result sets, file names)
+PLAYER_ENDPOINTS = {
+    'general_splits': (lambda row, season: [fetch_dashboard(row['PLAYER_ID'], season)], ['general_splits']),
+    'shot_data': (lambda row, season: [fetch_shotchart(row['PLAYER_ID'], season)], ['shot_data']),
+    'shot_tracking': (lambda row, season: fetch_shot_tracking(row['PLAYER_ID'], row['TEAM_ID'], season), SHOT_TRACKING_NAMES),
+    'passing': (lambda row, season: fetch_passing_data(row['PLAYER_ID'], row['TEAM_ID'], season), PASSING_NAMES)
+}
+
+# endpoint -> (fetcher(season), table name)
+LEAGUE_ENDPOINTS = {
+    'hustle_stats': (fetch_hustle_stats, 'league_hustle_stats'),
+    'clutch_stats': (fetch_clutch_stats, 'league_clutch_stats')
+}
+
+def build_fetch_jobs(df, season=DEFAULT_SEASON, player_endpoints=None, league_endpoints=None,
+                     storage_format=DEFAULT_STORAGE, manifest=None, ttl=None):
+    """
+    one FetchJob per (player, endpoint) needing a fetch, plus one per league
+    table. endpoint maps can be swapped out for stubs.
+
+    without a manifest anything already on disk is skipped. with one, data is
+    refetched when it has no entry, is older than ttl seconds, was fetched at
+    a different games played count, or no longer matches what was recorded
+    (truncated/edited CSV, missing store rows)
+    """
+    if player_endpoints is None:
+        player_endpoints = PLAYER_ENDPOINTS
+    if league_endpoints is None:
+        league_endpoints = LEAGUE_ENDPOINTS
+    paths = SeasonPaths(season)
+    if storage_format == 'csv':
+        paths.ensure_dirs()
+
+    def exists(player_id, name):
+        if storage_format == 'parquet':
+            return storage.has_endpoint(name, season) if player_id == LEAGUE else int(player_id) in stored_counts(name)
+        return os.path.exists(paths.raw_file(name, None if player_id == LEAGUE else player_id))
+
+    counts_cache = {}
+    def stored_counts(name):
+        if name not in counts_cache:
+            counts_cache[name] = stored_row_counts(name, season)
+        return counts_cache[name]
+
+    entries_cache = {}
+    def needs_fetch(player_id, name, games_played=None):
+        if manifest is None:
+            return not exists(player_id, name)
+
+        if name not in entries_cache:
+            entries_cache[name] = manifest.entries(season, name)
+        entry = entries_cache[name].get(int(player_id))
+        if manifest.is_stale(entry, ttl=ttl, games_played=games_played):
+            return True
+        if entry['row_count'] == 0:
+            return False
+
+        if storage_format == 'parquet':
+            if player_id == LEAGUE:
+                return not storage.has_endpoint(name, season)
+            return stored_counts(name).get(int(player_id), 0) != entry['row_count']
+        return not csv_intact(entry, paths.raw_file(name, None if player_id == LEAGUE else player_id))
+
+    jobs = []
+    for endpoint, (fetcher, name) in league_endpoints.items():
+        if not needs_fetch(LEAGUE, name):
+            continue
+
+        def run(fetcher=fetcher, name=name, endpoint=endpoint):
+            table = fetcher(season)
+            content_hash = write_table(table, name, season, storage_format)
+            logger.info(f"saved league {endpoint}.")
+            if manifest is not None:
+                manifest.record(season, name, LEAGUE, table, storage_format, content_hash=content_hash)
+
+        jobs.append(FetchJob(endpoint, 'league', run))
+
+    for _, row in df.iterrows():
+        player_id = row['PLAYER_ID']
+        player_name = row['PLAYER_NAME']
+        games_played = row.get('GP')
+
+        for endpoint, (fetcher, names) in player_endpoints.items():
+            if not any(needs_fetch(player_id, name, games_played) for name in names):
+                continue
+
+            def run(row=row, fetcher=fetcher, names=names, player_id=player_id, player_name=player_name,
+                    games_played=games_played):
+                save_frames(fetcher(row, season), names, player_id, player_name, season, storage_format,
+                            manifest=manifest, games_played=games_played)
+
+            jobs.append(FetchJob(endpoint, player_name, run))
+
+    return jobs
+
+def endpoint_names():
+    """ every raw table name: player result sets, then league tables """
+    return [name for _, names in PLAYER_ENDPOINTS.values() for name in names] + [name for _, name in LEAGUE_ENDPOINTS.values()]
+
+def migrate_raw_tables(season=DEFAULT_SEASON):
+    """
+    move raw CSVs (e.g. from an earlier csv-mode fetch) into the store for
+    every table the store doesn't have yet, so parquet runs don't refetch them
+    """
+    paths = SeasonPaths(season)
+    missing = [name for name in endpoint_names() if not storage.has_endpoint(name, season)
+               and glob.glob(paths.raw_file(name, '*') if not name.startswith('league_') else paths.raw_file(name))]
+    if missing:
+        logger.info(f"migrating raw CSVs for {len(missing)} tables into the store.")
+        storage.migrate_raw_csvs(season, paths.raw_dir, endpoints=missing)
+    return missing
+
+def backfill_manifest(df, manifest, season=DEFAULT_SEASON, storage_format=DEFAULT_STORAGE):
+    """
+    record data fetched before the manifest existed, timestamped with the file's
+    mtime and the population's current games played, so it isn't all refetched.
+    in parquet mode raw CSVs the store doesn't have are migrated first
+    """
+    paths = SeasonPaths(season)
+    if storage_format == 'parquet':
+        migrate_raw_tables(season)
+    games_played = dict(zip(df['PLAYER_ID'].astype(int), df['GP']))
+    names = [name for _, names in PLAYER_ENDPOINTS.values() for name in names]
+    recorded = 0
+
+    for name in names:
+        known = manifest.entries(season, name)
+        if storage_format == 'parquet':
+            if not storage.has_endpoint(name, season):
+                continue
+            stored = storage.load_endpoint(name, season)
+            fetched_at = max(os.path.getmtime(path) for path in glob.glob(f'{storage.partition_dir(name, season)}/*.parquet'))
+            for player_id, rows in stored.groupby('PLAYER_ID'):
+                if int(player_id) not in known:
+                    rows = rows.drop(columns='PLAYER_ID').reset_index(drop=True)
+                    manifest.record(season, name, player_id, rows, storage_format,
+                                    games_played=games_played.get(int(player_id)), fetched_at=fetched_at)
+                    recorded += 1
+        else:
+            for player_id in games_played:
+                path = paths.raw_file(name, player_id)
+                if player_id not in known and os.path.exists(path):
+                    manifest.record(season, name, player_id, pd.read_csv(path), storage_format,
+                                    games_played=games_played[player_id], content_hash=file_hash(path),
+                                    fetched_at=os.path.getmtime(path))
+                    recorded += 1
+
+    for _, name in LEAGUE_ENDPOINTS.values():
+        if manifest.get(season, name) is not None:
+            continue
+        if storage_format == 'parquet' and storage.has_endpoint(name, season):
+            paths = glob.glob(f'{storage.partition_dir(name, season)}/*.parquet')
+            manifest.record(season, name, LEAGUE, storage.load_endpoint(name, season), storage_format,
+                            fetched_at=max(os.path.getmtime(path) for path in paths))
+            recorded += 1
+        elif storage_format == 'csv' and os.path.exists(paths.raw_file(name)):
+            path = paths.raw_file(name)
+            manifest.record(season, name, LEAGUE, pd.read_csv(path), storage_format,
+                            content_hash=file_hash(path), fetched_at=os.path.getmtime(path))
+            recorded += 1
+
+    logger.info(f"backfilled {recorded} manifest entries.")
+
+def fetch_save_all_concurrent(df, season=DEFAULT_SEASON, requests_per_second=1.0, max_workers=4,
+                              storage_format=DEFAULT_STORAGE, manifest=None, ttl=None):
+    """
+    fetch every missing player/league file through a thread pool. one shared
+    token bucket paces all endpoints instead of per-endpoint sleeps
+    """
+    if storage_format == 'parquet':
+        migrate_raw_tables(season)
+    jobs = build_fetch_jobs(df, season, storage_format=storage_format, manifest=manifest, ttl=ttl)
+    logger.info(f"{len(jobs)} fetch jobs queued.")
+    if not jobs:
+        return [], []
+
+    limiter = TokenBucket(rate=requests_per_second)
+    succeeded, failed = run_fetch_jobs(jobs, limiter, retry_client, max_workers=max_workers)
+
+    logger.info(f"fetched {len(succeeded)}/{len(jobs)} jobs.")
+    for job in failed:
+        logger.warning(f"  failed: {job.endpoint} for {job.key} - {job.error}")
+
+    for endpoint, stats in retry_client.latency_summary().items():
+        logger.info(f"  {endpoint}: {stats}")
+
+    if storage_format == 'parquet':
+        # fold this run's per-player fragments into one file per endpoint
+        with instrumentation.timer('store.compact'):
+            for name in endpoint_names():
+                storage.compact_endpoint(name, season)
+
+    return succeeded, failed
 
 if __name__ == "__main__":
     
-    top300 = fetch_top_300_ppg()
-    
-    fetch_save_advanced_data(top300)
-    fetch_save_shot_tracking_data(top300)
-    fetch_save_basketball_iq_data()
-    fetch_save_passing_data(top300)
-    
\ No newline at end of file
+    # incremental: refetch players whose games played changed, plus anything over a week old
+    # python fetch_data.py [season] [top_ppg|minutes|league]
+    season = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SEASON
+    mode = sys.argv[2] if len(sys.argv) > 2 else 'top_ppg'
+    with run_report('fetch'):
+        manifest = FetchManifest()
+        population = fetch_player_population(season, mode, manifest=manifest)
+        backfill_manifest(population, manifest, season)
+
+        fetch_save_all_concurrent(population, season, manifest=manifest, ttl=7 * 24 * 60 * 60)
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+import storage
+
+MANIFEST_PATH = 'data/fetch_manifest.sqlite'
+
+# player_id used for league-wide tables
+LEAGUE = 0
+
+def schema_hash(df):
+    """ hash of column names and dtypes, in order """
+    schema = ','.join(f'{col}:{dtype}' for col, dtype in df.dtypes.items())
+    return hashlib.sha256(schema.encode()).hexdigest()[:16]
+
+def frame_hash(df):
+    """ hash of a frame's values, independent of its index (or an ingest.ResultSet's own content hash) """
+    if hasattr(df, 'content_hash'):
+        return df.content_hash()
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha256(row_hashes.tobytes()).hexdigest()[:16]
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+class FetchManifest:
+    """
+    per (season, endpoint, player) record of what was fetched: when, how many
+    rows, schema and content hashes, and the player's games played at the time.
+    safe to share between fetch threads
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                season TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                player_id INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                row_count INTEGER NOT NULL,
+                schema_hash TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                storage TEXT NOT NULL,
+                games_played INTEGER,
+                PRIMARY KEY (season, endpoint, player_id)
+            )
+        ''')
+        self.conn.commit()
+
+    def record(self, season, endpoint, player_id, df, storage_format, games_played=None,
+               content_hash=None, fetched_at=None):
+        """ record a save. for CSVs pass the file's hash so truncation can be detected later """
+        row = (season, endpoint, int(player_id), fetched_at or time.time(), len(df), schema_hash(df),
+               content_hash or frame_hash(df), storage_format,
+               None if games_played is None else int(games_played))
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+            self.conn.commit()
+
+    def get(self, season, endpoint, player_id=LEAGUE):
+        with self.lock:
+            cursor = self.conn.execute(
+                'SELECT * FROM entries WHERE season = ? AND endpoint = ? AND player_id = ?',
+                (season, endpoint, int(player_id)))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([col[0] for col in cursor.description], row))
+
+    def entries(self, season, endpoint):
+        """ player_id -> entry for one endpoint """
+        with self.lock:
+            cursor = self.conn.execute('SELECT * FROM entries WHERE season = ? AND endpoint = ?', (season, endpoint))
+            names = [col[0] for col in cursor.description]
+            return {row[2]: dict(zip(names, row)) for row in cursor.fetchall()}
+
+    def is_stale(self, entry, ttl=None, games_played=None, now=None):
+        """ missing, older than ttl seconds, or fetched at a different games played count """
+        if entry is None:
+            return True
+        if ttl is not None and (now or time.time()) - entry['fetched_at'] > ttl:
+            return True
+        if games_played is not None and entry['games_played'] is not None and int(games_played) != entry['games_played']:
+            return True
+        return False
+
+    def close(self):
+        self.conn.close()
+
+def csv_intact(entry, path):
+    """ the CSV still exists and hashes to what was recorded """
+    return os.path.exists(path) and file_hash(path) == entry['content_hash']
+
+def stored_row_counts(endpoint, season, store_dir=storage.STORE_DIR):
+    """ player_id -> rows in the parquet store for one endpoint """
+    if not storage.has_endpoint(endpoint, season, store_dir):
+        return {}
+    ids = storage.load_endpoint(endpoint, season, columns=['PLAYER_ID'], store_dir=store_dir)['PLAYER_ID']
+    return ids.value_counts().to_dict()
@@ -0,0 +1,359 @@
+import argparse
+import collections
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from nba_api.stats.library.http import NBAStatsHTTP
+
+import fetch_data
+from fetch_data import fetch_player_population, fetch_save_all_concurrent, POPULATION_MODES
+from instrumentation import run_report
+from retry_policy import RetryClient, RetryPolicy
+from seasons import DEFAULT_SEASON
+
+FIXTURE_DIR = 'data/fixtures'
+
+HOST = '127.0.0.1'
+PORT = 8766
+
+logger = logging.getLogger(__name__)
+
+def request_key(endpoint, parameters):
+    """
+    'endpoint?A=1&B=2': the request as the API sees it, parameters sorted and
+    None dropped (requests leaves those out of the query string), so in-process
+    replay and the stand-in server look up the same fixture
+    """
+    query = '&'.join(f'{name}={value}' for name, value in sorted(parameters.items()) if value is not None)
+    return f'{endpoint.lower()}?{query}'
+
+def fixture_path(fixture_dir, key):
+    """ {fixture_dir}/{endpoint}/{hash of the request}.json """
+    endpoint = key.split('?', 1)[0]
+    return f"{fixture_dir}/{endpoint}/{hashlib.sha256(key.encode()).hexdigest()[:16]}.json"
+
+class Recorder:
+    """
+    while active, every successful stats API response is also saved as a
+    fixture. patches NBAStatsHTTP.send_api_request, which both nba_api's own
+    get_request and fetch_data.request_result_sets go through
+    """
+
+    def __init__(self, fixture_dir=FIXTURE_DIR):
+        self.fixture_dir = fixture_dir
+        self.recorded = 0
+        self.lock = threading.Lock()
+        self.original = None
+
+    def __enter__(self):
+        self.original = NBAStatsHTTP.send_api_request
+        recorder = self
+
+        def send_api_request(http, endpoint, parameters, *args, **kwargs):
+            response = recorder.original(http, endpoint, parameters, *args, **kwargs)
+            # throttled or failed bodies aren't worth replaying
+            if getattr(response, '_status_code', None) == 200:
+                recorder.save(endpoint, parameters, response)
+            return response
+
+        NBAStatsHTTP.send_api_request = send_api_request
+        return self
+
+    def __exit__(self, *exc):
+        NBAStatsHTTP.send_api_request = self.original
+
+    def save(self, endpoint, parameters, response):
+        key = request_key(endpoint, parameters)
+        path = fixture_path(self.fixture_dir, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fixture = {'request': key, 'url': response.get_url(), 'recorded_at': time.time(),
+                   'response': response.get_response()}
+        with open(path + '.tmp', 'w') as f:
+            json.dump(fixture, f)
+        os.replace(path + '.tmp', path)
+        with self.lock:
+            self.recorded += 1
+
+class Replayer:
+    """
+    answers stats API requests from recorded fixtures, with injected faults:
+
+    latency     seconds added to every response, plus uniform(0, jitter)
+    error_rate  fraction of requests answered with a 500
+    throttle_rate  fraction answered with a 429
+    rate_limit  requests per second accepted (sliding one second window);
+                anything over it gets a 429, like the real API's throttling
+
+    latency and the error/throttle draws are seeded per (request, attempt),
+    so a run sees the same faults on the same requests whatever order its
+    threads get there in. only rate_limit depends on timing. a request with
+    no fixture gets a 404, which the retry policy doesn't retry
+    """
+
+    def __init__(self, fixture_dir=FIXTURE_DIR, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 rate_limit=None, seed=0):
+        self.fixture_dir = fixture_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.seed = seed
+        self.attempts = collections.Counter()
+        self.outcomes = collections.Counter()
+        self.accepted = collections.deque()
+        self.lock = threading.Lock()
+        self.original = None
+
+    def respond(self, endpoint, parameters):
+        """ (status code, body) for one request """
+        key = request_key(endpoint, parameters)
+        with self.lock:
+            self.attempts[key] += 1
+            attempt = self.attempts[key]
+        rng = random.Random(f'{self.seed}:{key}:{attempt}')
+        time.sleep(self.latency + rng.uniform(0, self.jitter))
+
+        draw = rng.random()
+        if self.over_rate_limit():
+            status, outcome = 429, 'rate_limited'
+        elif draw < self.throttle_rate:
+            status, outcome = 429, 'throttled'
+        elif draw < self.throttle_rate + self.error_rate:
+            status, outcome = 500, 'error'
+        else:
+            path = fixture_path(self.fixture_dir, key)
+            if os.path.exists(path):
+                with open(path) as f:
+                    body = json.load(f)['response']
+                status, outcome = 200, 'served'
+            else:
+                status, outcome = 404, 'missing'
+                logger.warning(f"no fixture for {key}")
+
+        with self.lock:
+            self.outcomes[outcome] += 1
+        if status != 200:
+            body = json.dumps({'Message': f'replayed {status}'})
+        return status, body
+
+    def over_rate_limit(self):
+        if self.rate_limit is None:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            while self.accepted and now - self.accepted[0] >= 1.0:
+                self.accepted.popleft()
+            if len(self.accepted) >= self.rate_limit:
+                return True
+            self.accepted.append(now)
+            return False
+
+    def stats(self):
+        with self.lock:
+            return {'requests': sum(self.outcomes.values()), **dict(sorted(self.outcomes.items()))}
+
+    def __enter__(self):
+        """ answer nba_api requests in-process, without a socket """
+        self.original = NBAStatsHTTP.send_api_request
+        replayer = self
+
+        def send_api_request(http, endpoint, parameters, *args, **kwargs):
+            status, body = replayer.respond(endpoint, parameters)
+            return http.nba_response(response=body, status_code=status,
+                                     url=f'replay://{request_key(endpoint, parameters)}')
+
+        NBAStatsHTTP.send_api_request = send_api_request
+        return self
+
+    def __exit__(self, *exc):
+        NBAStatsHTTP.send_api_request = self.original
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    # see query_service.QueryHandler
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    replayer = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'stats':
+            status, body = 404, json.dumps({'Message': f'no endpoint at {url.path}'})
+        else:
+            query = {name: values[-1] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+            status, body = self.replayer.respond(parts[1], query)
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+def make_server(replayer, host=HOST, port=PORT):
+    """ a stand-in for stats.nba.com answering GET /stats/{endpoint}?... from replayer (port 0 picks a free port) """
+    handler = type('BoundReplayHandler', (ReplayHandler,), {'replayer': replayer})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+@contextlib.contextmanager
+def pointed_at(server):
+    """ send nba_api's requests to a stand-in server instead of stats.nba.com """
+    host, port = server.server_address[:2]
+    original = NBAStatsHTTP.base_url
+    NBAStatsHTTP.base_url = f'http://{host}:{port}/stats/{{endpoint}}'
+    try:
+        yield server
+    finally:
+        NBAStatsHTTP.base_url = original
+
+@contextlib.contextmanager
+def scratch_dir(path=None):
+    """
+    run in an empty working directory, so the fetch writes its raw files,
+    store and manifest there and requests everything instead of skipping
+    what data/ already has. a temporary one, removed afterwards, unless path
+    is given; that one is created if needed and kept
+    """
+    cwd = os.getcwd()
+    keep = path is not None
+    if keep:
+        os.makedirs(path, exist_ok=True)
+    else:
+        path = tempfile.mkdtemp(prefix='fetch_replay-')
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(cwd)
+        if not keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+@contextlib.contextmanager
+def replay_retry_client(client):
+    """ fetch_data's module-wide retry client swapped for client, put back on exit """
+    original = fetch_data.retry_client
+    fetch_data.retry_client = client
+    try:
+        yield client
+    finally:
+        fetch_data.retry_client = original
+
+def fetch_all(season, mode, requests_per_second, max_workers, storage_format):
+    """ the fetch_data.py run, without a manifest: population, then every player and league table """
+    population = fetch_player_population(season, mode)
+    succeeded, failed = fetch_save_all_concurrent(population, season, requests_per_second, max_workers,
+                                                  storage_format=storage_format)
+    return population, succeeded, failed
+
+def record(season=DEFAULT_SEASON, mode='top_ppg', fixture_dir=FIXTURE_DIR, requests_per_second=1.0, max_workers=4,
+           storage_format=fetch_data.DEFAULT_STORAGE):
+    """ run a full fetch against the live API, saving every response as a fixture """
+    fixture_dir = os.path.abspath(fixture_dir)
+    with Recorder(fixture_dir) as recorder, scratch_dir():
+        _, succeeded, failed = fetch_all(season, mode, requests_per_second, max_workers, storage_format)
+    logger.info(f"recorded {recorder.recorded} responses to {fixture_dir} ({len(succeeded)} jobs ok, {len(failed)} failed)")
+    return recorder.recorded
+
+def replay(season=DEFAULT_SEASON, mode='top_ppg', fixture_dir=FIXTURE_DIR, requests_per_second=1.0, max_workers=4,
+           storage_format=fetch_data.DEFAULT_STORAGE, retry_policy=None, via_server=False, work_dir=None,
+           reset_timeout=60.0, **faults):
+    """
+    run a full fetch against recorded fixtures, in-process or through the
+    stand-in server, with a fresh retry client whose breakers stay open for
+    reset_timeout seconds. the fetched files are thrown away unless work_dir
+    is given to run in. returns a summary: wall time, jobs, what the replayer
+    served and the retry client's per-endpoint latency
+    """
+    replayer = Replayer(os.path.abspath(fixture_dir), **faults)
+    if work_dir is not None:
+        work_dir = os.path.abspath(work_dir)
+    client = RetryClient(policy=retry_policy, reset_timeout=reset_timeout)
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(replay_retry_client(client))
+        if via_server:
+            server = make_server(replayer, port=0)
+            threading.Thread(target=server.serve_forever, name='fetch-replay-server', daemon=True).start()
+            stack.callback(server.server_close)
+            stack.callback(server.shutdown)
+            stack.enter_context(pointed_at(server))
+        else:
+            stack.enter_context(replayer)
+        stack.enter_context(scratch_dir(work_dir))
+        population, succeeded, failed = fetch_all(season, mode, requests_per_second, max_workers, storage_format)
+
+    return {
+        'players': len(population),
+        'wall_s': round(time.perf_counter() - start, 3),
+        'jobs_ok': len(succeeded),
+        'jobs_failed': len(failed),
+        'replayer': replayer.stats(),
+        'endpoints': client.latency_summary()
+    }
+
+def fault_options(args):
+    return {'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate,
+            'throttle_rate': args.throttle_rate, 'rate_limit': args.rate_limit, 'seed': args.seed}
+
+if __name__ == "__main__":
+    # python fetch_replay.py record [season] [mode]
+    # python fetch_replay.py replay [season] [mode] [--latency 0.3 --error-rate 0.05 --rate-limit 2 --rps 4 ...]
+    # python fetch_replay.py serve [--port 8766 --latency 0.3 ...]
+    parser = argparse.ArgumentParser(description='record stats API responses, then replay them offline')
+    parser.add_argument('command', choices=['record', 'replay', 'serve'])
+    parser.add_argument('season', nargs='?', default=DEFAULT_SEASON)
+    parser.add_argument('mode', nargs='?', default='top_ppg', choices=POPULATION_MODES)
+    parser.add_argument('--fixtures', default=FIXTURE_DIR)
+    parser.add_argument('--rps', type=float, default=1.0, help='fetch scheduler requests per second')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--storage', default=fetch_data.DEFAULT_STORAGE, choices=['parquet', 'csv'])
+    parser.add_argument('--base-delay', type=float, default=RetryPolicy().base_delay, help='retry backoff base, seconds')
+    parser.add_argument('--reset-timeout', type=float, default=60.0, help='circuit breaker open time, seconds')
+    parser.add_argument('--server', action='store_true', help='replay through the stand-in HTTP server')
+    parser.add_argument('--work-dir', default=None, help='keep the replayed fetch\'s files here')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=None, help='requests per second before 429s')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report_dir = os.path.abspath('data/run_reports')
+    if args.command == 'record':
+        with run_report('fetch_record', report_dir=report_dir):
+            record(args.season, args.mode, args.fixtures, args.rps, args.workers, args.storage)
+    elif args.command == 'replay':
+        with run_report('fetch_replay', report_dir=report_dir):
+            summary = replay(args.season, args.mode, args.fixtures, args.rps, args.workers, args.storage,
+                             RetryPolicy(base_delay=args.base_delay), args.server, args.work_dir,
+                             args.reset_timeout, **fault_options(args))
+        print(json.dumps(summary, indent=2))
+    else:
+        with run_report('fetch_replay_server', report_dir=report_dir):
+            replayer = Replayer(args.fixtures, **fault_options(args))
+            server = make_server(replayer, port=args.port)
+            print(f"replaying {args.fixtures} on http://{HOST}:{server.server_address[1]}/stats/<endpoint>")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+                logger.info(f"served {replayer.stats()}")
@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from retry_policy import RetryError
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """
+    thread-safe token bucket shared by every fetch worker, so all endpoints
+    draw from one requests-per-second budget.
+
+    the refill rate adapts to failures: each failure halves it (down to
+    min_rate) and each success adds back a tenth of the configured rate
+    """
+
+    def __init__(self, rate=1.0, burst=1, min_rate=0.05, clock=time.monotonic, sleep=time.sleep):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """ block until a token is available, then take it """
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+    def penalize(self):
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def reward(self):
+        with self.lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+class FetchJob:
+    """ one unit of fetch work, e.g. a single player's shot chart """
+
+    def __init__(self, endpoint, key, run):
+        self.endpoint = endpoint
+        self.key = key
+        self.run = run
+        self.attempts = 0
+        self.error = None
+
+    def __repr__(self):
+        return f"FetchJob({self.endpoint!r}, {self.key!r})"
+
+def run_fetch_jobs(jobs, limiter, client, max_workers=4):
+    """
+    run jobs through a bounded thread pool. each job goes through the retry
+    client (see retry_policy.RetryClient), which takes a token from the shared
+    limiter before every attempt, retries included.
+
+    returns (succeeded, failed) lists of jobs
+    """
+    succeeded = []
+    failed = []
+    results_lock = threading.Lock()
+
+    def work(job):
+        try:
+            client.call(job.endpoint, job.run, key=job.key, limiter=limiter)
+        except RetryError as e:
+            job.attempts = e.attempts
+            job.error = e.last_error
+            logger.warning(f"failed to fetch {job.endpoint} for {job.key} after {e.attempts} attempts.")
+            with results_lock:
+                failed.append(job)
+            return
+
+        with results_lock:
+            succeeded.append(job)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # consume the iterator so worker exceptions surface here
+        list(pool.map(work, jobs))
+
+    return succeeded, failed
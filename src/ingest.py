@@ -0,0 +1,121 @@
+import csv
+import functools
+import hashlib
+import json
+
+import storage
+
+# rows turned into columns per record batch, so converting a big shot chart
+# never holds more than one batch of column copies next to the parsed rows
+BATCH_ROWS = 20_000
+
+# pandas dtype -> pyarrow type factory
+ARROW_TYPES = {'object': 'string', 'bool': 'bool_', 'int64': 'int64', 'float64': 'float64', 'null': 'null'}
+
+def column_type(values):
+    """
+    the dtype pandas would give a column of these values: object for any
+    string, bool, int64 for whole numbers without gaps, float64 otherwise.
+    null (stored like pyarrow stores an all-None object column) when there
+    are no values at all
+    """
+    kinds = {type(value) for value in values}
+    if str in kinds:
+        return 'object'
+    if kinds <= {type(None)}:
+        return 'null'
+    if kinds - {type(None)} == {bool}:
+        return 'bool'
+    if kinds == {int}:
+        return 'int64'
+    return 'float64'
+
+class ResultSet:
+    """
+    one named result set of a stats.nba.com response, kept as the response's
+    own headers and row lists. written to CSV row by row or to the parquet
+    store in typed record batches, never through a DataFrame. column types
+    follow pandas, so fragments read back the same as the ones the DataFrame
+    path wrote
+    """
+
+    def __init__(self, name, headers, rows):
+        self.name = name
+        self.headers = list(headers)
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def empty(self):
+        return not self.rows
+
+    @functools.cached_property
+    def types(self):
+        columns = zip(*self.rows) if self.rows else [()] * len(self.headers)
+        return [column_type(values) for values in columns]
+
+    @property
+    def dtypes(self):
+        """ column -> dtype, in order (what fetch_manifest.schema_hash reads from a frame) """
+        return {header: 'object' if dtype == 'null' else dtype for header, dtype in zip(self.headers, self.types)}
+
+    def content_hash(self):
+        """ hash of the rows as received """
+        return hashlib.sha256(json.dumps(self.rows, separators=(',', ':')).encode()).hexdigest()[:16]
+
+    def arrow_schema(self, player_id=None):
+        """ the stored schema: PLAYER_ID set (or appended) as int64 when player_id is given """
+        pa = storage.pa
+        fields = [(header, getattr(pa, ARROW_TYPES[dtype])()) for header, dtype in zip(self.headers, self.types)]
+        if player_id is not None:
+            player_field = ('PLAYER_ID', pa.int64())
+            if 'PLAYER_ID' in self.headers:
+                fields[self.headers.index('PLAYER_ID')] = player_field
+            else:
+                fields.append(player_field)
+        return pa.schema(fields)
+
+    def record_batches(self, player_id=None, batch_rows=BATCH_ROWS):
+        """ the rows as typed record batches of at most batch_rows rows """
+        pa = storage.pa
+        schema = self.arrow_schema(player_id)
+        player_column = self.headers.index('PLAYER_ID') if 'PLAYER_ID' in self.headers else len(self.headers)
+        for start in range(0, len(self.rows), batch_rows):
+            batch = self.rows[start:start + batch_rows]
+            columns = list(zip(*batch))
+            if player_id is not None:
+                column = (int(player_id),) * len(batch)
+                if player_column < len(columns):
+                    columns[player_column] = column
+                else:
+                    columns.append(column)
+            arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def write_parquet(self, endpoint, season, player_id=None, store_dir=storage.STORE_DIR):
+        """ append the rows to the store as one fragment (tagged with PLAYER_ID if given) """
+        return storage.write_batches(endpoint, season, self.arrow_schema(player_id),
+                                     self.record_batches(player_id), store_dir)
+
+    def write_csv(self, path):
+        """ header plus one line per row, written as they are read """
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(self.headers)
+            writer.writerows(self.rows)
+
+def parse_result_sets(text, names=None):
+    """
+    {name: ResultSet} from a stats.nba.com response body, for the given
+    result set names only (all by default), in response order. handles both
+    the resultSets list and the single resultSet layouts
+    """
+    data = json.loads(text)
+    results = data['resultSets'] if 'resultSets' in data else data['resultSet']
+    if isinstance(results, dict):
+        results = [results]
+    wanted = None if names is None else set(names)
+    return {result['name']: ResultSet(result['name'], result['headers'], result['rowSet'])
+            for result in results if wanted is None or result['name'] in wanted}
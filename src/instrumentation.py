@@ -0,0 +1,158 @@
+import contextlib
+import cProfile
+import functools
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+REPORT_DIR = 'data/run_reports'
+
+# latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60]
+
+logger = logging.getLogger(__name__)
+
+class TimerStats:
+    """ call count, total/max latency and a fixed-bucket latency histogram """
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def to_dict(self):
+        labels = [f'<={bound}s' for bound in LATENCY_BUCKETS] + [f'>{LATENCY_BUCKETS[-1]}s']
+        return {
+            'calls': self.calls,
+            'total_s': round(self.total, 6),
+            'mean_s': round(self.total / self.calls, 6) if self.calls else None,
+            'max_s': round(self.max, 6),
+            'histogram': {label: count for label, count in zip(labels, self.buckets) if count}
+        }
+
+class Instrumentation:
+    """
+    named timers and counters for one run, safe to share between fetch
+    threads. names are dotted: fetch.{endpoint}, metric.{metric}.nan, io.csv_bytes
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+            self.started = time.time()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            if name not in self.timers:
+                self.timers[name] = TimerStats()
+            self.timers[name].observe(seconds)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """ decorator form of timer """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def report(self, **extra):
+        with self.lock:
+            return {
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                'duration_s': round(time.time() - self.started, 3),
+                **extra,
+                'timers': {name: stats.to_dict() for name, stats in sorted(self.timers.items())},
+                'counters': dict(sorted(self.counters.items()))
+            }
+
+    def write_report(self, stage, report_dir=REPORT_DIR, **extra):
+        """
+        save the report as {stage}-{date}-{time}-{ms}-{pid}.json. the file is
+        created exclusively (with a -1, -2... suffix if taken), so runs or
+        stages finishing in the same millisecond never overwrite each other
+        """
+        os.makedirs(report_dir, exist_ok=True)
+        now = time.time()
+        base = f"{report_dir}/{stage}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now % 1 * 1000):03d}-{os.getpid()}"
+        for attempt in itertools.count():
+            path = f'{base}-{attempt}.json' if attempt else f'{base}.json'
+            try:
+                f = open(path, 'x')
+            except FileExistsError:
+                continue
+            with f:
+                json.dump(self.report(stage=stage, **extra), f, indent=2)
+            return path
+
+# the process-wide instance every stage records into
+instrumentation = Instrumentation()
+
+def setup_logging(level=logging.INFO):
+    """ progress messages as plain lines on stdout, like the prints they replaced """
+    logging.basicConfig(level=level, format='%(message)s', stream=sys.stdout)
+
+@contextlib.contextmanager
+def run_report(stage, profile=None, report_dir=REPORT_DIR):
+    """
+    instrument one pipeline run: logging is configured, counters start from
+    zero, and a JSON report is written when the block exits (even on error).
+    with profile (or NBA_IQ_PROFILE=1) the block also runs under cProfile and
+    the stats are dumped next to the report
+    """
+    setup_logging()
+    instrumentation.reset()
+    if profile is None:
+        profile = os.environ.get('NBA_IQ_PROFILE') == '1'
+    profiler = cProfile.Profile() if profile else None
+
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield instrumentation
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        path = instrumentation.write_report(stage, report_dir)
+        logger.info(f"run report saved to {path}")
+
+        if profiler is not None:
+            profiler.dump_stats(path[:-len('.json')] + '.prof')
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(15)
+            logger.info(summary.getvalue())
@@ -0,0 +1,109 @@
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from instrumentation import instrumentation
+
+CACHE_PATH = 'data/cache/metric_cache.sqlite'
+
+# least recently used entries are evicted once the cache holds more than this
+MAX_BYTES = 64 * 1024 * 1024
+
+def function_version(*functions):
+    """ hash of the functions' source, so editing a metric invalidates its entries """
+    digest = hashlib.sha256()
+    for fn in functions:
+        digest.update(inspect.getsource(fn).encode())
+    return digest.hexdigest()[:16]
+
+def cache_key(metric, version, fingerprint):
+    return hashlib.sha256(f'{metric}:{version}:{fingerprint}'.encode()).hexdigest()
+
+class MetricCache:
+    """
+    disk-backed memo of metric values, keyed by metric name, code version and
+    a content hash of the player's inputs. values are pickled so numpy types
+    round-trip exactly. bounded to max_bytes by LRU eviction
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # a commit per player; WAL without fsync on every commit keeps that cheap
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)')
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """ key -> value for the keys present; marks them as used """
+        if not keys:
+            return {}
+        with self.lock:
+            placeholders = ','.join('?' * len(keys))
+            rows = self.conn.execute(f'SELECT key, value FROM entries WHERE key IN ({placeholders})', list(keys)).fetchall()
+            if rows:
+                now = time.time()
+                self.conn.executemany('UPDATE entries SET last_used = ? WHERE key = ?', [(now, key) for key, _ in rows])
+                self.conn.commit()
+        instrumentation.count('cache.hits', len(rows))
+        instrumentation.count('cache.misses', len(keys) - len(rows))
+        return {key: pickle.loads(value) for key, value in rows}
+
+    def put_many(self, items):
+        """ store key -> value pairs, then evict down to max_bytes """
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((key, blob, len(blob), now))
+        with self.lock:
+            self.conn.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)', rows)
+            self.conn.commit()
+        self.evict()
+
+    def size(self):
+        with self.lock:
+            return self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def evict(self):
+        """ drop least recently used entries until the cache fits in max_bytes """
+        with self.lock:
+            total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            evicted = []
+            for key, size in self.conn.execute('SELECT key, size FROM entries ORDER BY last_used'):
+                if total <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                total -= size
+            self.conn.executemany('DELETE FROM entries WHERE key = ?', evicted)
+            self.conn.commit()
+        instrumentation.count('cache.evictions', len(evicted))
+        return len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM entries')
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
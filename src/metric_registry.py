@@ -0,0 +1,107 @@
+import importlib
+import os
+
+import numpy as np
+
+# comma-separated modules that register extra metrics when the registry is imported,
+# e.g. NBA_IQ_METRICS=my_metrics python batch_metrics.py
+PLUGIN_ENV = 'NBA_IQ_METRICS'
+
+class Metric:
+    """
+    one IQ metric: the inputs it reads (PlayerData input names; batch_metrics
+    builds only the wide-frame columns for these), whether higher or lower
+    values are better, whether percentiles are taken within position, its
+    weight in the composite, and compute(wide) -> one value per player row
+    """
+
+    def __init__(self, name, label, inputs, compute, weight=0.0, higher_is_better=True, by_position=False):
+        self.name = name
+        self.label = label
+        self.inputs = tuple(inputs)
+        self.compute = compute
+        self.weight = weight
+        self.higher_is_better = higher_is_better
+        self.by_position = by_position
+
+    def __repr__(self):
+        return f'Metric({self.name!r}, weight={self.weight})'
+
+# name -> Metric, in output column order
+METRICS = {}
+
+def register(name, label, inputs, weight=0.0, higher_is_better=True, by_position=False):
+    """ decorator registering a vectorized metric implementation under name """
+    def decorator(compute):
+        METRICS[name] = Metric(name, label, inputs, compute, weight, higher_is_better, by_position)
+        return compute
+    return decorator
+
+def load_plugins(modules=None):
+    """ import the modules named in NBA_IQ_METRICS (or the given list) so their metrics register """
+    if modules is None:
+        modules = [name.strip() for name in os.environ.get(PLUGIN_ENV, '').split(',') if name.strip()]
+    for module in modules:
+        importlib.import_module(module)
+
+# the built-in metrics. wide is batch_metrics.build_player_frame's frame: every
+# top300 column plus the columns each input adds (see FRAME_BUILDERS there)
+
+@register('ast_tov_ratio', 'AST/TOV Ratio', ['basic_stats'], weight=0.15)
+def ast_tov_ratio(wide):
+    # no turnovers (or unknown turnovers) counts as a perfect ratio
+    return np.where(wide['TOV'] > 0, wide['AST'] / wide['TOV'], np.inf)
+
+@register('late_clock_efficiency', 'Late Clock Efficiency', ['dribble_shooting'], weight=0.09, by_position=True)
+def late_clock_efficiency(wide):
+    # late clock needs both shot clock buckets and a nonzero combined frequency
+    late_freq = wide['LATE_FREQ'] + wide['VERY_LATE_FREQ']
+    late_eff = (wide['LATE_FG_PCT'] * wide['LATE_FREQ'] + wide['VERY_LATE_FG_PCT'] * wide['VERY_LATE_FREQ']) / late_freq
+    has_late = wide['HAS_LATE'] & wide['HAS_VERY_LATE'] & (late_freq != 0)
+    return late_eff.where(has_late, np.nan)
+
+@register('clutch_ast_tov', 'Clutch AST/TOV Ratio', ['clutch_stats', 'basic_stats'], weight=0.05)
+def clutch_ast_tov(wide):
+    # 0 clutch turnovers indicates limited clutch playtime, fall back to the
+    # regular ratio * 0.9 (or 3.0 * 0.9 without regular turnovers either)
+    regular_ast_tov = np.where(wide['TOV'] > 0, wide['AST'] / wide['TOV'], 3.0)
+    clutch = np.where(wide['CLUTCH_TOV'] > 0, wide['CLUTCH_AST'] / wide['CLUTCH_TOV'], regular_ast_tov * 0.9)
+    return np.where(wide['HAS_CLUTCH'], clutch, np.nan)
+
+@register('efg_pct', 'EFG%', ['basic_stats'], weight=0.15, by_position=True)
+def efg_pct(wide):
+    efg = (wide['FGM'] + 0.5 * wide['FG3M']) / wide['FGA']
+    return np.where(wide['FGA'] > 0, efg, 0)
+
+@register('deflections_per_36', 'Deflection Rate', ['hustle_stats'], weight=0.10)
+def deflections_per_36(wide):
+    return wide['DEFLECTIONS']
+
+@register('screen_assists_per_36', 'Screen Assist Rate', ['hustle_stats'], weight=0.10, by_position=True)
+def screen_assists_per_36(wide):
+    return wide['SCREEN_ASSISTS']
+
+@register('shooting_foul_pct', 'Shooting Foul Rate',
+          ['general_splits', 'closest_defender', 'basic_stats', 'bbref.shooting_fouls'],
+          weight=0.15, higher_is_better=False, by_position=True)
+def shooting_foul_pct(wide):
+    # shooting fouls divided by number of "contests"
+    # (opponent FGA with player as closest defender)
+    total_defended = wide['SHOTS_DEFENDED'] * wide['SPLITS_GP']
+    shooting_foul_pct = (wide['BBREF_SHOOTING_FOULS'] / total_defended) * 100
+    has_contests = wide['HAS_SPLITS'] & wide['HAS_DEFENDER'] & (total_defended != 0)
+    return shooting_foul_pct.where(has_contests, np.nan)
+
+@register('personal_foul_rate', 'Personal Foul Rate', ['bbref.basic_stats_36'], weight=0.05, higher_is_better=False)
+def personal_foul_rate(wide):
+    return wide['BBREF_PF']
+
+@register('age', 'Age', ['bbref.basic_stats_36'], weight=0.01)
+def age(wide):
+    return wide['BBREF_AGE']
+
+@register('ast_pct', 'Assist Percentage', ['bbref.advanced_stats'], weight=0.15)
+def ast_pct(wide):
+    return wide['BBREF_AST_PCT']
+
+load_plugins()
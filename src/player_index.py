@@ -0,0 +1,136 @@
+import logging
+import os
+import re
+import sys
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from seasons import DEFAULT_SEASON
+
+# the column holding basketball reference's player id (e.g. jokicni01); the
+# shooting fouls export leaves it unnamed
+BBREF_ID_COLUMNS = ['Player-additional', '-9999']
+
+# a traded player's season total row: TOT in older exports, 2TM/3TM/... now
+TOTAL_TEAM = re.compile(r'^(TOT|\d+TM)$')
+
+# generational suffixes one source has and the other often drops
+SUFFIXES = {'jr', 'sr', 'ii', 'iii', 'iv', 'v'}
+
+INDEX_COLUMNS = ['PLAYER_ID', 'PLAYER_NAME', 'BBREF_ID', 'BBREF_NAME', 'MATCH']
+
+logger = logging.getLogger(__name__)
+
+def normalize_name(name):
+    """ 'Nikola Jokić' -> 'nikola jokic', 'Jimmy Butler III' -> 'jimmy butler', 'P.J. Washington' -> 'pj washington' """
+    name = unicodedata.normalize('NFKD', str(name))
+    name = ''.join(char for char in name if not unicodedata.combining(char)).casefold()
+    tokens = re.sub(r'\W+', ' ', re.sub(r"[.'’]", '', name)).split()
+    return ' '.join(token for token in tokens if token not in SUFFIXES)
+
+def bbref_ids(df):
+    """ each row's bbref player id, or its normalized name for exports without the id column """
+    for column in BBREF_ID_COLUMNS:
+        if column in df.columns:
+            return df[column].astype(str)
+    return df['Player'].map(normalize_name)
+
+def season_rows(df):
+    """
+    one row per player, indexed by bbref id. traded players are listed once
+    per team plus a season total row; the total row is kept (or, without
+    one, the row with the most games)
+    """
+    df = df.dropna(subset=['Player'])
+    ids = bbref_ids(df).to_numpy()
+    is_total = df['Team'].astype(str).str.match(TOTAL_TEAM).to_numpy() if 'Team' in df.columns else np.zeros(len(df), dtype=bool)
+    games = pd.to_numeric(df['G'], errors='coerce').to_numpy() if 'G' in df.columns else np.zeros(len(df))
+    # ordered on the key columns alone, so the table itself is copied once
+    order = np.lexsort((-games, ~is_total))
+    keep = order[~pd.Series(ids[order]).duplicated().to_numpy()]
+    df = df.iloc[keep]
+    df.insert(len(df.columns), 'BBREF_ID', ids[keep])
+    return df.set_index('BBREF_ID', drop=False)
+
+def resolve_players(players, tables):
+    """
+    match every NBA PLAYER_ID in players to a bbref id on normalized name.
+    same-name players are told apart by exact spelling, then age. MATCH is
+    exact, normalized, ambiguous or missing (BBREF_ID empty for the last two)
+    """
+    roster = pd.concat([table.reindex(columns=['BBREF_ID', 'Player', 'Age']) for table in tables if table is not None],
+                       ignore_index=True).drop_duplicates('BBREF_ID')
+    roster['NAME_KEY'] = roster['Player'].map(normalize_name)
+    candidates = roster['NAME_KEY'].value_counts()
+
+    players = players.drop_duplicates('PLAYER_ID')
+    index = pd.DataFrame({'PLAYER_ID': players['PLAYER_ID'].to_numpy(), 'PLAYER_NAME': players['PLAYER_NAME'].to_numpy()})
+    keys = players['PLAYER_NAME'].map(normalize_name).to_numpy()
+    n_candidates = pd.Series(keys).map(candidates).fillna(0).to_numpy()
+
+    # names with one candidate are a keyed join
+    unique = roster[roster['NAME_KEY'].map(candidates) == 1].set_index('NAME_KEY')
+    index['BBREF_ID'] = unique['BBREF_ID'].reindex(keys).to_numpy()
+    index['BBREF_NAME'] = unique['Player'].reindex(keys).to_numpy()
+    index['MATCH'] = np.where(n_candidates == 0, 'missing', 'ambiguous')
+
+    # shared names are told apart one player at a time
+    ages = players['AGE'].to_numpy() if 'AGE' in players.columns else np.full(len(players), np.nan)
+    for row in np.flatnonzero(n_candidates > 1):
+        matches = roster[roster['NAME_KEY'] == keys[row]]
+        exact = matches[matches['Player'] == index.at[row, 'PLAYER_NAME']]
+        matches = exact if len(exact) else matches
+        gap = (pd.to_numeric(matches['Age'], errors='coerce') - ages[row]).abs()
+        if len(matches) > 1 and gap.notna().any():
+            matches = matches[gap == gap.min()]
+        if len(matches) == 1:
+            index.at[row, 'BBREF_ID'] = matches['BBREF_ID'].iloc[0]
+            index.at[row, 'BBREF_NAME'] = matches['Player'].iloc[0]
+
+    matched = index['BBREF_ID'].notna()
+    index.loc[matched, 'MATCH'] = np.where(index.loc[matched, 'BBREF_NAME'] == index.loc[matched, 'PLAYER_NAME'],
+                                           'exact', 'normalized')
+
+    claimed = index['BBREF_ID'].dropna()
+    for bbref_id in claimed[claimed.duplicated()].unique():
+        logger.warning(f"bbref player {bbref_id} matched more than one NBA player: "
+                       f"{index.loc[index['BBREF_ID'] == bbref_id, 'PLAYER_NAME'].tolist()}")
+    return index[INDEX_COLUMNS]
+
+def load_player_index(path, players, sources=()):
+    """
+    the persisted index at path if it covers every player and is newer than
+    every source file, otherwise None (the caller rebuilds it)
+    """
+    if not os.path.exists(path):
+        return None
+    modified = os.path.getmtime(path)
+    if any(os.path.exists(source) and os.path.getmtime(source) > modified for source in sources):
+        return None
+    index = pd.read_csv(path, dtype={'BBREF_ID': str})
+    if not players['PLAYER_ID'].isin(index['PLAYER_ID']).all():
+        return None
+    return index
+
+def save_player_index(index, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    index.to_csv(path, index=False)
+    unresolved = index[index['BBREF_ID'].isna()]
+    if len(unresolved):
+        logger.warning(f"{len(unresolved)} players have no bbref match: {unresolved['PLAYER_NAME'].tolist()}")
+
+if __name__ == "__main__":
+    from calculate_iq_metrics import DataContext
+    from instrumentation import setup_logging
+
+    setup_logging()
+    season = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SEASON
+    context = DataContext(season=season)
+    index = context.build_player_index()
+    logger.info(f"saved the player index for {len(index)} players to {context.paths.player_index_csv}")
+    print(index['MATCH'].value_counts().to_string())
+    changed = index[index['MATCH'] != 'exact']
+    if len(changed):
+        print(changed.to_string(index=False))
@@ -0,0 +1,318 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from export_frontend import METRIC_FORMATS, player_records
+from instrumentation import setup_logging
+from player_index import normalize_name
+from seasons import DEFAULT_SEASON, SeasonPaths
+from similarity import METRICS as SIMILARITY_METRICS, SimilarityIndex, load_features
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+# encoded responses kept in memory; most dashboard traffic repeats a few queries
+CACHE_SIZE = 4096
+
+# how often the pipeline outputs are checked for a new run, in seconds
+POLL_INTERVAL = 2.0
+
+MAX_RESULTS = 500
+
+# routes describing the service rather than the dataset; answered fresh every time
+UNCACHED_ROUTES = {'/health'}
+
+logger = logging.getLogger(__name__)
+
+class QueryError(Exception):
+    """ a bad request: unknown player, metric or parameter. status is the HTTP status to answer with """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def file_signature(paths):
+    """ (mtime, size) of every path, to tell when a pipeline run has replaced them """
+    return tuple((os.path.getmtime(path), os.path.getsize(path)) if os.path.exists(path) else None for path in paths)
+
+class Dataset:
+    """
+    one pipeline run held in memory: a json-ready record per player (the
+    frontend's shape plus id), rank orders per metric computed once, name and
+    team lookups, and similarity indexes built on first use. read-only once
+    built, so request threads share it without locking
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.signature = file_signature(self.sources(paths))
+        self.loaded_at = time.time()
+
+        rankings = pd.read_csv(paths.rankings_csv).sort_values('rank_weighted_iq', kind='stable').reset_index(drop=True)
+        metrics = pd.read_csv(paths.metrics_csv)
+        self.rankings = rankings
+        self.player_ids = rankings['PLAYER_ID'].to_numpy()
+        self.records = [dict(record, id=int(player_id))
+                        for player_id, record in zip(self.player_ids, player_records(rankings, metrics))]
+        self.row = {int(player_id): i for i, player_id in enumerate(self.player_ids)}
+        self.by_name = {}
+        for i, name in enumerate(rankings['PLAYER_NAME']):
+            self.by_name.setdefault(normalize_name(name), i)
+
+        self.positions = rankings['POSITION'].astype(str).to_numpy()
+        self.team_ids = rankings['TEAM_ID'].to_numpy()
+        self.team_abbreviations = {}
+        if os.path.exists(paths.players_csv):
+            teams = pd.read_csv(paths.players_csv, usecols=['TEAM_ID', 'TEAM_ABBREVIATION']).drop_duplicates('TEAM_ABBREVIATION')
+            self.team_abbreviations = dict(zip(teams['TEAM_ABBREVIATION'].str.upper(), teams['TEAM_ID']))
+
+        # rows best-first for the composite and every metric's percentile
+        self.orders = {'iq': np.arange(len(rankings))}
+        for metric in METRIC_FORMATS:
+            column = f'{metric}_percentile'
+            if column in rankings.columns:
+                self.orders[metric] = np.argsort(-rankings[column].to_numpy(dtype=float), kind='stable')
+
+        self.similarity = {}
+        self.similarity_lock = threading.Lock()
+
+    @staticmethod
+    def sources(paths):
+        return [paths.rankings_csv, paths.metrics_csv]
+
+    def locate(self, player):
+        """ row of a player by PLAYER_ID or (accent-insensitive) name """
+        if player.isdecimal():
+            row = self.row.get(int(player))
+        else:
+            row = self.by_name.get(normalize_name(player))
+        if row is None:
+            raise QueryError(f"player {player!r} not found", status=404)
+        return row
+
+    def mask(self, position=None, team=None):
+        """ boolean row filter for position (e.g. G matches PG and SG) and team id or abbreviation """
+        mask = np.ones(len(self.records), dtype=bool)
+        if position:
+            mask &= np.char.find(self.positions.astype(str), position.upper()) >= 0
+        if team:
+            team_id = int(team) if team.isdecimal() else self.team_abbreviations.get(team.upper())
+            if team_id is None:
+                raise QueryError(f"unknown team {team!r}", status=404)
+            mask &= self.team_ids == team_id
+        return mask
+
+    def top(self, metric='iq', n=25, position=None, team=None):
+        """ the n best players by the composite or one metric's percentile, after filtering """
+        if metric not in self.orders:
+            raise QueryError(f"unknown metric {metric!r}, expected one of {sorted(self.orders)}", status=404)
+        order = self.orders[metric]
+        rows = order[self.mask(position, team)[order]][:n]
+        return [self.records[row] for row in rows]
+
+    def similarity_index(self, metric):
+        if metric not in SIMILARITY_METRICS:
+            raise QueryError(f"unknown similarity metric {metric!r}, expected one of {SIMILARITY_METRICS}")
+        with self.similarity_lock:
+            if metric not in self.similarity:
+                players, features = load_features(self.paths.rankings_csv)
+                self.similarity[metric] = SimilarityIndex(players, features, metric)
+        return self.similarity[metric]
+
+    def similar(self, player, k=10, metric='cosine'):
+        """ the k most similar players, each record with its similarity """
+        player_id = int(self.player_ids[self.locate(player)])
+        neighbors = self.similarity_index(metric).query(player_id, k)
+        return [dict(self.records[self.row[int(other)]], similarity=float(value))
+                for other, value in zip(neighbors['PLAYER_ID'], neighbors['similarity'])]
+
+class ResponseCache:
+    """ thread-safe LRU of encoded responses, keyed by (dataset signature, request) """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class QueryService:
+    """
+    answers queries against the current Dataset, swapping in a new one when a
+    pipeline run replaces the output CSVs. a run is picked up once its files
+    have stopped changing for one poll, so a half-written CSV is never loaded
+    """
+
+    def __init__(self, season=DEFAULT_SEASON, data_dir='data', cache_size=CACHE_SIZE, poll_interval=POLL_INTERVAL):
+        self.paths = SeasonPaths(season, data_dir)
+        self.dataset = Dataset(self.paths)
+        self.cache = ResponseCache(cache_size)
+        self.poll_interval = poll_interval
+        self.pending = None
+        self.failed = None
+        self.stopped = threading.Event()
+        self.reloads = 0
+
+    def check_reload(self):
+        """ load a new Dataset if the outputs changed and have settled; True if it swapped """
+        signature = file_signature(Dataset.sources(self.paths))
+        if signature in (self.dataset.signature, self.failed) or None in signature:
+            self.pending = None
+            return False
+        if signature != self.pending:
+            # seen changing for the first time; wait one more poll for the writer to finish
+            self.pending = signature
+            return False
+        try:
+            dataset = Dataset(self.paths)
+        except Exception as e:
+            # not retried until the files change again
+            self.failed = signature
+            logger.warning(f"reload failed, still serving the run loaded at {time.ctime(self.dataset.loaded_at)}: {e}")
+            return False
+        # one reference assignment: requests in flight finish on the old dataset
+        self.dataset = dataset
+        self.cache.clear()
+        self.pending = None
+        self.reloads += 1
+        logger.info(f"reloaded {len(dataset.records)} players from {self.paths.rankings_csv}")
+        return True
+
+    def watch(self):
+        while not self.stopped.wait(self.poll_interval):
+            self.check_reload()
+
+    def start_watching(self):
+        thread = threading.Thread(target=self.watch, name='query-service-reload', daemon=True)
+        thread.start()
+        return thread
+
+    def respond(self, target):
+        """ (status, encoded json body) for a request target like /top?metric=efg_pct&n=10 """
+        dataset = self.dataset
+        cacheable = urlsplit(target).path.rstrip('/') not in UNCACHED_ROUTES
+        key = (dataset.signature, target)
+        if cacheable:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        try:
+            status, body = 200, self.route(dataset, target)
+        except QueryError as e:
+            status, body = e.status, {'error': str(e)}
+        except Exception:
+            # a bug on one route answers 500 instead of dropping the connection
+            logger.exception(f"error answering {target}")
+            status, body = 500, {'error': 'internal error'}
+        response = (status, json.dumps(body, separators=(',', ':')).encode('utf-8'))
+        if status == 200 and cacheable:
+            self.cache.put(key, response)
+        return response
+
+    def route(self, dataset, target):
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip('/').split('/') if part]
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        limit = int_param(query, 'n', 25)
+        position, team = query.get('position'), query.get('team')
+
+        if parts == ['health']:
+            return {'players': len(dataset.records), 'loaded_at': dataset.loaded_at, 'reloads': self.reloads,
+                    'cache': {'entries': len(self.cache.entries), 'hits': self.cache.hits, 'misses': self.cache.misses}}
+        if parts == ['metrics']:
+            return sorted(dataset.orders)
+        if parts == ['players']:
+            return [dataset.records[row] for row in np.flatnonzero(dataset.mask(position, team))[:limit]]
+        if len(parts) == 2 and parts[0] == 'players':
+            return dataset.records[dataset.locate(parts[1])]
+        if parts == ['top']:
+            return dataset.top(query.get('metric', 'iq'), limit, position, team)
+        if len(parts) == 2 and parts[0] == 'similar':
+            return dataset.similar(parts[1], int_param(query, 'k', 10), query.get('metric', 'cosine'))
+        raise QueryError(f"no route for {url.path}", status=404)
+
+def int_param(query, name, default):
+    try:
+        value = int(query.get(name, default))
+    except ValueError:
+        raise QueryError(f"{name} must be an integer")
+    return max(1, min(value, MAX_RESULTS))
+
+class QueryHandler(BaseHTTPRequestHandler):
+    # keep-alive, so dashboards don't pay a connection per request; headers
+    # and body are separate writes, so without TCP_NODELAY every response
+    # waits out the client's delayed ACK
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    service = None
+
+    def do_GET(self):
+        status, body = self.service.respond(self.path)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+def make_server(service, host=HOST, port=PORT):
+    """ a threaded HTTP server answering from service (port 0 picks a free port) """
+    handler = type('BoundQueryHandler', (QueryHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def serve(season=DEFAULT_SEASON, host=HOST, port=PORT, data_dir='data'):
+    service = QueryService(season, data_dir)
+    service.start_watching()
+    server = make_server(service, host, port)
+    print(f"serving {len(service.dataset.records)} players on http://{host}:{server.server_address[1]} "
+          f"(/players, /players/<id or name>, /top, /similar/<id or name>, /metrics, /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stopped.set()
+        server.server_close()
+
+if __name__ == "__main__":
+    # python query_service.py [season] [port]
+    setup_logging()
+    season = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SEASON
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else PORT
+    serve(season, port=port)
@@ -0,0 +1,261 @@
+import json
+import logging
+import random
+import socket
+import threading
+import time
+
+import requests
+
+from instrumentation import instrumentation
+
+logger = logging.getLogger(__name__)
+
+class HTTPStatusError(Exception):
+    """ non-200 response from the stats API """
+
+    def __init__(self, status_code, url=None):
+        super().__init__(f"HTTP {status_code} for {url}")
+        self.status_code = status_code
+        self.url = url
+
+class CircuitOpenError(Exception):
+    """ endpoint has failed too often recently, calls are short-circuited """
+
+class RetryError(Exception):
+    """ a call gave up, either after max retries or on a non-retryable error """
+
+    def __init__(self, endpoint, key, attempts, last_error):
+        super().__init__(f"{endpoint} for {key} failed after {attempts} attempts: {last_error}")
+        self.endpoint = endpoint
+        self.key = key
+        self.attempts = attempts
+        self.last_error = last_error
+
+# transport failures, plus a truncated or non-JSON body (what a throttled
+# response often looks like)
+RETRYABLE_ERRORS = (
+    requests.exceptions.Timeout,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ContentDecodingError,
+    socket.timeout,
+    TimeoutError,
+    ConnectionError,
+    json.JSONDecodeError
+)
+
+def is_retryable(error):
+    """
+    timeouts, dropped connections, garbled bodies, 429 and 5xx are worth
+    retrying. other 4xx mean the request itself is bad (e.g. an invalid
+    player id) and fail fast, as does anything else: a TypeError or KeyError
+    is a bug that retrying won't fix, and shouldn't trip the breaker
+    """
+    if isinstance(error, HTTPStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, RETRYABLE_ERRORS)
+
+class RetryPolicy:
+    """ exponential backoff with jitter: delay = uniform((1 - jitter) * d, d), d = min(max_delay, base_delay * 2**attempt) """
+
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=30.0, jitter=1.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform((1 - self.jitter) * ceiling, ceiling)
+
+class CircuitBreaker:
+    """
+    opens after failure_threshold consecutive failures and rejects calls until
+    reset_timeout has passed. then exactly one caller gets a trial call, the
+    rest keep waiting: success closes the breaker, failure of any kind
+    re-opens it
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0, clock=time.monotonic, trial_poll=0.5):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        # how often callers turned away during a trial check back, in seconds
+        self.trial_poll = trial_poll
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """ whether a call may go ahead; in half-open, True for the one caller that gets the trial """
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and self.trial_in_flight is None:
+                self.trial_in_flight = threading.get_ident()
+                return True
+            return False
+
+    def remaining(self):
+        """ seconds until an open breaker lets a trial call through (0 when not open) """
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return 0.0
+            if state == 'half-open':
+                return self.trial_poll if self.trial_in_flight is not None else 0.0
+            return self.reset_timeout - (self.clock() - self.opened_at)
+
+    def holds_trial(self):
+        """ whether the calling thread is making the half-open trial call """
+        with self.lock:
+            return self.trial_in_flight == threading.get_ident()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight is not None or self.state == 'half-open' or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.trial_in_flight = None
+
+class AttemptRecord:
+    """ one call attempt: endpoint, key, attempt number, latency in seconds, outcome """
+
+    def __init__(self, endpoint, key, attempt, latency, outcome, error=None):
+        self.endpoint = endpoint
+        self.key = key
+        self.attempt = attempt
+        self.latency = latency
+        self.outcome = outcome
+        self.error = error
+
+class RetryClient:
+    """
+    runs fetch callables under a retry policy with one circuit breaker per
+    endpoint, and records latency for every attempt. an optional limiter
+    (see fetch_scheduler.TokenBucket) is acquired before each attempt and
+    told about each outcome
+    """
+
+    def __init__(self, policy=None, endpoint_policies=None, failure_threshold=5,
+                 reset_timeout=60.0, sleep=time.sleep):
+        self.policy = policy or RetryPolicy()
+        self.endpoint_policies = endpoint_policies or {}
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.sleep = sleep
+        self.breakers = {}
+        self.attempts = []
+        self.lock = threading.Lock()
+
+    def breaker(self, endpoint):
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self.breakers[endpoint]
+
+    def _record(self, endpoint, key, attempt, latency, outcome, error=None):
+        with self.lock:
+            self.attempts.append(AttemptRecord(endpoint, key, attempt, latency, outcome, error))
+        if outcome != 'short-circuited':
+            instrumentation.observe(f'fetch.{endpoint}', latency)
+        instrumentation.count(f'fetch.{endpoint}.{outcome}')
+
+    def call(self, endpoint, fn, key=None, limiter=None):
+        """
+        return fn()'s result, or raise RetryError once the policy gives up.
+        while the endpoint's breaker is open the call waits for it to let a
+        trial through; the wait doesn't use up a retry
+        """
+        policy = self.endpoint_policies.get(endpoint, self.policy)
+        breaker = self.breaker(endpoint)
+        last_error = None
+        attempts_made = 0
+
+        while attempts_made < policy.max_retries:
+            if not breaker.allow():
+                wait = breaker.remaining()
+                self._record(endpoint, key, attempts_made + 1, 0.0, 'short-circuited',
+                             CircuitOpenError(f"circuit open for {endpoint}"))
+                logger.info(f"circuit open for {endpoint}, {key} waits {wait:.1f} seconds.")
+                self.sleep(wait)
+                continue
+
+            if limiter is not None:
+                limiter.acquire()
+
+            attempt = attempts_made
+            attempts_made += 1
+            start = time.perf_counter()
+            try:
+                result = fn()
+            except Exception as e:
+                latency = time.perf_counter() - start
+                last_error = e
+
+                # a bad request says nothing about endpoint health or rate limits,
+                # unless it was the trial call, which must settle the breaker either way
+                if not is_retryable(e):
+                    if breaker.holds_trial():
+                        breaker.record_failure()
+                    self._record(endpoint, key, attempt + 1, latency, 'failed', e)
+                    break
+
+                breaker.record_failure()
+                if limiter is not None:
+                    limiter.penalize()
+                self._record(endpoint, key, attempt + 1, latency, 'retried', e)
+                # with the breaker open, the wait above replaces the backoff
+                if attempts_made < policy.max_retries and breaker.state == 'closed':
+                    wait = policy.delay(attempt)
+                    logger.warning(f"timeout/error for {endpoint} ({key}) on attempt {attempt+1}: {e}. retrying in {wait:.1f} seconds...")
+                    self.sleep(wait)
+                continue
+
+            latency = time.perf_counter() - start
+            breaker.record_success()
+            if limiter is not None:
+                limiter.reward()
+            self._record(endpoint, key, attempt + 1, latency, 'ok')
+            return result
+
+        raise RetryError(endpoint, key, attempts_made, last_error)
+
+    def latency_summary(self):
+        """ per-endpoint attempt counts and latency percentiles (seconds) """
+        summary = {}
+        with self.lock:
+            records = list(self.attempts)
+        for endpoint in sorted({r.endpoint for r in records}):
+            rows = [r for r in records if r.endpoint == endpoint]
+            latencies = sorted(r.latency for r in rows if r.outcome != 'short-circuited')
+            summary[endpoint] = {
+                'attempts': len(rows),
+                'ok': sum(r.outcome == 'ok' for r in rows),
+                'retried': sum(r.outcome == 'retried' for r in rows),
+                'failed': sum(r.outcome == 'failed' for r in rows),
+                'short_circuited': sum(r.outcome == 'short-circuited' for r in rows),
+                'p50': latencies[len(latencies) // 2] if latencies else None,
+                'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None
+            }
+        return summary
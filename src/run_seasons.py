@@ -0,0 +1,75 @@
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from batch_metrics import process_all_players_batch
+from calculate_iq_composite import calculate_weighted_iq_rankings
+from calculate_iq_metrics import DataContext
+from instrumentation import setup_logging
+from seasons import SeasonPaths, season_range
+
+logger = logging.getLogger(__name__)
+
+def run_season(season, data_dir='data'):
+    """ metrics then composite for one season; runs in a worker process """
+    start = time.perf_counter()
+    SeasonPaths(season, data_dir).ensure_dirs()
+    process_all_players_batch(DataContext(data_dir, season))
+    rankings = calculate_weighted_iq_rankings(season, data_dir)
+    return season, len(rankings), time.perf_counter() - start
+
+def run_seasons(seasons, data_dir='data', max_workers=None):
+    """
+    compute metrics and composites for many seasons, one season per process.
+    seasons are independent (own raw files, own store partition, own outputs),
+    so they run in parallel without coordination
+    """
+    if max_workers is None:
+        max_workers = min(len(seasons), os.cpu_count() or 1)
+
+    completed, failed = [], []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(run_season, season, data_dir): season for season in seasons}
+        for future in as_completed(futures):
+            season = futures[future]
+            try:
+                completed.append(future.result())
+            except Exception as e:
+                failed.append((season, e))
+
+    logger.info(f"=== {len(completed)}/{len(seasons)} seasons processed ===")
+    for season, players, elapsed in sorted(completed):
+        logger.info(f"  {season}: {players} players in {elapsed:.1f}s")
+    for season, error in failed:
+        logger.warning(f"  {season} failed: {error}")
+
+    combine_seasons([season for season, _, _ in completed], data_dir)
+    return completed, failed
+
+def combine_seasons(seasons, data_dir='data', output_file=None):
+    """ stack per-season rankings into one player-season table with a SEASON column """
+    if output_file is None:
+        output_file = f'{data_dir}/seasons/all_seasons_rankings.csv'
+    frames = []
+    for season in sorted(seasons):
+        df = pd.read_csv(SeasonPaths(season, data_dir).rankings_csv)
+        df.insert(0, 'SEASON', season)
+        frames.append(df)
+    if not frames:
+        return None
+
+    combined = pd.concat(frames, ignore_index=True)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    combined.to_csv(output_file, index=False)
+    logger.info(f"saved {len(combined)} player-seasons to {output_file}")
+    return combined
+
+if __name__ == "__main__":
+    # python run_seasons.py 2004-05 2024-25 -> every season in between
+    first, last = sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else sys.argv[1]
+    setup_logging()
+    run_seasons(season_range(first, last))
@@ -0,0 +1,53 @@
+import os
+
+DEFAULT_SEASON = '2024-25'
+
+# the season the project started with keeps its files directly under data/,
+# every other season gets its own data/seasons/{season} tree
+LEGACY_SEASON = '2024-25'
+
+def season_label(start_year):
+    """ 2024 -> '2024-25' """
+    return f'{start_year}-{(start_year + 1) % 100:02d}'
+
+def season_range(first, last):
+    """ every season label from first through last, e.g. ('2004-05', '2024-25') """
+    return [season_label(year) for year in range(int(first[:4]), int(last[:4]) + 1)]
+
+class SeasonPaths:
+    """ where one season's inputs and outputs live """
+
+    def __init__(self, season=DEFAULT_SEASON, data_dir='data'):
+        self.season = season
+        self.data_dir = data_dir
+        self.root = data_dir if season == LEGACY_SEASON else f'{data_dir}/seasons/{season}'
+        self.raw_dir = f'{self.root}/raw'
+        self.processed_dir = f'{self.root}/processed'
+        # the parquet store is shared; it's already partitioned by season
+        self.store_dir = f'{data_dir}/store'
+
+        # the player population, whichever mode picked it (the name predates the modes)
+        self.players_csv = f'{self.root}/top300_per.csv'
+        self.metrics_csv = f'{self.processed_dir}/all_player_iq_metrics.csv'
+        self.rankings_csv = f'{self.processed_dir}/weighted_iq_rankings.csv'
+        self.similarity_dir = f'{self.processed_dir}/similarity'
+        # NBA PLAYER_ID -> basketball reference id, see player_index.py
+        self.player_index_csv = f'{self.processed_dir}/player_index.csv'
+
+        # bbref exports are named by the year the season starts in
+        self.bbref_year = season[:4]
+
+    def raw_file(self, name, player_id=None):
+        """ data/raw/{player_id}_{name}.csv, or {name}.csv for league tables """
+        if player_id is None:
+            return f'{self.raw_dir}/{name}.csv'
+        return f'{self.raw_dir}/{player_id}_{name}.csv'
+
+    def bbref_file(self, filename):
+        """ a bbref export in the processed dir; filename may contain {year} """
+        return f'{self.processed_dir}/{filename.format(year=self.bbref_year)}'
+
+    def ensure_dirs(self):
+        os.makedirs(self.raw_dir, exist_ok=True)
+        os.makedirs(self.processed_dir, exist_ok=True)
+        return self
@@ -0,0 +1,219 @@
+import logging
+import sys
+import time
+
+import numpy as np
+
+import storage
+from instrumentation import setup_logging
+from seasons import DEFAULT_SEASON
+from shot_store import ShotStore, build_shot_store, shot_store_stale
+
+# half court in LOC_X/LOC_Y units (tenths of a foot, hoop at the origin).
+# shots from beyond half court fall outside every grid and are left out
+COURT_X = (-250, 250)
+COURT_Y = (-52.5, 417.5)
+
+# square cells of 2ft; hexagons 25 across the court width
+SQUARE_SIZE = 20
+HEX_GRIDSIZE = 25
+
+BINNINGS = ['hex', 'square', 'zone']
+
+logger = logging.getLogger(__name__)
+
+def square_cells(x, y, size=SQUARE_SIZE):
+    """ (cell per shot, -1 outside the court; (n_cells, 2) cell centers) on a square grid """
+    n_cols = int(np.ceil((COURT_X[1] - COURT_X[0]) / size))
+    n_rows = int(np.ceil((COURT_Y[1] - COURT_Y[0]) / size))
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    inside = (x >= COURT_X[0]) & (x <= COURT_X[1]) & (y >= COURT_Y[0]) & (y <= COURT_Y[1])
+    # the far edges belong to the last row/column
+    col = np.minimum(((x - COURT_X[0]) // size).astype(np.int64), n_cols - 1)
+    row = np.minimum(((y - COURT_Y[0]) // size).astype(np.int64), n_rows - 1)
+    cells = np.where(inside, row * n_cols + col, -1)
+
+    rows, cols = np.divmod(np.arange(n_rows * n_cols), n_cols)
+    centers = np.column_stack([COURT_X[0] + (cols + 0.5) * size, COURT_Y[0] + (rows + 0.5) * size])
+    return cells, centers
+
+def hex_cells(x, y, gridsize=HEX_GRIDSIZE):
+    """
+    (cell per shot, -1 outside the court; (n_cells, 2) hexagon centers) for
+    regular hexagons, gridsize across the court width. same construction as
+    matplotlib's hexbin: two offset rectangular lattices of centers, each shot
+    goes to the nearer of its two candidate centers
+    """
+    sx = (COURT_X[1] - COURT_X[0]) / gridsize
+    sy = sx * np.sqrt(3)
+    ny = int(np.ceil((COURT_Y[1] - COURT_Y[0]) / sy))
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    inside = (x >= COURT_X[0]) & (x <= COURT_X[1]) & (y >= COURT_Y[0]) & (y <= COURT_Y[1])
+
+    ix = (x - COURT_X[0]) / sx
+    iy = (y - COURT_Y[0]) / sy
+    # lattice 1: centers at whole steps, (gridsize + 1) x (ny + 1) of them;
+    # lattice 2: centers offset by half a step, gridsize x ny
+    i1, j1 = np.rint(ix), np.rint(iy)
+    i2, j2 = np.floor(ix), np.floor(iy)
+    d1 = (ix - i1) ** 2 + 3 * (iy - j1) ** 2
+    d2 = (ix - i2 - 0.5) ** 2 + 3 * (iy - j2 - 0.5) ** 2
+    n1 = (gridsize + 1) * (ny + 1)
+    lattice1 = i1 * (ny + 1) + j1
+    lattice2 = n1 + np.minimum(i2, gridsize - 1) * ny + np.minimum(j2, ny - 1)
+    cells = np.where(inside, np.where(d1 <= d2, lattice1, lattice2), -1).astype(np.int64)
+
+    a1, b1 = np.divmod(np.arange(n1), ny + 1)
+    a2, b2 = np.divmod(np.arange(gridsize * ny), ny)
+    centers = np.vstack([
+        np.column_stack([COURT_X[0] + a1 * sx, COURT_Y[0] + b1 * sy]),
+        np.column_stack([COURT_X[0] + (a2 + 0.5) * sx, COURT_Y[0] + (b2 + 0.5) * sy])
+    ])
+    return cells, centers
+
+def bin_counts(groups, n_groups, cells, n_cells, made):
+    """
+    (attempts, makes) of shape (n_groups, n_cells): one bincount over every
+    shot, keyed by group * n_cells + cell. shots with cell -1 are dropped
+    """
+    valid = cells >= 0
+    keys = groups[valid] * n_cells + cells[valid]
+    size = n_groups * n_cells
+    attempts = np.bincount(keys, minlength=size).reshape(n_groups, n_cells)
+    makes = np.bincount(keys, weights=made[valid], minlength=size).reshape(n_groups, n_cells)
+    return attempts, makes.astype(np.int64)
+
+class ShotCharts:
+    """
+    every player's shots of one season binned in one pass: attempts and makes
+    per (player, cell), for hexagons, squares or the league's named zones
+    (SHOT_ZONE_BASIC x SHOT_ZONE_AREA). league baselines are the column sums
+    """
+
+    def __init__(self, store, binning='hex'):
+        shots = store.shots
+        self.binning = binning
+        self.player_ids = store.player_ids
+        self.row = {int(player_id): i for i, player_id in enumerate(self.player_ids)}
+        made = store.made()
+        # shot charts fetched with the default PTS context only hold makes
+        self.has_misses = bool(len(shots)) and not made.all()
+
+        if binning == 'hex':
+            cells, self.centers = hex_cells(shots['loc_x'], shots['loc_y'])
+            self.labels = None
+        elif binning == 'square':
+            cells, self.centers = square_cells(shots['loc_x'], shots['loc_y'])
+            self.labels = None
+        elif binning == 'zone':
+            basic, area = store.categories['shot_zone_basic'], store.categories['shot_zone_area']
+            codes_basic = shots['shot_zone_basic'].astype(np.int64)
+            codes_area = shots['shot_zone_area'].astype(np.int64)
+            valid = (codes_basic < len(basic)) & (codes_area < len(area))
+            cells = np.where(valid, codes_basic * len(area) + codes_area, -1)
+            self.centers = None
+            self.labels = [f'{b} | {a}' for b in basic for a in area]
+        else:
+            raise ValueError(f"unknown binning {binning!r}, expected one of {BINNINGS}")
+
+        n_cells = len(self.centers) if self.labels is None else len(self.labels)
+        self.attempts, self.makes = bin_counts(store.player_index(), len(self.player_ids), cells, n_cells, made)
+
+    @classmethod
+    def from_season(cls, season=DEFAULT_SEASON, binning='hex', store_dir=storage.STORE_DIR):
+        """
+        over the season's packed shot store, (re)packing it from the shot
+        charts first when it's missing or older than them, e.g. after
+        refetching with FGA
+        """
+        if shot_store_stale(season, store_dir=store_dir):
+            build_shot_store(season, store_dir=store_dir)
+        charts = cls(ShotStore(season, store_dir), binning)
+        if not charts.has_misses:
+            logger.warning(f"the {season} shot charts only contain made shots, so FG% grids are NaN; "
+                           f"refetch them (fetch_data.py asks for FGA now)")
+        return charts
+
+    def rows(self, player_ids=None):
+        """ row positions of the given players (all by default); -1 for players without shots """
+        if player_ids is None:
+            return np.arange(len(self.player_ids))
+        return np.array([self.row.get(int(player_id), -1) for player_id in player_ids], dtype=np.int64)
+
+    def frequency(self):
+        """ (players x cells) share of each player's attempts taken from each cell """
+        totals = self.attempts.sum(axis=1, keepdims=True)
+        return self.attempts / np.where(totals > 0, totals, 1)
+
+    def fg_pct(self, min_attempts=1):
+        """ (players x cells) FG%, NaN below min_attempts or when only makes were fetched """
+        if not self.has_misses:
+            return np.full(self.attempts.shape, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.attempts >= min_attempts, self.makes / self.attempts, np.nan)
+
+    def league_attempts(self):
+        return self.attempts.sum(axis=0)
+
+    def league_frequency(self):
+        """ share of all league attempts per cell """
+        attempts = self.league_attempts()
+        return attempts / max(attempts.sum(), 1)
+
+    def league_fg_pct(self, min_attempts=1):
+        if not self.has_misses:
+            return np.full(self.attempts.shape[1], np.nan)
+        attempts = self.league_attempts()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(attempts >= min_attempts, self.makes.sum(axis=0) / attempts, np.nan)
+
+    def fg_pct_vs_league(self, min_attempts=5):
+        """ (players x cells) FG% minus the league's in the same cell """
+        return self.fg_pct(min_attempts) - self.league_fg_pct()[None, :]
+
+    def frequency_vs_league(self):
+        """ (players x cells) shot frequency minus the league's """
+        return self.frequency() - self.league_frequency()[None, :]
+
+    def distribution_vectors(self, player_ids=None, min_league_attempts=1):
+        """
+        (players x cells) shot frequency over the cells the league actually
+        shoots from, for similarity features. players without shots get the
+        league distribution
+        """
+        active = self.league_attempts() >= min_league_attempts
+        rows = self.rows(player_ids)
+        vectors = self.frequency()[np.maximum(rows, 0)][:, active]
+        vectors[rows < 0] = self.league_frequency()[active]
+        return vectors
+
+    def grid(self, values):
+        """ one row of square-binned values as a (rows x cols) court image """
+        if self.binning != 'square':
+            raise ValueError("only square binning has a rectangular grid")
+        n_cols = int(np.ceil((COURT_X[1] - COURT_X[0]) / SQUARE_SIZE))
+        return np.asarray(values).reshape(-1, n_cols)
+
+    def save(self, path):
+        """ counts, centers/labels and player ids as one .npz """
+        np.savez_compressed(path, player_ids=self.player_ids, attempts=self.attempts, makes=self.makes,
+                            centers=self.centers if self.centers is not None else np.empty((0, 2)),
+                            labels=np.array(self.labels or [], dtype=str), binning=self.binning)
+
+if __name__ == "__main__":
+    # python shot_charts.py [season] [binning]
+    setup_logging()
+    season = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SEASON
+    binning = sys.argv[2] if len(sys.argv) > 2 else 'zone'
+
+    start = time.perf_counter()
+    charts = ShotCharts.from_season(season, binning)
+    print(f"binned {charts.attempts.sum()} shots for {len(charts.player_ids)} players into "
+          f"{charts.attempts.shape[1]} {binning} cells in {time.perf_counter() - start:.2f}s")
+
+    if binning == 'zone':
+        frequency, fg_pct = charts.league_frequency(), charts.league_fg_pct()
+        for i in np.argsort(-frequency)[:15]:
+            print(f"  {charts.labels[i]:<45}{frequency[i]:>7.1%}{fg_pct[i]:>8.3f}")
@@ -0,0 +1,189 @@
+import glob
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import storage
+from instrumentation import setup_logging
+from seasons import DEFAULT_SEASON, SeasonPaths
+
+# one record per shot. text columns become uint8 codes into the category
+# lists saved next to the array, flags pack the 0/1 shot columns
+SHOT_DTYPE = np.dtype([
+    ('player_id', '<i4'),
+    ('team_id', '<i4'),
+    ('game_id', '<i4'),
+    ('game_date', '<u4'),
+    ('game_event_id', '<u2'),
+    ('loc_x', '<i2'),
+    ('loc_y', '<i2'),
+    ('shot_distance', 'u1'),
+    ('period', 'u1'),
+    ('minutes_remaining', 'u1'),
+    ('seconds_remaining', 'u1'),
+    ('flags', 'u1'),
+    ('action_type', 'u1'),
+    ('shot_type', 'u1'),
+    ('shot_zone_basic', 'u1'),
+    ('shot_zone_area', 'u1'),
+    ('shot_zone_range', 'u1')
+])
+
+ATTEMPTED = 1
+MADE = 2
+
+CATEGORY_COLUMNS = {
+    'action_type': 'ACTION_TYPE',
+    'shot_type': 'SHOT_TYPE',
+    'shot_zone_basic': 'SHOT_ZONE_BASIC',
+    'shot_zone_area': 'SHOT_ZONE_AREA',
+    'shot_zone_range': 'SHOT_ZONE_RANGE'
+}
+
+NUMERIC_COLUMNS = {
+    'player_id': 'PLAYER_ID',
+    'team_id': 'TEAM_ID',
+    'game_id': 'GAME_ID',
+    'game_date': 'GAME_DATE',
+    'game_event_id': 'GAME_EVENT_ID',
+    'loc_x': 'LOC_X',
+    'loc_y': 'LOC_Y',
+    'shot_distance': 'SHOT_DISTANCE',
+    'period': 'PERIOD',
+    'minutes_remaining': 'MINUTES_REMAINING',
+    'seconds_remaining': 'SECONDS_REMAINING'
+}
+
+SOURCE_COLUMNS = list(NUMERIC_COLUMNS.values()) + list(CATEGORY_COLUMNS.values()) + ['SHOT_ATTEMPTED_FLAG', 'SHOT_MADE_FLAG']
+
+logger = logging.getLogger(__name__)
+
+def shot_store_dir(season, store_dir=storage.STORE_DIR):
+    return f'{store_dir}/shots/season={season}'
+
+def shot_sources(season, raw_dir=None, store_dir=storage.STORE_DIR):
+    """ the files load_shot_frame reads: the store's shot_data partition, or the raw shot chart CSVs without one """
+    if storage.has_endpoint('shot_data', season, store_dir):
+        return glob.glob(f"{storage.partition_dir('shot_data', season, store_dir)}/*.parquet")
+    if raw_dir is None:
+        raw_dir = SeasonPaths(season).raw_dir
+    return glob.glob(f'{raw_dir}/*_shot_data.csv')
+
+def shot_store_stale(season, raw_dir=None, store_dir=storage.STORE_DIR):
+    """ shots.npy is missing, or older than a shot chart it was packed from (e.g. after a refetch) """
+    path = f'{shot_store_dir(season, store_dir)}/shots.npy'
+    if not os.path.exists(path):
+        return True
+    packed_at = os.path.getmtime(path)
+    return any(os.path.getmtime(source) > packed_at for source in shot_sources(season, raw_dir, store_dir))
+
+def load_shot_frame(season, raw_dir=None, store_dir=storage.STORE_DIR):
+    """ every player's shot chart rows, only the columns the packed array keeps """
+    if raw_dir is None:
+        raw_dir = SeasonPaths(season).raw_dir
+    if storage.has_endpoint('shot_data', season, store_dir):
+        return storage.load_endpoint('shot_data', season, columns=SOURCE_COLUMNS, store_dir=store_dir)
+
+    frames = [pd.read_csv(path, usecols=lambda col: col in SOURCE_COLUMNS)
+              for path in sorted(glob.glob(f'{raw_dir}/*_shot_data.csv'))]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=SOURCE_COLUMNS)
+
+def pack_shots(df):
+    """ shot chart rows -> (structured array sorted by player, category lists) """
+    df = df.sort_values('PLAYER_ID', kind='stable')
+    shots = np.zeros(len(df), dtype=SHOT_DTYPE)
+
+    for field, column in NUMERIC_COLUMNS.items():
+        shots[field] = pd.to_numeric(df[column], errors='coerce').fillna(0).to_numpy()
+
+    shots['flags'] = (df['SHOT_ATTEMPTED_FLAG'].fillna(0).to_numpy().astype(np.uint8) * ATTEMPTED
+                      | df['SHOT_MADE_FLAG'].fillna(0).to_numpy().astype(np.uint8) * MADE)
+
+    categories = {}
+    for field, column in CATEGORY_COLUMNS.items():
+        codes, labels = pd.factorize(df[column], sort=True)
+        if len(labels) > 255:
+            raise ValueError(f"{column} has {len(labels)} categories, more than a uint8 code can hold")
+        # code 255 marks a missing value
+        shots[field] = np.where(codes < 0, 255, codes)
+        categories[field] = [str(label) for label in labels]
+
+    return shots, categories
+
+def build_shot_store(season, raw_dir=None, store_dir=storage.STORE_DIR):
+    """ pack the season's shots into shots.npy plus an index.json of categories and player offsets """
+    shots, categories = pack_shots(load_shot_frame(season, raw_dir, store_dir))
+
+    player_ids, starts, counts = np.unique(shots['player_id'], return_index=True, return_counts=True)
+    index = {
+        'categories': categories,
+        'players': {str(player_id): [int(start), int(start + count)]
+                    for player_id, start, count in zip(player_ids, starts, counts)}
+    }
+
+    directory = shot_store_dir(season, store_dir)
+    os.makedirs(directory, exist_ok=True)
+    np.save(f'{directory}/shots.npy', shots)
+    with open(f'{directory}/index.json', 'w') as f:
+        json.dump(index, f)
+
+    logger.info(f"packed {len(shots)} shots for {len(player_ids)} players ({shots.nbytes / 1e6:.1f} MB).")
+    return ShotStore(season, store_dir)
+
+class ShotStore:
+    """ read-only, memory-mapped view of a season's packed shots """
+
+    def __init__(self, season, store_dir=storage.STORE_DIR):
+        directory = shot_store_dir(season, store_dir)
+        self.season = season
+        self.shots = np.load(f'{directory}/shots.npy', mmap_mode='r')
+        with open(f'{directory}/index.json') as f:
+            index = json.load(f)
+        self.categories = index['categories']
+        self.offsets = {int(player_id): tuple(span) for player_id, span in index['players'].items()}
+        self.player_ids = np.array(sorted(self.offsets, key=lambda player_id: self.offsets[player_id][0]), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.shots)
+
+    def player_shots(self, player_id):
+        """ zero-copy slice of one player's shots (empty if unknown) """
+        start, stop = self.offsets.get(int(player_id), (0, 0))
+        return self.shots[start:stop]
+
+    def player_index(self):
+        """ row -> position of its player in self.player_ids """
+        counts = [self.offsets[player_id][1] - self.offsets[player_id][0] for player_id in self.player_ids]
+        return np.repeat(np.arange(len(self.player_ids)), counts)
+
+    def made(self):
+        return (self.shots['flags'] & MADE) > 0
+
+    def zone_counts(self, field='shot_zone_basic'):
+        """
+        (attempts, makes) arrays of shape (players, categories) for one
+        categorical field, in one bincount pass over the whole league
+        """
+        n_categories = len(self.categories[field])
+        codes = self.shots[field].astype(np.int64)
+        valid = codes < n_categories
+        cells = self.player_index()[valid] * n_categories + codes[valid]
+        size = len(self.player_ids) * n_categories
+
+        attempts = np.bincount(cells, minlength=size).reshape(len(self.player_ids), n_categories)
+        makes = np.bincount(cells, weights=self.made()[valid], minlength=size).reshape(len(self.player_ids), n_categories)
+        return attempts, makes.astype(np.int64)
+
+    def decode(self, field, codes):
+        """ category labels for an array of codes """
+        labels = np.array(self.categories[field] + [None], dtype=object)
+        codes = np.asarray(codes, dtype=np.int64)
+        return labels[np.minimum(codes, len(self.categories[field]))]
+
+if __name__ == "__main__":
+    setup_logging()
+    build_shot_store(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SEASON)
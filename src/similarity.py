@@ -0,0 +1,283 @@
+import itertools
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from calculate_iq_composite import WEIGHTS
+from instrumentation import setup_logging
+from seasons import DEFAULT_SEASON
+
+PERCENTILE_COLUMNS = list(WEIGHTS.keys())
+
+ID_COLUMNS = ['PLAYER_ID', 'PLAYER_NAME', 'TEAM_ID', 'POSITION', 'SEASON']
+
+METRICS = ['cosine', 'weighted_euclidean', 'mahalanobis']
+
+# total weighted_euclidean weight of the shot profile features, spread evenly
+# over their zones (the IQ percentiles' weights sum to 1)
+SHOT_PROFILE_WEIGHT = 0.25
+
+# approximate queries re-rank at least this many candidates per requested neighbor
+APPROXIMATE_CANDIDATES = 4
+
+logger = logging.getLogger(__name__)
+
+def load_features(path='data/processed/weighted_iq_rankings.csv', columns=None):
+    """ player rows and their percentile vectors, scaled to [0, 1] """
+    rankings = pd.read_csv(path)
+    columns = columns or PERCENTILE_COLUMNS
+    players = rankings[[col for col in ID_COLUMNS if col in rankings.columns]].reset_index(drop=True)
+    features = rankings[columns].to_numpy(dtype=float) / 100
+    return players, features
+
+def load_shot_profiles(players, season=DEFAULT_SEASON, binning='zone'):
+    """ each player's share of shots per zone (league average without shots) """
+    from shot_charts import ShotCharts
+    charts = ShotCharts.from_season(season, binning)
+    return charts.distribution_vectors(players['PLAYER_ID'].to_numpy())
+
+def embed(features, metric='cosine', weights=None):
+    """
+    map features into a space where the chosen metric is plain euclidean
+    distance (cosine: unit rows), so every query is the same vectorized kernel.
+
+    features are centered first: percentiles are all positive, so without
+    centering cosine similarity mostly measures overall level
+    """
+    centered = features - features.mean(axis=0)
+
+    if metric == 'cosine':
+        norms = np.linalg.norm(centered, axis=1, keepdims=True)
+        return centered / np.where(norms > 0, norms, 1)
+
+    if metric == 'weighted_euclidean':
+        if weights is None:
+            weights = np.array(list(WEIGHTS.values()))
+        return centered * np.sqrt(np.asarray(weights, dtype=float))
+
+    if metric == 'mahalanobis':
+        # whitening with the eigendecomposition of the covariance; near-zero
+        # directions are dropped rather than blown up
+        eigenvalues, eigenvectors = np.linalg.eigh(np.cov(centered, rowvar=False))
+        keep = eigenvalues > eigenvalues.max() * 1e-9
+        return centered @ (eigenvectors[:, keep] / np.sqrt(eigenvalues[keep]))
+
+    raise ValueError(f"unknown metric {metric!r}, expected one of {METRICS}")
+
+def squared_distances(embedded, queries):
+    """ (queries x players) squared euclidean distances via one matrix multiply """
+    sq_norms = np.einsum('ij,ij->i', embedded, embedded)
+    q_norms = np.einsum('ij,ij->i', queries, queries)
+    return np.maximum(q_norms[:, None] - 2 * queries @ embedded.T + sq_norms[None, :], 0)
+
+def top_k(distances, k):
+    """ column indices of the k smallest entries per row, in order """
+    k = min(k, distances.shape[1])
+    candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(distances, candidates, axis=1).argsort(axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+class RandomProjectionLSH:
+    """
+    approximate neighbor candidates from n_tables hash tables of n_bits random
+    hyperplanes each. candidates are re-ranked exactly, so results are exact
+    distances over a (usually much) smaller candidate set. when the query's
+    own buckets hold too few rows, buckets one bit away are probed, then two,
+    and so on (multi-probe LSH)
+    """
+
+    def __init__(self, embedded, n_tables=8, n_bits=10, seed=0):
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((n_tables, embedded.shape[1], n_bits))
+        self.powers = 1 << np.arange(n_bits)
+        # bit flips per hamming radius, nearest buckets first
+        self.probes = [np.array([sum(1 << bit for bit in bits) for bits in itertools.combinations(range(n_bits), radius)])
+                       for radius in range(n_bits + 1)]
+        self.tables = []
+        for codes in self.hash(embedded):
+            order = np.argsort(codes, kind='stable')
+            sorted_codes = codes[order]
+            self.tables.append((sorted_codes, order))
+
+    def hash(self, vectors):
+        """ (tables, rows) integer bucket codes """
+        bits = np.einsum('nd,tdb->tnb', vectors, self.planes) > 0
+        return bits @ self.powers
+
+    def candidates(self, query, min_candidates=0):
+        """ rows sharing a bucket with query in any table, widened until there are at least min_candidates """
+        codes = self.hash(query[None, :])[:, 0]
+        found = np.empty(0, dtype=np.int64)
+        for flips in self.probes:
+            rows = [found]
+            for (sorted_codes, order), code in zip(self.tables, codes):
+                probe = code ^ flips
+                los, his = np.searchsorted(sorted_codes, probe), np.searchsorted(sorted_codes, probe + 1)
+                rows.extend(order[lo:hi] for lo, hi in zip(los, his))
+            found = np.unique(np.concatenate(rows))
+            if len(found) >= min_candidates:
+                break
+        return found
+
+class SimilarityIndex:
+    """ top-k most similar players over a precomputed, metric-specific embedding """
+
+    def __init__(self, players, features, metric='cosine', weights=None):
+        self.players = players.reset_index(drop=True)
+        self.metric = metric
+        self.embedded = embed(np.nan_to_num(features, nan=0.5), metric, weights)
+        self.lsh = None
+
+    @classmethod
+    def from_rankings(cls, path='data/processed/weighted_iq_rankings.csv', metric='cosine',
+                      shot_profile=False, season=DEFAULT_SEASON):
+        """
+        over the rankings' percentiles, optionally followed by each player's
+        shot zone distribution so players also match on where they shoot from
+        """
+        players, features = load_features(path)
+        weights = None
+        if shot_profile:
+            profiles = load_shot_profiles(players, season)
+            features = np.hstack([features, profiles])
+            weights = np.concatenate([list(WEIGHTS.values()),
+                                      np.full(profiles.shape[1], SHOT_PROFILE_WEIGHT / profiles.shape[1])])
+        return cls(players, features, metric, weights)
+
+    def locate(self, player):
+        """ row of a player by PLAYER_ID or exact name (first match) """
+        if isinstance(player, str):
+            rows = np.flatnonzero(self.players['PLAYER_NAME'].to_numpy() == player)
+        else:
+            rows = np.flatnonzero(self.players['PLAYER_ID'].to_numpy() == int(player))
+        if len(rows) == 0:
+            raise KeyError(f"player {player!r} not in index")
+        return rows[0]
+
+    def build_approximate(self, n_tables=8, n_bits=10, seed=0):
+        self.lsh = RandomProjectionLSH(self.embedded, n_tables, n_bits, seed)
+        return self
+
+    def similarity(self, distances):
+        """ cosine similarity for cosine, else 1 / (1 + distance) """
+        if self.metric == 'cosine':
+            return 1 - distances / 2
+        return 1 / (1 + np.sqrt(distances))
+
+    def query(self, player, k=10, approximate=False):
+        """ the k players most similar to player (fewer only if there aren't k others), excluding the player's own row """
+        row = self.locate(player)
+        query = self.embedded[row]
+        k = min(k, len(self.embedded) - 1)
+
+        if approximate:
+            if self.lsh is None:
+                self.build_approximate()
+            # the player's own row is always a candidate, hence k + 1
+            candidates = self.lsh.candidates(query, (k + 1) * APPROXIMATE_CANDIDATES)
+        else:
+            candidates = np.arange(len(self.embedded))
+        candidates = candidates[candidates != row]
+
+        distances = squared_distances(self.embedded[candidates], query[None, :])
+        nearest = top_k(distances, k)[0]
+
+        result = self.players.iloc[candidates[nearest]].copy()
+        result['similarity'] = np.round(self.similarity(distances[0, nearest]), 4)
+        return result.reset_index(drop=True)
+
+    def distance_blocks(self, block_size=1024):
+        """ (start, stop, squared distances of rows start:stop to every player) """
+        for start in range(0, len(self.embedded), block_size):
+            stop = min(start + block_size, len(self.embedded))
+            yield start, stop, squared_distances(self.embedded, self.embedded[start:stop])
+
+    def all_top_k(self, k=10, block_size=1024):
+        """ (players x k) neighbor rows and distances for every player, in row blocks """
+        n = len(self.embedded)
+        k = min(k, n - 1)
+        neighbors = np.empty((n, k), dtype=np.int64)
+        distances = np.empty((n, k))
+        for start, stop, block in self.distance_blocks(block_size):
+            block[np.arange(stop - start), np.arange(start, stop)] = np.inf
+            nearest = top_k(block, k)
+            neighbors[start:stop] = nearest
+            distances[start:stop] = np.take_along_axis(block, nearest, axis=1)
+        return neighbors, distances
+
+def quantize(similarity, metric, dtype):
+    """ similarity -> (stored values, scale, offset) with similarity = offset + value * scale """
+    if dtype == 'float16':
+        return similarity.astype(np.float16), 1.0, 0.0
+    if dtype != 'uint8':
+        raise ValueError(f"unknown matrix dtype {dtype!r}, expected 'uint8' or 'float16'")
+    # cosine similarity spans [-1, 1], the distance based ones (0, 1]
+    offset = -1.0 if metric == 'cosine' else 0.0
+    scale = (1.0 - offset) / 255
+    codes = np.rint((similarity - offset) / scale)
+    return np.clip(codes, 0, 255).astype(np.uint8), scale, offset
+
+def build_similarity_artifact(rankings_path='data/processed/weighted_iq_rankings.csv',
+                              output_dir='data/processed/similarity', metric='cosine',
+                              k=10, dtype='uint8', block_size=1024, shot_profile=False, season=DEFAULT_SEASON):
+    """
+    precompute the frontend's similarity data: similarity.json holds the
+    player order, top-k neighbor lists and how to decode the matrix;
+    similarity_matrix.bin is the row-major (players x players) matrix, so
+    similarity(i, j) is one array read at i * n + j.
+
+    rows are computed and written a block at a time, so the full float
+    matrix never has to be in memory. season picks the shot charts for
+    shot_profile and should match the rankings
+    """
+    index = SimilarityIndex.from_rankings(rankings_path, metric, shot_profile, season)
+    n = len(index.embedded)
+    if n < 2:
+        raise ValueError(f"{rankings_path} has {n} players, a similarity artifact needs at least 2")
+    k = min(k, n - 1)
+    os.makedirs(output_dir, exist_ok=True)
+
+    matrix = np.memmap(f'{output_dir}/similarity_matrix.bin', mode='w+', dtype=dtype, shape=(n, n))
+    neighbors = np.empty((n, k), dtype=np.int64)
+    neighbor_similarity = np.empty((n, k))
+    for start, stop, block in index.distance_blocks(block_size):
+        similarity = index.similarity(block)
+        matrix[start:stop], scale, offset = quantize(similarity, metric, dtype)
+
+        block[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        nearest = top_k(block, k)
+        neighbors[start:stop] = nearest
+        neighbor_similarity[start:stop] = np.take_along_axis(similarity, nearest, axis=1)
+    matrix.flush()
+    del matrix
+
+    player_ids = index.players['PLAYER_ID'].astype(int).tolist()
+    neighbor_ids = np.asarray(player_ids)[neighbors]
+    manifest = {
+        'metric': metric,
+        'players': player_ids,
+        'matrix': {'file': 'similarity_matrix.bin', 'dtype': dtype, 'shape': [n, n],
+                   'scale': scale, 'offset': offset},
+        'neighbors': {
+            str(player_id): [[int(other), round(float(value), 4)] for other, value in zip(ids, values)]
+            for player_id, ids, values in zip(player_ids, neighbor_ids, neighbor_similarity)
+        }
+    }
+    with open(f'{output_dir}/similarity.json', 'w') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+
+    logger.info(f"saved {metric} similarity for {n} players to {output_dir} "
+                f"({n * n * np.dtype(dtype).itemsize / 1e6:.1f} MB matrix, top {k} neighbors).")
+    return manifest
+
+if __name__ == "__main__":
+    setup_logging()
+    name = sys.argv[1] if len(sys.argv) > 1 else 'Nikola Jokić'
+    for metric in METRICS:
+        index = SimilarityIndex.from_rankings(metric=metric)
+        print(f"\nmost similar to {name} ({metric}):")
+        print(index.query(name, k=10)[['PLAYER_NAME', 'POSITION', 'similarity']].to_string(index=False))
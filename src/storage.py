@@ -0,0 +1,193 @@
+import glob
+import logging
+import os
+import sys
+import time
+import uuid
+
+import pandas as pd
+
+from instrumentation import instrumentation, setup_logging
+from seasons import DEFAULT_SEASON, SeasonPaths
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+STORE_DIR = 'data/store'
+
+logger = logging.getLogger(__name__)
+
+# rows per parquet row group after compaction. files are sorted by PLAYER_ID,
+# so per-player filters can skip most row groups from their statistics alone
+ROW_GROUP_SIZE = 20000
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("the parquet store needs pyarrow (pip install pyarrow)")
+
+def partition_dir(endpoint, season, store_dir=STORE_DIR):
+    return f'{store_dir}/{endpoint}/season={season}'
+
+def has_endpoint(endpoint, season, store_dir=STORE_DIR):
+    return pa is not None and bool(glob.glob(f'{partition_dir(endpoint, season, store_dir)}/*.parquet'))
+
+def write_frame(endpoint, season, df, store_dir=STORE_DIR):
+    """
+    append one fragment to an endpoint's season partition. fragments are
+    named by write time so compaction can tell which copy of a player is newest
+    """
+    require_pyarrow()
+    path = fragment_path(endpoint, season, store_dir)
+    # write then rename so readers never see a half-written fragment
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return path
+
+def write_batches(endpoint, season, schema, batches, store_dir=STORE_DIR):
+    """ append one fragment written a record batch at a time, e.g. straight from an API response """
+    require_pyarrow()
+    path = fragment_path(endpoint, season, store_dir)
+    rows = 0
+    with pq.ParquetWriter(path + '.tmp', schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    os.replace(path + '.tmp', path)
+    instrumentation.count('io.parquet_rows_written', rows)
+    return path
+
+def fragment_path(endpoint, season, store_dir=STORE_DIR):
+    """ a new, uniquely named fragment path in the endpoint's season partition """
+    directory = partition_dir(endpoint, season, store_dir)
+    os.makedirs(directory, exist_ok=True)
+    return f'{directory}/part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet'
+
+def write_player_frame(endpoint, season, player_id, df, store_dir=STORE_DIR):
+    """ append one player's rows, tagged with PLAYER_ID """
+    df = df.copy()
+    df['PLAYER_ID'] = int(player_id)
+    return write_frame(endpoint, season, df, store_dir)
+
+def _dataset(endpoint, season, store_dir):
+    """ dataset over one season partition, with fragment schemas unified (null-only columns etc.) """
+    paths = sorted(glob.glob(f'{partition_dir(endpoint, season, store_dir)}/*.parquet'))
+    if not paths:
+        return None, paths
+    schemas = [pq.read_schema(path) for path in paths]
+    schema = pa.unify_schemas(schemas, promote_options='permissive') if len(schemas) > 1 else schemas[0]
+    return ds.dataset(paths, schema=schema, format='parquet'), paths
+
+def load_endpoint(endpoint, season, player_ids=None, columns=None, store_dir=STORE_DIR):
+    """
+    read an endpoint's season partition as a DataFrame. columns are projected
+    and the player_ids filter is pushed down to the parquet scan
+    """
+    require_pyarrow()
+    dataset, _ = _dataset(endpoint, season, store_dir)
+    if dataset is None:
+        return pd.DataFrame(columns=columns or [])
+
+    if columns is not None:
+        columns = [col for col in columns if col in dataset.schema.names]
+    row_filter = None
+    if player_ids is not None:
+        row_filter = ds.field('PLAYER_ID').isin([int(player_id) for player_id in player_ids])
+
+    table = dataset.to_table(columns=columns, filter=row_filter)
+    instrumentation.count('io.parquet_scans')
+    instrumentation.count('io.parquet_bytes', table.nbytes)
+    return table.to_pandas()
+
+def stored_player_ids(endpoint, season, store_dir=STORE_DIR):
+    """ set of players with rows in the store (only reads the PLAYER_ID column) """
+    if not has_endpoint(endpoint, season, store_dir):
+        return set()
+    return set(load_endpoint(endpoint, season, columns=['PLAYER_ID'], store_dir=store_dir)['PLAYER_ID'].tolist())
+
+def compact_endpoint(endpoint, season, store_dir=STORE_DIR):
+    """
+    merge a season partition's fragments into one file sorted by PLAYER_ID.
+    when a player appears in several fragments only the newest one is kept
+    """
+    require_pyarrow()
+    dataset, paths = _dataset(endpoint, season, store_dir)
+    if dataset is None or len(paths) == 1:
+        return
+
+    tables = []
+    seen = set()
+    # newest fragment first, so refetched players replace their old rows
+    for path in reversed(paths):
+        table = pq.read_table(path, schema=dataset.schema)
+        if 'PLAYER_ID' in table.column_names:
+            ids = table.column('PLAYER_ID').to_pylist()
+            new_ids = set(ids) - seen
+            if not new_ids:
+                continue
+            if len(new_ids) < len(set(ids)):
+                table = table.filter(pa.array([player_id in new_ids for player_id in ids]))
+            seen |= new_ids
+        tables.append(table)
+        if 'PLAYER_ID' not in table.column_names:
+            # league-wide tables are replaced wholesale
+            break
+
+    merged = pa.concat_tables(tables[::-1], promote_options='permissive')
+    if 'PLAYER_ID' in merged.column_names:
+        merged = merged.sort_by([('PLAYER_ID', 'ascending')])
+
+    directory = partition_dir(endpoint, season, store_dir)
+    path = f'{directory}/part-{time.time_ns()}-compacted.parquet'
+    pq.write_table(merged, path + '.tmp', row_group_size=ROW_GROUP_SIZE)
+    os.replace(path + '.tmp', path)
+    for old_path in paths:
+        os.remove(old_path)
+
+def migrate_raw_csvs(season, raw_dir=None, store_dir=STORE_DIR, endpoints=None):
+    """
+    conversion of a season's raw/{player_id}_{endpoint}.csv files into the
+    store, for every endpoint or only the given ones. the written files keep
+    the newest CSV's mtime, so the data doesn't look freshly fetched
+    """
+    require_pyarrow()
+    if raw_dir is None:
+        raw_dir = SeasonPaths(season).raw_dir
+    frames = {}
+    modified = {}
+    for path in sorted(glob.glob(f'{raw_dir}/*.csv')):
+        name = os.path.basename(path)[:-len('.csv')]
+        endpoint = name if name.startswith('league_') else name.split('_', 1)[1]
+        if endpoints is not None and endpoint not in endpoints:
+            continue
+        try:
+            df = pd.read_csv(path)
+        except pd.errors.EmptyDataError:
+            logger.warning(f"skipping empty file {path}")
+            continue
+        modified[endpoint] = max(modified.get(endpoint, 0), os.path.getmtime(path))
+
+        if name.startswith('league_'):
+            write_frame(name, season, df, store_dir)
+            continue
+
+        if df.empty:
+            continue
+        df['PLAYER_ID'] = int(name.split('_', 1)[0])
+        frames.setdefault(endpoint, []).append(df)
+
+    for endpoint, endpoint_frames in frames.items():
+        write_frame(endpoint, season, pd.concat(endpoint_frames, ignore_index=True), store_dir)
+        compact_endpoint(endpoint, season, store_dir)
+        logger.info(f"migrated {len(endpoint_frames)} {endpoint} files.")
+
+    for endpoint, mtime in modified.items():
+        for path in glob.glob(f'{partition_dir(endpoint, season, store_dir)}/*.parquet'):
+            os.utime(path, (mtime, mtime))
+
+if __name__ == "__main__":
+    setup_logging()
+    migrate_raw_csvs(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SEASON)
@@ -0,0 +1,207 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+from calculate_iq_composite import WEIGHTS, metric_percentiles
+from instrumentation import instrumentation, run_report
+from seasons import DEFAULT_SEASON, SeasonPaths
+
+ID_COLUMNS = ['PLAYER_ID', 'PLAYER_NAME', 'TEAM_ID', 'POSITION']
+
+# unscaled composites are rounded to this many decimals before ranking, so
+# players whose weighted sums are mathematically equal tie instead of being
+# ordered by floating point noise from the matrix multiply
+TIE_DECIMALS = 9
+
+def rescale(unscaled):
+    """ each column to the IQ scale (mean 100, sd 15), like the published composite """
+    return (unscaled - unscaled.mean(axis=0)) / unscaled.std(axis=0, ddof=1) * 15 + 100
+
+def rank_columns(scores):
+    """
+    (min ranks, average ranks) of every column, highest score = 1. min ranks
+    match the published rank_weighted_iq; average ranks are what spearman needs
+    """
+    n = scores.shape[0]
+    order = np.argsort(-scores, axis=0, kind='stable')
+    ordered = np.take_along_axis(scores, order, axis=0)
+    positions = np.broadcast_to(np.arange(n)[:, None], scores.shape)
+
+    # first and last sorted position of each run of equal scores
+    new_run = np.ones(scores.shape, dtype=bool)
+    new_run[1:] = ordered[1:] != ordered[:-1]
+    run_start = np.maximum.accumulate(np.where(new_run, positions, 0), axis=0)
+    run_last = np.ones(scores.shape, dtype=bool)
+    run_last[:-1] = new_run[1:]
+    run_end = np.minimum.accumulate(np.where(run_last, positions, n - 1)[::-1], axis=0)[::-1]
+
+    min_ranks = np.empty(scores.shape, dtype=np.int64)
+    average_ranks = np.empty(scores.shape)
+    np.put_along_axis(min_ranks, order, run_start + 1, axis=0)
+    np.put_along_axis(average_ranks, order, (run_start + run_end) / 2 + 1, axis=0)
+    return min_ranks, average_ranks
+
+def spearman(average_ranks, reference):
+    """ spearman correlation of every column of average_ranks with the reference ranks """
+    centered = average_ranks - average_ranks.mean(axis=0)
+    ref = reference - reference.mean()
+    return (ref @ centered) / (np.linalg.norm(ref) * np.linalg.norm(centered, axis=0))
+
+class WeightSweep:
+    """
+    the percentile matrix of one season, computed once, and the composite for
+    any number of weight vectors as one matrix multiply. results are compared
+    against the current WEIGHTS. exact ties share a rank here, where the
+    published rankings can split them on floating point noise
+    """
+
+    def __init__(self, percentiles, base_weights=None):
+        self.columns = list(WEIGHTS)
+        self.metrics = [column[:-len('_percentile')] for column in self.columns]
+        self.players = percentiles[ID_COLUMNS].reset_index(drop=True)
+        self.matrix = percentiles[self.columns].to_numpy(dtype=float)
+
+        self.base_weights = self.weight_matrix(WEIGHTS if base_weights is None else base_weights)[0]
+        scores = self.scores(self.base_weights[None, :])
+        self.base_scores = scores[:, 0]
+        min_ranks, average_ranks = rank_columns(scores)
+        self.base_ranks = min_ranks[:, 0]
+        self.base_average_ranks = average_ranks[:, 0]
+
+    @classmethod
+    def from_season(cls, season=DEFAULT_SEASON, data_dir='data'):
+        paths = SeasonPaths(season, data_dir)
+        return cls(metric_percentiles(pd.read_csv(paths.metrics_csv)))
+
+    def weight_matrix(self, weights):
+        """
+        (vectors x metrics) array from a dict (metric or percentile column ->
+        weight), a DataFrame with those columns, or arrays in self.metrics order
+        """
+        if isinstance(weights, dict):
+            weights = pd.DataFrame([weights])
+        if isinstance(weights, pd.DataFrame):
+            weights = weights.rename(columns=lambda c: c[:-len('_percentile')] if c.endswith('_percentile') else c)
+            unknown = set(weights.columns) - set(self.metrics)
+            if unknown:
+                raise ValueError(f"unknown metrics in weights: {sorted(unknown)}")
+            weights = weights.reindex(columns=self.metrics, fill_value=0.0).to_numpy(dtype=float)
+        weights = np.atleast_2d(np.asarray(weights, dtype=float))
+        if weights.shape[1] != len(self.metrics):
+            raise ValueError(f"expected {len(self.metrics)} weights per vector, got {weights.shape[1]}")
+        return weights
+
+    def scores(self, weights):
+        """ (players x vectors) IQ-scale composites """
+        unscaled = np.round(self.matrix @ self.weight_matrix(weights).T, TIE_DECIMALS)
+        return rescale(unscaled)
+
+    def evaluate(self, weights):
+        """
+        full results for a modest number of weight vectors: per-vector weights
+        and summary, and (players x vectors) scores, ranks and rank changes
+        (positive = moved up against the current weights)
+        """
+        weights = self.weight_matrix(weights)
+        scores = self.scores(weights)
+        min_ranks, average_ranks = rank_columns(scores)
+        changes = self.base_ranks[:, None] - min_ranks
+
+        index = pd.MultiIndex.from_frame(self.players[['PLAYER_ID', 'PLAYER_NAME']])
+        return {
+            'weights': pd.DataFrame(weights, columns=self.metrics),
+            'summary': self.summary(changes, average_ranks),
+            'scores': pd.DataFrame(scores, index=index),
+            'ranks': pd.DataFrame(min_ranks, index=index),
+            'rank_changes': pd.DataFrame(changes, index=index)
+        }
+
+    def summary(self, changes, average_ranks, top_n=25):
+        """ per vector: rank correlation with the current weights and how far players moved """
+        moved = np.abs(changes)
+        in_top = (self.base_ranks <= top_n)[:, None]
+        return pd.DataFrame({
+            'spearman': spearman(average_ranks, self.base_average_ranks),
+            'mean_abs_rank_change': moved.mean(axis=0),
+            'max_abs_rank_change': moved.max(axis=0),
+            f'top{top_n}_kept': ((self.base_ranks[:, None] - changes <= top_n) & in_top).sum(axis=0)
+        })
+
+    def sweep(self, weights, chunk_size=2000):
+        """
+        summary per weight vector plus each player's rank range, for thousands
+        of vectors: evaluated chunk_size vectors at a time, without keeping the
+        (players x vectors) matrices around
+        """
+        weights = self.weight_matrix(weights)
+        summaries = []
+        best = np.full(len(self.players), np.iinfo(np.int64).max)
+        worst = np.zeros(len(self.players), dtype=np.int64)
+        rank_sum = np.zeros(len(self.players))
+
+        for start in range(0, len(weights), chunk_size):
+            with instrumentation.timer('weight_sweep.chunk'):
+                min_ranks, average_ranks = rank_columns(self.scores(weights[start:start + chunk_size]))
+                summaries.append(self.summary(self.base_ranks[:, None] - min_ranks, average_ranks))
+                best = np.minimum(best, min_ranks.min(axis=1))
+                worst = np.maximum(worst, min_ranks.max(axis=1))
+                rank_sum += min_ranks.sum(axis=1)
+
+        summary = pd.concat([pd.DataFrame(weights, columns=self.metrics),
+                             pd.concat(summaries, ignore_index=True)], axis=1)
+        players = self.players.assign(
+            rank=self.base_ranks,
+            best_rank=best,
+            worst_rank=worst,
+            mean_rank=np.round(rank_sum / len(weights), 1),
+            rank_range=worst - best
+        ).sort_values('rank')
+        return summary, players
+
+    def random_weights(self, n, concentration=50, seed=0):
+        """
+        n weight vectors drawn from a dirichlet centered on the current weights
+        (higher concentration = closer to them). unweighted metrics stay at 0
+        """
+        rng = np.random.default_rng(seed)
+        active = self.base_weights > 0
+        total = self.base_weights.sum()
+        weights = np.zeros((n, len(self.metrics)))
+        weights[:, active] = rng.dirichlet(self.base_weights[active] / total * concentration, size=n) * total
+        return weights
+
+    def sensitivity(self, step=0.05):
+        """
+        one metric at a time: its weight raised by step, the rest scaled down so
+        the total is unchanged. one summary row per metric
+        """
+        total = self.base_weights.sum()
+        weights = np.tile(self.base_weights, (len(self.metrics), 1))
+        for i in range(len(self.metrics)):
+            others = total - weights[i, i]
+            if others > 0:
+                weights[i] *= (total - min(weights[i, i] + step, total)) / others
+            weights[i, i] = min(self.base_weights[i] + step, total)
+        return self.evaluate(weights)['summary'].set_index(pd.Index(self.metrics, name='metric'))
+
+if __name__ == "__main__":
+    # python weight_sweep.py [season] [n_vectors]
+    season = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SEASON
+    n_vectors = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+
+    with run_report('weight_sweep'):
+        sweep = WeightSweep.from_season(season)
+
+        print("\n=== sensitivity: +5% weight on one metric ===")
+        print(sweep.sensitivity().round(3).to_string())
+
+        with instrumentation.timer('weight_sweep.random'):
+            summary, players = sweep.sweep(sweep.random_weights(n_vectors))
+        print(f"\n=== {n_vectors} random weight vectors around the current weights ===")
+        print(summary[['spearman', 'mean_abs_rank_change', 'max_abs_rank_change', 'top25_kept']]
+              .describe(percentiles=[0.05, 0.5, 0.95]).round(3).to_string())
+
+        print("\nmost weight-sensitive players in the top 50:")
+        top = players[players['rank'] <= 50].sort_values('rank_range', ascending=False).head(10)
+        print(top[['PLAYER_NAME', 'rank', 'best_rank', 'worst_rank', 'mean_rank']].to_string(index=False))
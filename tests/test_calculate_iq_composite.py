@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from calculate_iq_composite import rank_percentiles
+
+POSITIONS = np.array(['PG', 'SG', 'SF', 'PF', 'C', 'G-F', None], dtype=object)
+
+def naive_percentiles(values, groups=None, invert=False, min_group_size=1):
+    """ the per-row loop rank_percentiles replaced: compare each value against its group's finite values """
+    percentiles = []
+    for i, value in enumerate(values):
+        if groups is None:
+            peers = values
+        elif groups[i] is None:
+            peers = values[:0]
+        else:
+            peers = values[groups == groups[i]]
+        peers = peers[np.isfinite(peers)]
+        if np.isfinite(value) and len(peers) >= min_group_size:
+            percentiles.append(((peers > value) if invert else (peers < value)).mean() * 100)
+        else:
+            percentiles.append(np.nan)
+    return np.array(percentiles)
+
+def random_metric(rng, n):
+    """ values on a coarse grid, so there are plenty of ties, with NaNs and infinities mixed in """
+    values = rng.integers(0, 12, n) / 4
+    values[rng.random(n) < 0.1] = np.nan
+    values[rng.random(n) < 0.02] = np.inf
+    return values
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('invert', [False, True])
+def test_league_percentiles_match_the_loop(seed, invert):
+    values = random_metric(np.random.default_rng(seed), 300)
+    np.testing.assert_array_equal(rank_percentiles(values, invert=invert), naive_percentiles(values, invert=invert))
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('invert', [False, True])
+@pytest.mark.parametrize('min_group_size', [1, 2, 5])
+def test_group_percentiles_match_the_loop(seed, invert, min_group_size):
+    rng = np.random.default_rng(seed)
+    values = random_metric(rng, 300)
+    # a lopsided draw, so some groups are tiny or have no finite values at all
+    groups = rng.choice(POSITIONS, 300, p=[0.3, 0.3, 0.2, 0.15, 0.03, 0.01, 0.01])
+    values[groups == 'G-F'] = np.nan
+
+    np.testing.assert_array_equal(
+        rank_percentiles(values, groups=groups, invert=invert, min_group_size=min_group_size),
+        naive_percentiles(values, groups=groups, invert=invert, min_group_size=min_group_size))
+
+def test_no_finite_values():
+    assert np.isnan(rank_percentiles([np.nan, np.inf])).all()
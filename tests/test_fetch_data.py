@@ -0,0 +1,50 @@
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import fetch_data
+import storage
+from fetch_manifest import FetchManifest
+from seasons import SeasonPaths
+
+SEASON = '2024-25'
+
+def write_raw_csvs(population):
+    """ a csv-mode fetch already on disk: every player and league table """
+    paths = SeasonPaths(SEASON).ensure_dirs()
+    for player_id in population['PLAYER_ID']:
+        for name in fetch_data.endpoint_names():
+            if name.startswith('league_'):
+                continue
+            pd.DataFrame({'PLAYER_ID': [player_id], 'GP': [10], 'FGA': [5.0]}).to_csv(paths.raw_file(name, player_id), index=False)
+    for _, name in fetch_data.LEAGUE_ENDPOINTS.values():
+        pd.DataFrame({'PLAYER_ID': population['PLAYER_ID'], 'GP': 10}).to_csv(paths.raw_file(name), index=False)
+
+@pytest.fixture
+def population(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    population = pd.DataFrame({'PLAYER_ID': [1, 2], 'PLAYER_NAME': ['A', 'B'], 'TEAM_ID': [10, 20], 'GP': [10, 10]})
+    write_raw_csvs(population)
+    return population
+
+@pytest.mark.parametrize('storage_format', ['parquet', 'csv'])
+def test_existing_raw_csvs_are_not_refetched(population, storage_format):
+    manifest = FetchManifest('data/fetch_manifest.sqlite')
+    fetch_data.backfill_manifest(population, manifest, SEASON, storage_format)
+
+    jobs = fetch_data.build_fetch_jobs(population, SEASON, storage_format=storage_format, manifest=manifest,
+                                       ttl=7 * 24 * 60 * 60)
+    assert jobs == []
+
+def test_raw_csvs_are_migrated_into_an_empty_store(population):
+    assert not storage.has_endpoint('shot_data', SEASON)
+    jobs = fetch_data.build_fetch_jobs(population, SEASON, storage_format='parquet')
+    assert len(jobs) == len(fetch_data.PLAYER_ENDPOINTS) * 2 + len(fetch_data.LEAGUE_ENDPOINTS)
+
+    fetch_data.migrate_raw_tables(SEASON)
+    assert fetch_data.build_fetch_jobs(population, SEASON, storage_format='parquet') == []
+    assert set(storage.load_endpoint('shot_data', SEASON)['PLAYER_ID']) == {1, 2}
@@ -0,0 +1,85 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from nba_api.stats.library.http import NBAStatsHTTP
+
+import fetch_data
+import fetch_replay
+import storage
+from retry_policy import RetryPolicy
+from seasons import SeasonPaths
+
+SEASON = '2024-25'
+PLAYERS = [(1, 'A', 10), (2, 'B', 20), (3, 'C', 10)]
+
+# endpoint -> result set names a synthetic response carries
+RESULT_SETS = {
+    'playerdashboardbygeneralsplits': ['LocationPlayerDashboard'],
+    'shotchartdetail': ['Shot_Chart_Detail'],
+    'playerdashptshots': fetch_data.SHOT_TRACKING_NAMES,
+    'playerdashptpass': fetch_data.PASSING_NAMES,
+    'leaguehustlestatsplayer': ['HustleStatsPlayer'],
+    'leaguedashplayerclutch': ['LeagueDashPlayerClutch']
+}
+
+def synthetic_body(endpoint, parameters):
+    if endpoint == 'leaguedashplayerstats':
+        rows = [[player_id, name, team_id, 60, 30.0, 20.0 - player_id] for player_id, name, team_id in PLAYERS]
+        result_sets = [{'name': 'LeagueDashPlayerStats', 'headers': ['PLAYER_ID', 'PLAYER_NAME', 'TEAM_ID', 'GP', 'MIN', 'PTS'],
+                        'rowSet': rows}]
+    else:
+        player_id = parameters.get('PlayerID')
+        rows = [[player_id, 'x', 1.5]] if player_id else [[player_id, 'x', 1.5] for player_id, _, _ in PLAYERS]
+        result_sets = [{'name': name, 'headers': ['PLAYER_ID', 'GROUP_VALUE', 'FGA'], 'rowSet': rows}
+                       for name in RESULT_SETS[endpoint]]
+    return json.dumps({'resultSets': result_sets})
+
+@pytest.fixture
+def fixtures(tmp_path, monkeypatch):
+    """ fixtures recorded from a synthetic API that answers every request """
+    def send_api_request(http, endpoint, parameters, *args, **kwargs):
+        return http.nba_response(response=synthetic_body(endpoint, parameters), status_code=200, url=endpoint)
+
+    fixture_dir = str(tmp_path / 'fixtures')
+    monkeypatch.setattr(NBAStatsHTTP, 'send_api_request', send_api_request)
+    assert fetch_replay.record(SEASON, fixture_dir=fixture_dir, requests_per_second=1000) > 0
+    monkeypatch.undo()
+    return fixture_dir
+
+def test_replay_restores_the_retry_client(tmp_path):
+    original_client, original_send = fetch_data.retry_client, NBAStatsHTTP.send_api_request
+    # no fixtures: the population request gets a 404 and the replay fails
+    with pytest.raises(Exception):
+        fetch_replay.replay(fixture_dir=str(tmp_path))
+    assert fetch_data.retry_client is original_client
+    assert NBAStatsHTTP.send_api_request is original_send
+
+@pytest.mark.parametrize('storage_format', ['parquet', 'csv'])
+def test_throttled_replay_completes(fixtures, tmp_path, monkeypatch, storage_format):
+    work_dir = tmp_path / 'work'
+    summary = fetch_replay.replay(SEASON, fixture_dir=fixtures, requests_per_second=1000, storage_format=storage_format,
+                                  retry_policy=RetryPolicy(base_delay=0.0), work_dir=str(work_dir),
+                                  reset_timeout=0.01, throttle_rate=0.3, seed=1)
+
+    jobs = len(fetch_data.PLAYER_ENDPOINTS) * len(PLAYERS) + len(fetch_data.LEAGUE_ENDPOINTS)
+    assert (summary['players'], summary['jobs_ok'], summary['jobs_failed']) == (len(PLAYERS), jobs, 0)
+    assert summary['replayer']['throttled'] > 0
+    assert summary['endpoints']['population']['ok'] == 1
+
+    monkeypatch.chdir(work_dir)
+    paths = SeasonPaths(SEASON)
+    assert list(pd.read_csv(paths.players_csv)['PLAYER_ID']) == [1, 2, 3]
+    for name in fetch_data.endpoint_names():
+        if storage_format == 'parquet':
+            assert set(storage.load_endpoint(name, SEASON)['PLAYER_ID']) == {1, 2, 3}
+        elif name.startswith('league_'):
+            assert os.path.exists(paths.raw_file(name))
+        else:
+            assert all(os.path.exists(paths.raw_file(name, player_id)) for player_id, _, _ in PLAYERS)
+    if storage_format == 'parquet':
+        assert not os.path.exists(paths.raw_dir) or not os.listdir(paths.raw_dir)
@@ -0,0 +1,75 @@
+import pytest
+
+from fetch_scheduler import TokenBucket
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def bucket(clock, **kwargs):
+    return TokenBucket(clock=clock, sleep=clock.sleep, **kwargs)
+
+def test_burst_is_spent_before_waiting():
+    clock = FakeClock()
+    limiter = bucket(clock, rate=2.0, burst=3)
+
+    for _ in range(3):
+        limiter.acquire()
+    assert clock.sleeps == []
+
+    limiter.acquire()
+    assert clock.now == pytest.approx(0.5)
+
+def test_tokens_refill_up_to_the_burst():
+    clock = FakeClock()
+    limiter = bucket(clock, rate=1.0, burst=2)
+    limiter.acquire()
+    limiter.acquire()
+
+    # an idle minute is still only worth burst tokens
+    clock.now += 60.0
+    for _ in range(2):
+        limiter.acquire()
+    assert clock.sleeps == []
+    limiter.acquire()
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+def test_penalize_halves_the_rate_down_to_min_rate():
+    clock = FakeClock()
+    limiter = bucket(clock, rate=1.0, min_rate=0.1)
+
+    rates = []
+    for _ in range(5):
+        limiter.penalize()
+        rates.append(limiter.rate)
+    assert rates == pytest.approx([0.5, 0.25, 0.125, 0.1, 0.1])
+
+    limiter.acquire()
+    limiter.acquire()
+    assert clock.sleeps == [pytest.approx(10.0)]
+
+def test_reward_adds_a_tenth_of_the_rate_up_to_the_cap():
+    clock = FakeClock()
+    limiter = bucket(clock, rate=4.0, min_rate=0.1)
+    limiter.penalize()
+    limiter.penalize()
+    assert limiter.rate == pytest.approx(1.0)
+
+    rates = []
+    for _ in range(8):
+        limiter.reward()
+        rates.append(limiter.rate)
+    assert rates == pytest.approx([1.4, 1.8, 2.2, 2.6, 3.0, 3.4, 3.8, 4.0])
+
+def test_min_rate_never_exceeds_the_rate():
+    limiter = bucket(FakeClock(), rate=0.02, min_rate=0.05)
+    limiter.penalize()
+    assert limiter.rate == pytest.approx(0.02)
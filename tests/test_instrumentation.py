@@ -0,0 +1,21 @@
+import json
+
+from instrumentation import Instrumentation, run_report
+
+def test_reports_in_the_same_second_get_their_own_files(tmp_path, monkeypatch):
+    # every report written at the same instant
+    monkeypatch.setattr('instrumentation.time.time', lambda: 1_700_000_000.25)
+    instrumentation = Instrumentation()
+    instrumentation.count('rows', 3)
+
+    paths = [instrumentation.write_report('fetch', str(tmp_path)) for _ in range(3)]
+    assert len(set(paths)) == 3
+    assert all(json.load(open(path))['counters'] == {'rows': 3} for path in paths)
+    assert '-250-' in paths[0]
+
+def test_run_report_writes_one_report_per_stage(tmp_path):
+    for stage in ('metrics', 'metrics', 'composite'):
+        with run_report(stage, report_dir=str(tmp_path)) as instrumentation:
+            instrumentation.count(f'{stage}.runs')
+    assert len(list(tmp_path.glob('metrics-*.json'))) == 2
+    assert len(list(tmp_path.glob('composite-*.json'))) == 1
@@ -0,0 +1,80 @@
+import itertools
+import pickle
+
+import numpy as np
+import pytest
+
+import metric_cache
+from instrumentation import instrumentation
+from metric_cache import MetricCache, cache_key, function_version
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # a clock that always moves forward, so last_used orders every touch
+    ticks = itertools.count(1)
+    monkeypatch.setattr(metric_cache.time, 'time', lambda: float(next(ticks)))
+    instrumentation.reset()
+    cache = MetricCache(str(tmp_path / 'cache' / 'metric_cache.sqlite'))
+    yield cache
+    cache.close()
+
+def test_hits_and_misses(cache):
+    value = np.float64(0.1) + np.float64(0.2)
+    cache.put_many({'a': value, 'b': None})
+
+    found = cache.get_many(['a', 'b', 'c'])
+    assert found == {'a': value, 'b': None}
+    assert type(found['a']) is np.float64
+    assert instrumentation.counters['cache.hits'] == 2
+    assert instrumentation.counters['cache.misses'] == 1
+
+def test_entries_survive_reopening(cache, tmp_path):
+    cache.put_many({'a': 1.5})
+    cache.close()
+    reopened = MetricCache(cache.path)
+    assert reopened.get_many(['a']) == {'a': 1.5}
+    reopened.close()
+
+def version_one(x):
+    return x + 1
+
+def version_two(x):
+    return x + 2
+
+def test_key_changes_with_code_version_and_inputs(cache):
+    version = function_version(version_one)
+    assert version == function_version(version_one)
+    assert version != function_version(version_two)
+
+    cache.put_many({cache_key('efg_pct', version, 'inputs'): 0.5})
+    assert cache.get_many([cache_key('efg_pct', version, 'inputs')]) == {cache_key('efg_pct', version, 'inputs'): 0.5}
+    # an edited calculator, changed inputs or another metric all miss
+    assert cache.get_many([cache_key('efg_pct', function_version(version_two), 'inputs'),
+                           cache_key('efg_pct', version, 'other inputs'),
+                           cache_key('age', version, 'inputs')]) == {}
+
+def test_least_recently_used_entries_are_evicted(cache):
+    entry_size = len(pickle.dumps(b'x' * 100, protocol=pickle.HIGHEST_PROTOCOL))
+    cache.max_bytes = 3 * entry_size
+    cache.put_many({'a': b'x' * 100})
+    cache.put_many({'b': b'x' * 100})
+    cache.put_many({'c': b'x' * 100})
+    assert cache.size() == 3 * entry_size
+
+    # touching a makes b the least recently used
+    cache.get_many(['a'])
+    cache.put_many({'d': b'x' * 100})
+    assert set(cache.get_many(['a', 'b', 'c', 'd'])) == {'a', 'c', 'd'}
+    assert cache.size() <= cache.max_bytes
+    assert instrumentation.counters['cache.evictions'] == 1
+
+def test_evicts_down_to_max_bytes(cache):
+    cache.max_bytes = 1000
+    cache.put_many({str(i): b'x' * 300 for i in range(10)})
+    assert cache.size() <= 1000
+    assert len(cache.get_many([str(i) for i in range(10)])) == 3
+
+def test_clear(cache):
+    cache.put_many({'a': 1})
+    cache.clear()
+    assert cache.get_many(['a']) == {} and cache.size() == 0
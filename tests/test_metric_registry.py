@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+from calculate_iq_composite import SUM_ORDER, WEIGHTS
+from metric_registry import METRICS, PLUGIN_ENV
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+PLUGIN = '''
+from metric_registry import register
+
+@register('steal_rate', 'Steal Rate', ['basic_stats'], weight=0.05)
+def steal_rate(wide):
+    return wide['STL']
+'''
+
+# run in a fresh interpreter, since plugins load when the registry is first imported
+CHECK = '''
+import json
+import pandas as pd
+from calculate_iq_composite import SUM_ORDER, WEIGHTS, metric_percentiles
+from metric_registry import METRICS
+
+iq_metrics = pd.DataFrame({'PLAYER_ID': [1, 2, 3, 4], 'PLAYER_NAME': list('ABCD'), 'TEAM_ID': 1,
+                           'POSITION': ['PG', 'PG', 'C', 'C'], 'GP': 60, 'MIN': 30.0})
+for name in METRICS:
+    iq_metrics[name] = [1.0, 2.0, 3.0, 4.0]
+print(json.dumps({'metrics': list(METRICS), 'weights': list(WEIGHTS), 'sum_order': SUM_ORDER,
+                  'steal_rate': metric_percentiles(iq_metrics)['steal_rate_percentile'].tolist()}))
+'''
+
+def test_built_ins_are_summed_in_the_pinned_order():
+    assert set(METRICS) == set(SUM_ORDER)
+    assert list(WEIGHTS) == [f'{name}_percentile' for name in SUM_ORDER]
+    assert round(sum(WEIGHTS.values()), 10) == 1.0
+
+def test_plugin_metrics_register_after_the_built_ins(tmp_path):
+    (tmp_path / 'iq_plugin.py').write_text(textwrap.dedent(PLUGIN))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([SRC_DIR, str(tmp_path)]), **{PLUGIN_ENV: 'iq_plugin'})
+    result = subprocess.run([sys.executable, '-c', CHECK], env=env, cwd=tmp_path, capture_output=True, text=True, check=True)
+    registered = json.loads(result.stdout)
+
+    assert registered['metrics'][-1] == 'steal_rate'
+    assert registered['sum_order'] == SUM_ORDER
+    assert registered['weights'] == [f'{name}_percentile' for name in SUM_ORDER] + ['steal_rate_percentile']
+    assert registered['steal_rate'] == [0.0, 25.0, 50.0, 75.0]
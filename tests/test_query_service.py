@@ -0,0 +1,147 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculate_iq_composite import WEIGHTS
+from export_frontend import METRIC_FORMATS
+from query_service import QueryService
+from seasons import SeasonPaths
+
+SEASON = '2024-25'
+NAMES = ['Nikola Jokić', 'Tyrese Haliburton', 'Jimmy Butler III', 'Anthony Davis', 'Jalen Brunson', 'Josh Hart']
+POSITIONS = ['C', 'PG', 'SF', 'PF', 'PG', 'SG']
+TEAMS = [(1610612743, 'DEN'), (1610612754, 'IND'), (1610612744, 'GSW'), (1610612742, 'DAL'),
+         (1610612752, 'NYK'), (1610612752, 'NYK')]
+
+def write_run(paths, seed=0):
+    """ a small pipeline run: rankings, raw metrics and the player list """
+    rng = np.random.default_rng(seed)
+    n = len(NAMES)
+    players = pd.DataFrame({'PLAYER_ID': np.arange(1, n + 1), 'PLAYER_NAME': NAMES,
+                            'TEAM_ID': [team_id for team_id, _ in TEAMS], 'POSITION': POSITIONS,
+                            'GP': 60, 'MIN': 30.0})
+    rankings = players.copy()
+    for column in WEIGHTS:
+        rankings[column] = rng.integers(0, 1000, n) / 10
+    rankings['composite_weighted_iq'] = np.arange(n)[::-1] + 100.0
+    rankings['rank_weighted_iq'] = np.arange(1, n + 1)
+    metrics = players.copy()
+    for metric in METRIC_FORMATS:
+        metrics[metric] = rng.random(n)
+
+    paths.ensure_dirs()
+    rankings.sample(frac=1, random_state=seed).to_csv(paths.rankings_csv, index=False)
+    metrics.to_csv(paths.metrics_csv, index=False)
+    pd.DataFrame({'TEAM_ID': [team_id for team_id, _ in TEAMS],
+                  'TEAM_ABBREVIATION': [abbreviation for _, abbreviation in TEAMS]}).to_csv(paths.players_csv, index=False)
+    return rankings
+
+@pytest.fixture
+def service(tmp_path):
+    write_run(SeasonPaths(SEASON, str(tmp_path)))
+    return QueryService(SEASON, data_dir=str(tmp_path))
+
+def get(service, target):
+    status, body = service.respond(target)
+    return status, json.loads(body)
+
+def test_players(service):
+    status, players = get(service, '/players')
+    assert status == 200
+    assert [player['name'] for player in players] == NAMES
+
+    assert get(service, '/players?n=2')[1] == players[:2]
+    assert [player['name'] for player in get(service, '/players?team=nyk')[1]] == ['Jalen Brunson', 'Josh Hart']
+    assert [player['name'] for player in get(service, '/players?position=G')[1]] == ['Tyrese Haliburton', 'Jalen Brunson', 'Josh Hart']
+
+def test_player_lookup(service):
+    status, player = get(service, '/players/1')
+    assert status == 200 and player['name'] == 'Nikola Jokić' and player['id'] == 1
+    # names are accent, case and suffix insensitive
+    assert get(service, '/players/nikola%20jokic')[1] == player
+    assert get(service, '/players/Jimmy%20Butler')[1]['id'] == 3
+
+def test_top(service):
+    status, top = get(service, '/top?n=3')
+    assert status == 200 and [player['rank'] for player in top] == [1, 2, 3]
+
+    status, top = get(service, '/top?metric=efg_pct')
+    efg = [player['metrics']['efg_pct']['percentile'] for player in top]
+    assert status == 200 and efg == sorted(efg, reverse=True)
+
+def test_similar(service):
+    status, similar = get(service, '/similar/1?k=3')
+    assert status == 200 and len(similar) == 3
+    assert 1 not in [player['id'] for player in similar]
+    assert all(-1 <= player['similarity'] <= 1 for player in similar)
+
+@pytest.mark.parametrize('target, status', [
+    ('/players/999', 404),
+    ('/players/nobody', 404),
+    ('/players/²', 404),
+    ('/similar/²', 404),
+    ('/players?team=²', 404),
+    ('/players?team=XYZ', 404),
+    ('/top?metric=nope', 404),
+    ('/nowhere', 404),
+    ('/top?n=ten', 400),
+    ('/similar/1?metric=manhattan', 400),
+])
+def test_bad_requests(service, target, status):
+    answered, body = get(service, target)
+    assert answered == status and 'error' in body
+
+def test_unexpected_errors_answer_500(service, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(service.dataset, 'top', broken)
+    assert get(service, '/top') == (500, {'error': 'internal error'})
+    # errors aren't cached
+    monkeypatch.undo()
+    assert get(service, '/top')[0] == 200
+
+def test_responses_are_cached(service):
+    first = service.respond('/top?n=3')
+    assert service.respond('/top?n=3') is first
+    assert (service.cache.hits, service.cache.misses) == (1, 1)
+
+    # errors are answered fresh
+    service.respond('/players/999')
+    service.respond('/players/999')
+    assert (service.cache.hits, service.cache.misses) == (1, 3)
+
+def test_health_bypasses_the_cache(service):
+    service.respond('/top')
+    service.respond('/top')
+    status, health = get(service, '/health')
+    assert status == 200 and health['players'] == len(NAMES)
+    assert health['cache'] == {'entries': 1, 'hits': 1, 'misses': 1}
+
+    service.respond('/top')
+    # a cached /health would still report one hit
+    assert get(service, '/health')[1]['cache']['hits'] == 2
+    assert len(service.cache.entries) == 1
+
+def test_reload_invalidates_the_cache(service, tmp_path):
+    before = get(service, '/players/1')[1]
+    paths = SeasonPaths(SEASON, str(tmp_path))
+    rankings = write_run(paths, seed=1)
+    # make sure the new run is seen as changed whatever the filesystem's mtime resolution
+    for path in (paths.rankings_csv, paths.metrics_csv):
+        os.utime(path, (os.path.getmtime(path) + 10, os.path.getmtime(path) + 10))
+
+    # the first poll only notices the change, the second loads it once the files have settled
+    assert not service.check_reload()
+    assert get(service, '/players/1')[1] == before
+    assert service.check_reload()
+    assert len(service.cache.entries) == 0
+
+    after = get(service, '/players/1')[1]
+    expected = rankings.set_index('PLAYER_ID').loc[1, 'efg_pct_percentile']
+    assert after['metrics']['efg_pct']['percentile'] == expected
+    assert after != before
+    assert get(service, '/health')[1]['reloads'] == 1
@@ -0,0 +1,134 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from retry_policy import CircuitBreaker, HTTPStatusError, RetryClient, RetryError, RetryPolicy, is_retryable
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def client_with_clock(clock, **kwargs):
+    client = RetryClient(policy=RetryPolicy(max_retries=3, base_delay=0.0), sleep=clock.sleep, **kwargs)
+    client.breakers['shots'] = CircuitBreaker(client.failure_threshold, client.reset_timeout, clock=clock)
+    return client
+
+def test_open_breaker_waits_instead_of_failing():
+    clock = FakeClock()
+    client = client_with_clock(clock, failure_threshold=1, reset_timeout=60.0)
+    client.breakers['shots'].record_failure()
+
+    assert client.call('shots', lambda: 'ok', key=1) == 'ok'
+    assert clock.now == pytest.approx(60.0)
+    outcomes = [record.outcome for record in client.attempts]
+    assert outcomes == ['short-circuited', 'ok']
+
+def test_breaker_waits_do_not_use_up_retries():
+    clock = FakeClock()
+    client = client_with_clock(clock, failure_threshold=1, reset_timeout=5.0)
+    calls = []
+
+    def flaky():
+        calls.append(clock.now)
+        if len(calls) < 3:
+            raise HTTPStatusError(500)
+        return 'ok'
+
+    assert client.call('shots', flaky) == 'ok'
+    assert len(calls) == 3
+
+def test_programming_errors_fail_fast():
+    clock = FakeClock()
+    client = client_with_clock(clock, failure_threshold=1)
+
+    def broken():
+        raise KeyError('PLAYER_ID')
+
+    with pytest.raises(RetryError) as raised:
+        client.call('shots', broken)
+    assert raised.value.attempts == 1
+    assert client.breakers['shots'].allow()
+
+@pytest.mark.parametrize('error, retryable', [
+    (HTTPStatusError(429), True),
+    (HTTPStatusError(503), True),
+    (HTTPStatusError(400), False),
+    (TimeoutError(), True),
+    (TypeError(), False),
+    (KeyError('x'), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+def test_half_open_breaker_lets_one_trial_through():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)
+    breaker.record_failure()
+    clock.sleep(10.0)
+    barrier = threading.Barrier(8)
+    allowed = []
+
+    def caller():
+        barrier.wait()
+        allowed.append(breaker.allow())
+
+    threads = [threading.Thread(target=caller) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(allowed) == [False] * 7 + [True]
+
+    # the failed trial re-opens the breaker, and the next half-open lets one more through
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    clock.sleep(10.0)
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+def test_concurrent_calls_wait_for_the_trial():
+    client = RetryClient(policy=RetryPolicy(max_retries=3, base_delay=0.0))
+    client.breakers['shots'] = CircuitBreaker(failure_threshold=1, reset_timeout=0.05, trial_poll=0.01)
+    client.breakers['shots'].record_failure()
+    time.sleep(0.05)
+    lock = threading.Lock()
+    entered = []
+    during_trial = []
+
+    def fetch():
+        with lock:
+            entered.append(threading.get_ident())
+            trial = len(entered) == 1
+        if trial:
+            time.sleep(0.1)
+            during_trial.append(len(entered))
+        return 'ok'
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(lambda key: client.call('shots', fetch, key=key), range(6)))
+    assert results == ['ok'] * 6
+    assert during_trial == [1]
+
+def test_failed_trial_reopens_the_breaker_on_any_error():
+    clock = FakeClock()
+    client = client_with_clock(clock, failure_threshold=1, reset_timeout=5.0)
+    breaker = client.breakers['shots']
+    breaker.record_failure()
+    clock.sleep(5.0)
+
+    def bad_request():
+        raise HTTPStatusError(400)
+
+    with pytest.raises(RetryError):
+        client.call('shots', bad_request)
+    assert breaker.state == 'open'
+    assert breaker.trial_in_flight is None
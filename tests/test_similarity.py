@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from similarity import METRICS, PERCENTILE_COLUMNS, SimilarityIndex, build_similarity_artifact
+
+def make_index(n, metric, seed=0):
+    rng = np.random.default_rng(seed)
+    players = pd.DataFrame({'PLAYER_ID': np.arange(1, n + 1), 'PLAYER_NAME': [f'player {i}' for i in range(n)]})
+    return SimilarityIndex(players, rng.random((n, len(PERCENTILE_COLUMNS))), metric)
+
+@pytest.mark.parametrize('metric', METRICS)
+@pytest.mark.parametrize('n, k', [(300, 10), (300, 1), (300, 50), (12, 20), (2, 10)])
+def test_approximate_query_returns_k_neighbors(metric, n, k):
+    index = make_index(n, metric)
+    for player_id in index.players['PLAYER_ID'][:25]:
+        result = index.query(player_id, k, approximate=True)
+        assert len(result) == min(k, n - 1)
+        assert player_id not in set(result['PLAYER_ID'])
+
+def test_approximate_query_mostly_matches_exact():
+    index = make_index(300, 'cosine')
+    recall = [len(set(index.query(player_id, 10, approximate=True)['PLAYER_ID'])
+                  & set(index.query(player_id, 10)['PLAYER_ID'])) / 10
+              for player_id in index.players['PLAYER_ID']]
+    assert np.mean(recall) > 0.8
+
+def write_rankings(path, n, seed=0):
+    rng = np.random.default_rng(seed)
+    rankings = pd.DataFrame({'PLAYER_ID': np.arange(1, n + 1), 'PLAYER_NAME': [f'player {i}' for i in range(n)]})
+    for column in PERCENTILE_COLUMNS:
+        rankings[column] = rng.integers(0, 1000, n) / 10
+    rankings.to_csv(path, index=False)
+
+@pytest.mark.parametrize('n', [0, 1])
+def test_artifact_needs_two_players(tmp_path, n):
+    write_rankings(tmp_path / 'rankings.csv', n)
+    with pytest.raises(ValueError, match='at least 2'):
+        build_similarity_artifact(str(tmp_path / 'rankings.csv'), str(tmp_path / 'similarity'))
+    assert not (tmp_path / 'similarity').exists()
+
+@pytest.mark.parametrize('dtype', ['uint8', 'float16'])
+def test_artifact_for_two_players(tmp_path, dtype):
+    write_rankings(tmp_path / 'rankings.csv', 2)
+    manifest = build_similarity_artifact(str(tmp_path / 'rankings.csv'), str(tmp_path / 'similarity'), dtype=dtype)
+    assert manifest['matrix']['shape'] == [2, 2]
+    assert [ids[0][0] for ids in manifest['neighbors'].values()] == [2, 1]